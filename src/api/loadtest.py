@@ -0,0 +1,377 @@
+"""
+==============================================================
+🏋️ Module : loadtest.py — Tests de charge des APIs
+==============================================================
+
+Rejoue un fichier de requêtes enregistrées (JSONL) contre l'API de
+prédiction ou d'entraînement, soit en processus via l'application
+ASGI (httpx.ASGITransport), soit contre un uvicorn local.
+
+Format d'une ligne du fichier de requêtes :
+    {"name": "predict_row", "method": "POST", "path": "/predict",
+     "params": {"row_id": 12}, "auth": true}
+Champs optionnels : "json", "headers". Avec "auth": true, un jeton
+obtenu une seule fois via /login est ajouté à la requête.
+
+Deux modes de charge :
+  • boucle fermée : `--concurrency` clients enchaînent les requêtes
+  • boucle ouverte : `--rate` requêtes/s (régulières ou `--poisson`),
+    au plus `--concurrency` en vol ; la latence est alors mesurée
+    depuis l'instant d'arrivée prévu (attente incluse)
+
+Le rapport JSON contient le débit, les latences p50/p95/p99 globales
+et par requête nommée, et les codes HTTP. `compare` confronte deux
+rapports et sort en erreur au-delà du seuil de régression.
+
+🔁 Exemples :
+-------------
+$ python -m src.api.loadtest generate --n 500 --output reports/loadtest/predict.jsonl
+$ python -m src.api.loadtest run reports/loadtest/predict.jsonl --app src.api.predict_api:prediction \\
+      --concurrency 8 --requests 2000 --output reports/loadtest/after.json
+$ python -m src.api.loadtest run reports/loadtest/predict.jsonl --url http://localhost:8000 --rate 50
+$ python -m src.api.loadtest compare reports/loadtest/before.json reports/loadtest/after.json
+==============================================================
+"""
+
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import sys
+import time
+from contextlib import AsyncExitStack
+from datetime import UTC, datetime
+
+import httpx
+import numpy as np
+
+
+DEFAULT_CREDENTIALS = "user:rakuten_project"
+PERCENTILES = (50, 95, 99)
+
+
+def load_requests(path: str) -> list[dict]:
+    with open(path, encoding="utf-8") as f:
+        requests = [json.loads(line) for line in f if line.strip()]
+    for request in requests:
+        request.setdefault("method", "GET")
+        request.setdefault("name", f"{request['method']} {request['path']}")
+    if not requests:
+        raise ValueError(f"Aucune requête dans {path}")
+    return requests
+
+
+def load_app(spec: str):
+    """Importe une application ASGI décrite par `module:attribut`."""
+    module_name, _, attribute = spec.partition(":")
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+def latency_summary(latencies_s) -> dict:
+    latencies_ms = np.asarray(latencies_s, dtype=float) * 1000
+    if not len(latencies_ms):
+        return {"count": 0}
+    summary = {f"p{p}": float(np.percentile(latencies_ms, p)) for p in PERCENTILES}
+    summary.update(
+        count=int(len(latencies_ms)),
+        mean=float(latencies_ms.mean()),
+        max=float(latencies_ms.max()),
+    )
+    return summary
+
+
+class LoadTest:
+    """Rejoue des requêtes à concurrence et débit d'arrivée donnés, puis construit le rapport."""
+
+    def __init__(
+        self,
+        requests: list[dict],
+        client: httpx.AsyncClient,
+        concurrency: int = 8,
+        rate: float | None = None,
+        poisson: bool = False,
+        credentials: str = DEFAULT_CREDENTIALS,
+        seed: int = 0,
+    ) -> None:
+        self.requests = requests
+        self.client = client
+        self.concurrency = concurrency
+        self.rate = rate
+        self.poisson = poisson
+        self.credentials = credentials
+        self.rng = np.random.default_rng(seed)
+        self.token = None
+        self.results = []
+
+    async def login(self) -> None:
+        response = await self.client.post(
+            "/login", headers={"Authorization": f"Bearer {self.credentials}"}
+        )
+        response.raise_for_status()
+        self.token = response.json()["token"]
+
+    async def wait_ready(self, path: str = "/health", timeout: float = 300) -> None:
+        """Attend que `path` réponde 200 (404 : l'application n'a pas de sonde)."""
+        deadline = time.monotonic() + timeout
+        while True:
+            response = await self.client.get(path)
+            if response.status_code in (200, 404):
+                return
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"{path} ne répond pas 200 après {timeout}s")
+            await asyncio.sleep(0.5)
+
+    async def _send(self, request: dict, scheduled: float) -> None:
+        headers = dict(request.get("headers", {}))
+        if request.get("auth"):
+            headers["Authorization"] = f"Bearer {self.token}"
+        status = None
+        try:
+            response = await self.client.request(
+                request["method"],
+                request["path"],
+                params=request.get("params"),
+                json=request.get("json"),
+                headers=headers,
+            )
+            status = response.status_code
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        self.results.append((request["name"], status, time.perf_counter() - scheduled))
+
+    async def _closed_loop(self, n_requests: int) -> None:
+        counter = iter(range(n_requests))
+
+        async def client_loop():
+            for i in counter:
+                await self._send(self.requests[i % len(self.requests)], time.perf_counter())
+
+        await asyncio.gather(*(client_loop() for _ in range(self.concurrency)))
+
+    async def _open_loop(self, n_requests: int) -> None:
+        if self.poisson:
+            gaps = self.rng.exponential(1 / self.rate, n_requests)
+        else:
+            gaps = np.full(n_requests, 1 / self.rate)
+        arrivals = np.cumsum(gaps) - gaps[0]
+        slots = asyncio.Semaphore(self.concurrency)
+        start = time.perf_counter()
+
+        async def fire(i):
+            scheduled = start + arrivals[i]
+            await asyncio.sleep(max(0.0, scheduled - time.perf_counter()))
+            async with slots:
+                await self._send(self.requests[i % len(self.requests)], scheduled)
+
+        await asyncio.gather(*(fire(i) for i in range(n_requests)))
+
+    async def run(self, n_requests: int) -> dict:
+        if any(request.get("auth") for request in self.requests):
+            await self.login()
+        self.results = []
+        start = time.perf_counter()
+        if self.rate:
+            await self._open_loop(n_requests)
+        else:
+            await self._closed_loop(n_requests)
+        return self.report(time.perf_counter() - start)
+
+    def report(self, duration_s: float) -> dict:
+        ok = [r for r in self.results if isinstance(r[1], int) and r[1] < 400]
+        status_codes = {}
+        for _, status, _ in self.results:
+            status_codes[str(status)] = status_codes.get(str(status), 0) + 1
+        by_name = {}
+        for name, _, latency in ok:
+            by_name.setdefault(name, []).append(latency)
+        return {
+            "meta": {
+                "started_at": datetime.now(UTC).isoformat(timespec="seconds"),
+                "concurrency": self.concurrency,
+                "rate": self.rate,
+                "poisson": self.poisson,
+                "distinct_requests": len(self.requests),
+            },
+            "requests": len(self.results),
+            "ok": len(ok),
+            "error_rate": 1 - len(ok) / len(self.results) if self.results else 0.0,
+            "duration_s": duration_s,
+            "throughput_rps": len(ok) / duration_s if duration_s else 0.0,
+            "latency_ms": latency_summary([latency for _, _, latency in ok]),
+            "by_name": {name: latency_summary(values) for name, values in by_name.items()},
+            "status_codes": status_codes,
+        }
+
+
+async def run_load_test(
+    requests_path: str,
+    app: str | None = None,
+    url: str | None = None,
+    n_requests: int = 1000,
+    concurrency: int = 8,
+    rate: float | None = None,
+    poisson: bool = False,
+    health_path: str = "/health",
+    timeout: float = 60,
+) -> dict:
+    """Exécute un test de charge en processus (`app`) ou contre un serveur (`url`)."""
+    requests = load_requests(requests_path)
+    async with AsyncExitStack() as stack:
+        if app is not None:
+            asgi_app = load_app(app)
+            # ASGITransport ne déclenche pas le lifespan : chargement du modèle, catalogue...
+            await stack.enter_async_context(asgi_app.router.lifespan_context(asgi_app))
+            transport = httpx.ASGITransport(app=asgi_app)
+            base_url, target = "http://loadtest", app
+        else:
+            transport, base_url, target = None, url, url
+        client = await stack.enter_async_context(
+            httpx.AsyncClient(transport=transport, base_url=base_url, timeout=timeout)
+        )
+        load_test = LoadTest(requests, client, concurrency, rate, poisson)
+        await load_test.wait_ready(health_path)
+        report = await load_test.run(n_requests)
+    report["meta"].update(target=target, requests_file=os.path.basename(requests_path))
+    return report
+
+
+def compare_reports(baseline: dict, candidate: dict, max_regression: float = 0.10) -> dict:
+    """Compare deux rapports ; une régression dépasse `max_regression` (relatif)."""
+    rows = []
+    metrics = [("throughput_rps", baseline["throughput_rps"], candidate["throughput_rps"], True)]
+    for p in PERCENTILES:
+        key = f"p{p}"
+        metrics.append(
+            (
+                f"latency_{key}_ms",
+                baseline["latency_ms"].get(key),
+                candidate["latency_ms"].get(key),
+                False,
+            )
+        )
+    regressions = []
+    for name, before, after, higher_is_better in metrics:
+        if before is None or after is None:
+            continue
+        change = (after - before) / before if before else 0.0
+        regressed = -change > max_regression if higher_is_better else change > max_regression
+        rows.append({"metric": name, "baseline": before, "candidate": after, "change": change})
+        if regressed:
+            regressions.append(name)
+    if candidate["error_rate"] > baseline["error_rate"] + 0.01:
+        regressions.append("error_rate")
+    rows.append(
+        {
+            "metric": "error_rate",
+            "baseline": baseline["error_rate"],
+            "candidate": candidate["error_rate"],
+            "change": candidate["error_rate"] - baseline["error_rate"],
+        }
+    )
+    return {"rows": rows, "regressions": regressions, "max_regression": max_regression}
+
+
+def generate_requests(n: int, output: str, seed: int = 0) -> str:
+    """Écrit `n` requêtes /predict portant sur des produits tirés du catalogue de test."""
+    from src.predict.catalog import get_catalog
+
+    catalog = get_catalog().load()
+    rng = np.random.RandomState(seed)
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        for _ in range(n):
+            row = catalog.sample(rng)
+            request = {
+                "name": "predict_product",
+                "method": "POST",
+                "path": "/predict",
+                "params": {"productid": row["productid"]},
+                "auth": True,
+            }
+            f.write(json.dumps(request) + "\n")
+    print(f"💾 {n} requêtes écrites dans {output}")
+    return output
+
+
+def print_report(report: dict) -> None:
+    latency = report["latency_ms"]
+    print(
+        f"📊 {report['ok']}/{report['requests']} requêtes OK en {report['duration_s']:.2f}s | "
+        f"{report['throughput_rps']:.1f} req/s | "
+        + " | ".join(f"p{p} {latency.get(f'p{p}', float('nan')):.1f} ms" for p in PERCENTILES)
+    )
+    print("   Codes HTTP :", report["status_codes"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tests de charge des APIs Rakuten.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="Rejoue un fichier de requêtes")
+    run.add_argument("requests_file")
+    target = run.add_mutually_exclusive_group(required=True)
+    target.add_argument(
+        "--app", help="Application ASGI en processus, ex. src.api.predict_api:prediction"
+    )
+    target.add_argument("--url", help="Serveur déjà lancé, ex. http://localhost:8000")
+    run.add_argument("--requests", type=int, default=1000)
+    run.add_argument("--concurrency", type=int, default=8)
+    run.add_argument("--rate", type=float, default=None, help="Requêtes/s (boucle ouverte)")
+    run.add_argument("--poisson", action="store_true", help="Arrivées poissonniennes")
+    run.add_argument("--health-path", default="/health")
+    run.add_argument("--timeout", type=float, default=60)
+    run.add_argument("--output", default=None)
+
+    compare = commands.add_parser("compare", help="Compare deux rapports")
+    compare.add_argument("baseline")
+    compare.add_argument("candidate")
+    compare.add_argument("--max-regression", type=float, default=0.10)
+
+    generate = commands.add_parser("generate", help="Génère des requêtes /predict")
+    generate.add_argument("--n", type=int, default=500)
+    generate.add_argument("--output", default=os.path.join("reports", "loadtest", "predict.jsonl"))
+    generate.add_argument("--seed", type=int, default=0)
+
+    args = parser.parse_args()
+    if args.command == "generate":
+        generate_requests(args.n, args.output, args.seed)
+    elif args.command == "run":
+        report = asyncio.run(
+            run_load_test(
+                args.requests_file,
+                app=args.app,
+                url=args.url,
+                n_requests=args.requests,
+                concurrency=args.concurrency,
+                rate=args.rate,
+                poisson=args.poisson,
+                health_path=args.health_path,
+                timeout=args.timeout,
+            )
+        )
+        print_report(report)
+        if args.output:
+            os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+            with open(args.output, "w") as f:
+                json.dump(report, f, indent=2)
+            print("💾 Rapport :", args.output)
+    else:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.candidate) as f:
+            candidate = json.load(f)
+        comparison = compare_reports(baseline, candidate, args.max_regression)
+        for row in comparison["rows"]:
+            print(
+                f"{row['metric']:<20} {row['baseline']:>10.3f} → {row['candidate']:>10.3f} "
+                f"({row['change']:+.1%})"
+            )
+        if comparison["regressions"]:
+            print("❌ Régressions :", ", ".join(comparison["regressions"]))
+            sys.exit(1)
+        print("✅ Pas de régression")
+
+
+if __name__ == "__main__":
+    main()
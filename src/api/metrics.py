@@ -0,0 +1,147 @@
+"""
+==============================================================
+📈 Module : metrics.py — Métriques Prometheus des APIs
+==============================================================
+
+Métriques exposées sur `/metrics` (format texte Prometheus) par
+l'API de prédiction et l'API d'entraînement :
+
+  • rakuten_stage_seconds{stage}            → histogramme par étape du pipeline
+                                              (jwt, catalog, clean_text, image_normalize,
+                                              tfidf, image_embedding, fusion_build,
+                                              booster_predict, clean_data, preprocess_data, ...)
+  • rakuten_request_seconds{endpoint,status} → durée totale des requêtes
+  • rakuten_requests_in_flight{endpoint}   → requêtes en cours
+  • rakuten_batch_size{component}          → taille des lots (micro-batcher, runtime)
+  • rakuten_model_info{model_version,...}  → version du modèle servi (valeur 1)
+
+L'enregistrement se limite à deux `perf_counter()` et un `observe()`
+sur un histogramme à seaux fixes : rien n'est agrégé ni formaté tant
+que personne ne lit `/metrics`.
+
+En mode "process" (voir src/predict/workers.py), les étapes s'exécutent
+dans les workers : `collect_stages()` y relève leurs durées, renvoyées
+à l'API qui les enregistre avec `observe_stages()`.
+==============================================================
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from starlette.requests import Request
+from starlette.responses import Response
+
+
+# Seaux de 0.5 ms à 60 s : couvre le TF-IDF d'une ligne comme un entraînement complet
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60,
+)  # fmt: skip
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+
+STAGE_SECONDS = Histogram(
+    "rakuten_stage_seconds",
+    "Durée de chaque étape du pipeline",
+    ["stage"],
+    buckets=LATENCY_BUCKETS,
+)
+REQUEST_SECONDS = Histogram(
+    "rakuten_request_seconds",
+    "Durée totale des requêtes HTTP",
+    ["endpoint", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+IN_FLIGHT = Gauge("rakuten_requests_in_flight", "Requêtes HTTP en cours", ["endpoint"])
+BATCH_SIZE = Histogram(
+    "rakuten_batch_size", "Nombre de documents par lot", ["component"], buckets=BATCH_BUCKETS
+)
+MODEL_INFO = Gauge(
+    "rakuten_model_info",
+    "Modèle servi (valeur 1)",
+    ["model_version", "backbone", "image_size", "image_backend"],
+)
+TRAININGS = Counter("rakuten_trainings", "Entraînements lancés par l'API", ["status"])
+
+_trace = threading.local()
+
+
+@contextmanager
+def stage(name: str):
+    """Chronomètre une étape du pipeline : `with stage("tfidf"): ...`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.labels(name).observe(elapsed)
+        timings = getattr(_trace, "timings", None)
+        if timings is not None:
+            timings[name] = timings.get(name, 0.0) + elapsed
+
+
+@contextmanager
+def collect_stages():
+    """Relève aussi les durées des étapes du thread courant dans un dict (workers du pool)."""
+    _trace.timings = {}
+    try:
+        yield _trace.timings
+    finally:
+        _trace.timings = None
+
+
+def observe_stages(timings: dict) -> None:
+    """Enregistre des durées d'étapes mesurées dans un autre processus."""
+    for name, elapsed in timings.items():
+        STAGE_SECONDS.labels(name).observe(elapsed)
+
+
+def observe_batch(component: str, size: int) -> None:
+    BATCH_SIZE.labels(component).observe(size)
+
+
+_model_labels = None
+
+
+def set_model_info(model_version: str, feature_config: dict, image_backend: str) -> None:
+    """Publie la version du modèle servi ; l'ancienne série est retirée."""
+    global _model_labels
+    labels = (
+        model_version,
+        str(feature_config["backbone"]),
+        str(feature_config["image_size"]),
+        image_backend,
+    )
+    if labels == _model_labels:
+        return
+    if _model_labels is not None:
+        MODEL_INFO.remove(*_model_labels)
+    MODEL_INFO.labels(*labels).set(1)
+    _model_labels = labels
+
+
+def metrics_response() -> Response:
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+def instrument(app, router, ignored=("/metrics",)) -> None:
+    """Ajoute à `app` le suivi des requêtes en cours et de leur durée, par route de `router`."""
+    known_paths = {route.path for route in router.routes}
+
+    @app.middleware("http")
+    async def track_requests(request: Request, call_next):
+        path = request.url.path
+        if path in ignored:
+            return await call_next(request)
+        # Chemins inconnus regroupés : la cardinalité des labels reste bornée
+        endpoint = path if path in known_paths else "other"
+        status = 500
+        start = time.perf_counter()
+        IN_FLIGHT.labels(endpoint).inc()
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            IN_FLIGHT.labels(endpoint).dec()
+            REQUEST_SECONDS.labels(endpoint, str(status)).observe(time.perf_counter() - start)
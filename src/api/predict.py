@@ -7,11 +7,13 @@
 ----------------
 Ce script charge le modèle XGBoost et l’encodeur entraînés
 puis effectue une prédiction sur une ligne aléatoire du jeu
-de validation (data/processed/X_val.npz).
+de validation (data/processed/X_val/, memory-mappé : seule la
+ligne choisie est lue).
 
 📦 Entrées :
 ------------
-- data/processed/X_val.npz             → Données sparse de validation
+- data/processed/X_val/                → Features de validation (texte + image)
+                                         (converti depuis X_val.npz s'il est absent)
 - data/models/xgb_fusion.json          → Modèle XGBoost entraîné
 - data/models/label_encoder.joblib     → Encodeur des labels
 
@@ -36,10 +38,15 @@ Ce script peut être utilisé :
 
 
 import os
-import numpy as np
+
 import joblib
+import numpy as np
 import xgboost as xgb
-from scipy import sparse
+
+from src.features.feature_matrix import FeatureMatrix, convert_npz, split_dir
+from src.features.hashed_text import text_columns
+from src.predict.fusion import fuse_features
+
 
 # === Dictionnaire des catégories ===
 cat_map = {
@@ -74,24 +81,29 @@ cat_map = {
 
 
 def predict_one():
-    """Prédit une seule ligne aléatoire de X_val.npz"""
+    """Prédit une seule ligne aléatoire des features de validation"""
     print("📦 Chargement des artefacts...")
 
     base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
-    X_path = os.path.join(base_dir, "data/processed/X_val.npz")
+    data_dir = os.path.join(base_dir, "data/processed")
     model_path = os.path.join(base_dir, "data/models/xgb_fusion.json")
     encoder_path = os.path.join(base_dir, "data/models/label_encoder.joblib")
 
     # Chargement du modèle et des données
-    X = sparse.load_npz(X_path)
+    X_dir = split_dir(data_dir, "val")
+    if os.path.exists(os.path.join(X_dir, "meta.json")):
+        X = FeatureMatrix(X_dir)
+    else:
+        tfidf = joblib.load(os.path.join(data_dir, "tfidf_vectorizer.joblib"))
+        X = convert_npz(os.path.join(data_dir, "X_val.npz"), X_dir, text_columns(tfidf))
     bst = xgb.Booster()
     bst.load_model(model_path)
     encoder = joblib.load(encoder_path)
     print("✅ Modèles et données chargés.")
 
     # Sélection aléatoire d'une ligne
-    row_index = np.random.randint(0, X.shape[0])
-    x_row = X.getrow(row_index)
+    row_index = np.random.randint(0, len(X))
+    x_row = fuse_features(*X.row(row_index))
     dtest = xgb.DMatrix(x_row)
 
     # Prédiction
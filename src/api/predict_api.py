@@ -1,20 +1,30 @@
 import base64
+import io
+import threading
+import time
+from contextlib import asynccontextmanager
 
-import jwt
 from fastapi import APIRouter, FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import JSONResponse
-import pandas as pd
-
 from PIL import Image
-import os
 
-from src.predict.predict import predict
 from src.api.login import login_api
-
-
-BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
-RAW_DIR = os.path.join(BASE_DIR, "data", "raw")
-IMG_DIR = os.path.join(RAW_DIR, "images", "images")
+from src.api.metrics import instrument, metrics_response, set_model_info, stage
+from src.data.clean_data import clean_text
+from src.features.build_features import load_feature_config
+from src.predict.batcher import get_batcher
+from src.predict.catalog import get_catalog
+from src.predict.predict import describe_prediction, predict_code
+from src.predict.result_cache import get_prediction_cache, prediction_key
+from src.predict.runtime import (
+    IMAGE_BACKEND,
+    MODEL_DIR,
+    MODEL_REFRESH_S,
+    get_runtime,
+    model_version,
+)
+from src.predict.workers import PREDICT_MODE, PoolBroken, PoolSaturated, get_pool
 
 
 class rakuten_predict_api:
@@ -26,13 +36,126 @@ class rakuten_predict_api:
         login_method = login_api()
         self.router = APIRouter()
         self.router.add_api_route("/", self.verify, methods=["POST"])
+        self.router.add_api_route("/health", self.health, methods=["GET"])
+        self.router.add_api_route("/metrics", self.metrics, methods=["GET"])
         self.router.add_api_route("/login", login_method.login, methods=["POST"])
         self.router.add_api_route("/predict", self.prediction, methods=["POST"])
 
     def verify(self):
         return JSONResponse(status_code=200, content={"detail": "L'API est bien fonctionnelle."})
 
-    def prediction(self, request: Request):
+    def backend(self):
+        # Mode "process" : pool de workers (workers.py), sinon runtime résident du processus
+        return get_pool() if PREDICT_MODE == "process" else get_runtime()
+
+    def load_runtime(self):
+        # Chargement + chauffe en arrière-plan : /health répond 503 tant que le modèle n'est pas prêt
+        threading.Thread(target=self._load_runtime, name="runtime-loader", daemon=True).start()
+
+    def _load_runtime(self):
+        try:
+            # Index du CSV de test construit une seule fois (voir src/predict/catalog.py)
+            get_catalog().load()
+            if PREDICT_MODE == "process":
+                get_pool().start()
+            else:
+                get_runtime().load()
+        except Exception as e:
+            print(f"❌ Échec du chargement du runtime : {e}")
+            return
+        self.watch_model()
+
+    def watch_model(self):
+        # Recherche périodique d'un redéploiement : seule source de la version des clés du cache
+        while MODEL_REFRESH_S > 0:
+            time.sleep(MODEL_REFRESH_S)
+            try:
+                self.backend().refresh()
+            except Exception as e:
+                print(f"⚠️ Recherche d'un nouveau modèle impossible : {e}")
+
+    def ready(self):
+        return get_catalog().ready and self.backend().ready
+
+    def health(self):
+        backend = self.backend()
+        catalog = get_catalog()
+        if self.ready():
+            content = {
+                "detail": "Le modèle est prêt.",
+                "mode": PREDICT_MODE,
+                "catalog": catalog.stats(),
+                "prediction_cache": get_prediction_cache().stats(),
+            }
+            if PREDICT_MODE != "process":
+                content["embedding_cache"] = backend.preprocessor.embedding_cache.stats()
+            return JSONResponse(status_code=200, content=content)
+        detail = "Le modèle est en cours de chargement."
+        if catalog.error:
+            detail = f"Le chargement du catalogue a échoué : {catalog.error}"
+        elif backend.error:
+            detail = f"Le chargement du modèle a échoué : {backend.error}"
+        return JSONResponse(status_code=503, content={"detail": detail})
+
+    def metrics(self):
+        # Version du modèle évaluée seulement au moment du scrape
+        runtime = get_runtime()
+        if PREDICT_MODE != "process" and runtime.ready:
+            set_model_info(runtime.model_version, runtime.feature_config, IMAGE_BACKEND)
+        else:
+            set_model_info(model_version(), load_feature_config(MODEL_DIR), IMAGE_BACKEND)
+        return metrics_response()
+
+    def select_row(self, productid=None, row_id=None):
+        # Recherche O(1) dans le catalogue indexé ; tirage aléatoire sans identifiant
+        catalog = get_catalog()
+        if productid is not None:
+            return catalog.by_product(productid)
+        if row_id is not None:
+            return catalog.by_row(row_id)
+        return catalog.sample()
+
+    @staticmethod
+    def read_image(image_path):
+        with stage("image_read"), open(image_path, "rb") as f:
+            return f.read()
+
+    @staticmethod
+    def clean_texts(designation, description):
+        with stage("clean_text"):
+            return clean_text(designation), clean_text(description)
+
+    async def run_prediction(self, designation, description, image_path):
+        # Lecture disque hors de la boucle d'événements
+        image_bytes = await run_in_threadpool(self.read_image, image_path)
+        # Cache des prédictions complètes ; version du modèle chargé (runtime ou workers),
+        # sans stat des artefacts à chaque requête
+        cache = get_prediction_cache()
+        key = prediction_key(designation, description, image_bytes, self.backend().model_version)
+
+        if PREDICT_MODE == "process":
+            # Requête compacte vers le pool : texte nettoyé + octets bruts de l'image
+            async def submit():
+                texts = await run_in_threadpool(self.clean_texts, designation, description)
+                return await get_pool().predict(*texts, image_bytes)
+
+            prdtypecode = await cache.aget_or_compute(key, submit)
+        else:
+            prdtypecode = await run_in_threadpool(
+                cache.get_or_compute,
+                key,
+                lambda: predict_code(
+                    designation,
+                    description,
+                    Image.open(io.BytesIO(image_bytes)),
+                    batcher=get_batcher(),
+                ),
+            )
+        return describe_prediction(prdtypecode)
+
+    async def prediction(
+        self, request: Request, productid: int | None = None, row_id: int | None = None
+    ):
         try:
             login_method = login_api()
             auth = request.headers.get("Authorization")
@@ -44,26 +167,34 @@ class rakuten_predict_api:
             if not token.startswith("ey"):
                 token = base64.b64decode(token).decode("utf-8")
             if token:
-                login_method.verify_jwt_token(token)
-                X_test = pd.read_csv(os.path.join(RAW_DIR, "X_test_update.csv"))
-                row = X_test.sample(n=1)
-                print(row)
-                image_filename = (
-                    "image_"
-                    + str(row["imageid"].values[0])
-                    + "_product_"
-                    + str(row["productid"].values[0])
-                    + ".jpg"
-                )
-                image_path = os.path.join(IMG_DIR, "image_test", image_filename)
-                print(image_path)
-                if os.path.exists(image_path):
-                    img = Image.open(image_path)
-                    result = predict(
-                        row["designation"].values[0], row["description"].values[0], img
+                with stage("jwt"):
+                    login_method.verify_jwt_token(token)
+                if not self.ready():
+                    return JSONResponse(
+                        status_code=503, content={"detail": "Le modèle est en cours de chargement."}
                     )
-                    result["designation"] = row["designation"].values[0]
-                    result["description"] = row["description"].values[0]
+                with stage("catalog"):
+                    row = self.select_row(productid, row_id)
+                if row is None:
+                    return JSONResponse(status_code=404, content={"detail": "Produit introuvable"})
+                designation, description = row["designation"], row["description"]
+                if row["image_path"] is not None:
+                    try:
+                        result = await self.run_prediction(
+                            designation, description, row["image_path"]
+                        )
+                    except PoolSaturated:
+                        return JSONResponse(
+                            status_code=503, content={"detail": "Le serveur est surchargé"}
+                        )
+                    except PoolBroken:
+                        return JSONResponse(
+                            status_code=503,
+                            content={"detail": "Le modèle redémarre, réessayez plus tard"},
+                        )
+                    result["productid"] = row["productid"]
+                    result["designation"] = designation
+                    result["description"] = description
                     return JSONResponse(
                         status_code=200, content={"detail": "La connexion a réussi", "data": result}
                     )
@@ -75,6 +206,15 @@ class rakuten_predict_api:
             raise HTTPException(status_code=400, detail="La prédiction a échoué") from None
 
 
-prediction = FastAPI(title="Rakuten")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    rakuten.load_runtime()
+    yield
+    if PREDICT_MODE == "process":
+        get_pool().shutdown()
+
+
+prediction = FastAPI(title="Rakuten", lifespan=lifespan)
 rakuten = rakuten_predict_api()
 prediction.include_router(rakuten.router)
+instrument(prediction, rakuten.router)
@@ -1,14 +1,11 @@
 import base64
-from datetime import datetime, timedelta
-from python_on_whales import DockerClient
 
-import jwt
 from fastapi import APIRouter, FastAPI, HTTPException, Request
 from fastapi.responses import JSONResponse
-import pandas as pd
 
-from src.train.train import train
 from src.api.login import login_api
+from src.api.metrics import TRAININGS, instrument, metrics_response, stage
+from src.train.train import train
 
 
 class rakuten_train_api:
@@ -23,11 +20,12 @@ class rakuten_train_api:
         self.router.add_api_route("/", self.verify, methods=["POST"])
         self.router.add_api_route("/login", login_method.login, methods=["POST"])
         self.router.add_api_route("/train", self.train, methods=["POST"])
+        self.router.add_api_route("/metrics", metrics_response, methods=["GET"])
 
     def verify(self):
         return JSONResponse(status_code=200, content={"detail": "L'API est bien fonctionnelle."})
 
-    def train(self, request: Request):
+    def train(self, request: Request, full_rebuild: bool = False):
         try:
             login_method = login_api()
             auth = request.headers.get("Authorization")
@@ -39,8 +37,14 @@ class rakuten_train_api:
             if not token.startswith("ey"):
                 token = base64.b64decode(token).decode("utf-8")
             if token:
-                login_method.verify_jwt_token(token)
-                result = train()
+                with stage("jwt"):
+                    login_method.verify_jwt_token(token)
+                try:
+                    result = train(full_rebuild=full_rebuild)
+                except Exception:
+                    TRAININGS.labels("failed").inc()
+                    raise
+                TRAININGS.labels("done").inc()
                 return JSONResponse(
                     status_code=200, content={"detail": "La connexion a réussi", "data": result}
                 )
@@ -53,3 +57,4 @@ class rakuten_train_api:
 entrainement = FastAPI(title="Rakuten")
 rakuten = rakuten_train_api()
 entrainement.include_router(rakuten.router)
+instrument(entrainement, rakuten.router)
@@ -1,50 +1,255 @@
-import html
+import hashlib
 import io
+import itertools
 import math
+import multiprocessing
 import os
-import re
-import warnings
+import struct
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 
+import numpy as np
 import pandas as pd
-from bs4 import BeautifulSoup, MarkupResemblesLocatorWarning
 from PIL import Image
+from pymongo import ReplaceOne
 from tqdm.auto import tqdm
 
+from src.data.clean_text import clean_text, clean_text_series
+from src.data.image_manifest import get_image_manifest
+from src.mongodb.bulk_writer import BulkMongoWriter, estimate_size
 from src.mongodb.conf_loader import MongoConfLoader
 from src.mongodb.utils import MongoUtils
 
 
-warnings.filterwarnings("ignore", category=MarkupResemblesLocatorWarning)
-
 IMAGE_SIZE = (224, 224)
+# Représentation des images nettoyées : "jpeg" (historique) ou "raw" (pixels uint8 HWC)
+IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", "jpeg")
+IMAGE_FORMATS = ("jpeg", "raw")
+# En-tête des blobs "raw" : marqueur, hauteur, largeur (uint16), puis les pixels RGB
+RAW_IMAGE_MAGIC = b"RAW1"
+RAW_HEADER = struct.Struct("<4sHH")
+# Décodage JPEG à taille réduite (mise à l'échelle DCT de libjpeg) ; "0" décode en pleine résolution
+JPEG_DRAFT = os.getenv("JPEG_DRAFT", "1") == "1"
+# Nettoyage parallèle : nombre de processus et nombre de lignes par bloc
+CLEAN_WORKERS = int(os.getenv("CLEAN_WORKERS", "1"))
+CLEAN_CHUNK_SIZE = int(os.getenv("CLEAN_CHUNK_SIZE", "256"))
+# Ingestion incrémentale : watermark et configuration du dernier nettoyage, par collection
+INGESTION_STATE = "ingestion_state"
+INGEST_FULL_REBUILD = os.getenv("INGEST_FULL_REBUILD", "0") == "1"
 
 
-def clean_text(text):
-    if not isinstance(text, str):
-        return ""
-    text = BeautifulSoup(text, "html.parser").get_text(" ")
-    text = html.unescape(text)
-    text = re.sub(r"[^A-Za-zÀ-ÖØ-öø-ÿ0-9\s]", " ", text)
-    text = re.sub(r"\s+", " ", text).strip().lower()
-    return text
+def normalize_image(image, image_format="jpeg", draft=JPEG_DRAFT):
+    """
+    Redimensionne l'image en IMAGE_SIZE.
 
+    "jpeg" : octets JPEG (décodés à nouveau avant l'embedding).
+    "raw"  : tableau uint8 (H, W, 3), passé tel quel à l'embedder.
 
-def clean_one_row(designation, description, image):
-    designation = clean_text(designation)
-    description = clean_text(description)
-    img_byte_arr = io.BytesIO()
+    Avec `draft`, une source JPEG pas encore décodée l'est directement à
+    l'échelle 1/2, 1/4 ou 1/8 la plus petite qui reste au-dessus d'IMAGE_SIZE ;
+    sans effet sur une image déjà décodée ou d'un autre format.
+    """
+    if draft:
+        image.draft("RGB", IMAGE_SIZE)
     image = image.convert("RGB").resize(IMAGE_SIZE)
+    if image_format == "raw":
+        return np.asarray(image)
+    img_byte_arr = io.BytesIO()
     image.save(img_byte_arr, format="JPEG")
-    img_bytes = img_byte_arr.getvalue()
+    return img_byte_arr.getvalue()
+
+
+def encode_raw_image(array: np.ndarray) -> bytes:
+    """Blob stockable (MongoDB) d'une image uint8 (H, W, 3) : en-tête de 8 octets + pixels."""
+    height, width, _ = array.shape
+    return RAW_HEADER.pack(RAW_IMAGE_MAGIC, height, width) + np.ascontiguousarray(array).tobytes()
+
+
+def is_raw_image(image_binary) -> bool:
+    return isinstance(image_binary, bytes) and image_binary[:4] == RAW_IMAGE_MAGIC
+
+
+def decode_raw_image(image_binary: bytes) -> np.ndarray:
+    """Vue (H, W, 3) en lecture seule sur les pixels du blob, sans copie."""
+    _, height, width = RAW_HEADER.unpack_from(image_binary)
+    return np.frombuffer(image_binary, dtype=np.uint8, offset=RAW_HEADER.size).reshape(
+        height, width, 3
+    )
+
 
-    doc = {"designation": designation, "description": description, "image_binary": img_bytes}
+def clean_image(image, image_format=IMAGE_FORMAT) -> dict:
+    """Champs image d'un document nettoyé."""
+    # Taille d'origine lue dans l'en-tête, avant que le décodage réduit ne la modifie
+    width, height = image.size
+    if image_format == "raw":
+        img_bytes = encode_raw_image(normalize_image(image, "raw"))
+    else:
+        img_bytes = normalize_image(image)
+    return {"image_binary": img_bytes, "image_width": width, "image_height": height}
+
+
+def clean_one_row(designation, description, image, image_format=IMAGE_FORMAT):
+    doc = {"designation": clean_text(designation), "description": clean_text(description)}
+    doc.update(clean_image(image, image_format))
     return doc
 
 
+def prepare_rows(X, images_dir, y=None):
+    """
+    Lignes à nettoyer `(id, designation, description, image_path[, prdtypecode])`
+    et noms des images absentes. Les images sont résolues par le manifeste du
+    dossier (voir src/data/image_manifest.py) : un doublon octet pour octet pointe
+    vers le fichier canonique de son contenu. Le manifeste est remis à jour à
+    chaque appel : une ingestion voit les images ajoutées depuis la précédente.
+    """
+    filenames = (
+        "image_" + X["imageid"].astype(str) + "_product_" + X["productid"].astype(str) + ".jpg"
+    )
+    manifest = get_image_manifest(images_dir).refresh()
+    image_paths = filenames.map(manifest.canonical_path)
+    found = image_paths.notna().to_numpy()
+    rows = pd.DataFrame(
+        {
+            "id": X["id"],
+            "designation": X["designation"],
+            "description": X["description"],
+            "image_path": image_paths,
+        }
+    )
+    if y is not None:
+        rows["prdtypecode"] = y.loc[X.index, "prdtypecode"].to_numpy()
+    return list(rows[found].itertuples(index=False, name=None)), filenames[~found].tolist()
+
+
+def clean_chunk(rows, image_format=IMAGE_FORMAT):
+    """Nettoie un bloc de lignes produites par `prepare_rows` (exécuté dans un worker)."""
+    # Textes du bloc nettoyés d'un coup (valeurs distinctes seulement, voir clean_text.py)
+    designations = clean_text_series([row[1] for row in rows])
+    descriptions = clean_text_series([row[2] for row in rows])
+    docs = []
+    # Doublons résolus vers le même fichier canonique : une image nettoyée par contenu
+    images = {}
+    for i, row in enumerate(rows):
+        row_id, image_path = row[0], row[3]
+        doc = {"designation": designations.iat[i], "description": descriptions.iat[i]}
+        if image_path not in images:
+            with Image.open(image_path) as img:
+                images[image_path] = clean_image(img, image_format)
+        doc.update(images[image_path])
+        doc["id"] = int(row_id)
+        if len(row) > 4:
+            doc["prdtypecode"] = int(row[4])
+        docs.append(doc)
+    return docs
+
+
+def clean_chunks(tasks, image_format=IMAGE_FORMAT, workers=CLEAN_WORKERS):
+    """
+    Nettoie des blocs `(clé, lignes)` et les restitue dans l'ordre de `tasks` :
+    le résultat ne dépend pas du nombre de processus.
+    """
+    if workers <= 1:
+        for key, rows in tasks:
+            yield key, clean_chunk(rows, image_format)
+        return
+    executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+    try:
+        pending = deque()
+        for key, rows in tasks:
+            pending.append((key, executor.submit(clean_chunk, rows, image_format)))
+            # Au plus deux blocs d'avance par processus : la mémoire reste bornée
+            if len(pending) >= 2 * workers:
+                key, future = pending.popleft()
+                yield key, future.result()
+        while pending:
+            key, future = pending.popleft()
+            yield key, future.result()
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+
+def chunk_tasks(splits, chunk_size=CLEAN_CHUNK_SIZE):
+    """Découpe chaque split en blocs et les alterne : train et test sont nettoyés ensemble."""
+    per_split = [
+        [(name, rows[start : start + chunk_size]) for start in range(0, len(rows), chunk_size)]
+        for name, rows in splits.items()
+    ]
+    return [
+        task for group in itertools.zip_longest(*per_split) for task in group if task is not None
+    ]
+
+
+def source_hash(row, manifest) -> str:
+    """
+    Empreinte d'une ligne source : textes, label et fichier image (chemin, taille, date).
+    Taille et date viennent du manifeste du dossier, sans appel système par ligne.
+    """
+    fields = (*row[1:], *manifest.stat(os.path.basename(row[3])))
+    payload = "\x1f".join(str(field) for field in fields).encode("utf-8", "surrogatepass")
+    return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+
+def plan_ingestion(collection, state, rows, config, manifest, full_rebuild=False) -> dict:
+    """
+    Prépare l'ingestion incrémentale d'une collection nettoyée.
+
+    Une ligne est (re)nettoyée si elle est absente, si son empreinte a changé ou si
+    son `id` dépasse le watermark du dernier run terminé. Les documents qui ne font
+    plus partie de la sélection sont à supprimer. Une configuration de nettoyage
+    différente (format d'image, décodage réduit) impose une reconstruction complète.
+    """
+    previous = state.find_one({"_id": collection.name})
+    if previous is not None and previous.get("config") != config:
+        print(f"⚠️ {collection.name} : configuration de nettoyage modifiée, reconstruction complète")
+        full_rebuild = True
+    if full_rebuild:
+        print(f"purge de {collection.name}...")
+        collection.delete_many({})
+        previous = None
+    collection.create_index("id", unique=True)
+    watermark = previous["watermark"] if previous is not None else None
+
+    existing = {
+        doc["id"]: doc.get("source_hash")
+        for doc in collection.find({}, {"_id": 0, "id": 1, "source_hash": 1})
+    }
+    plan = {"rows": [], "hashes": {}, "new": 0, "changed": 0, "unchanged": 0}
+    for row in rows:
+        row_id, digest = int(row[0]), source_hash(row, manifest)
+        if row_id not in existing:
+            plan["new"] += 1
+        elif existing[row_id] != digest or watermark is None or row_id > watermark:
+            plan["changed"] += 1
+        else:
+            plan["unchanged"] += 1
+            continue
+        plan["rows"].append(row)
+        plan["hashes"][row_id] = digest
+    selected = {int(row[0]) for row in rows}
+    plan["stale"] = [row_id for row_id in existing if row_id not in selected]
+    plan["watermark"] = max(selected, default=watermark)
+    return plan
+
+
 def clean_data(
-    input_dir="/app/data/raw", images_dir="/app/data/raw/images/images", nbre_lignes=1000
+    input_dir="/app/data/raw",
+    images_dir="/app/data/raw/images/images",
+    nbre_lignes=1000,
+    image_format=IMAGE_FORMAT,
+    workers=CLEAN_WORKERS,
+    chunk_size=CLEAN_CHUNK_SIZE,
+    full_rebuild=INGEST_FULL_REBUILD,
 ):
+    """
+    Nettoie les lignes sélectionnées et les ingère dans X_train_cleaned / X_test_cleaned.
+
+    L'ingestion est incrémentale (voir `plan_ingestion`) : seules les lignes nouvelles
+    ou modifiées sont nettoyées et écrites (upsert sur `id`). `full_rebuild` purge
+    les collections et repart de zéro.
+    """
+    if image_format not in IMAGE_FORMATS:
+        raise ValueError(f"Format d'image inconnu : {image_format} (attendu : {IMAGE_FORMATS})")
     # Chargement des fichiers CSV
     print("Chargement des fichiers CSV...")
     X_train = pd.read_csv(os.path.join(input_dir, "X_train_update.csv"))
@@ -64,50 +269,78 @@ def clean_data(
     with MongoUtils(conf_loader=conf_loader, host=mongo_host) as mongo:
         X_train_cleaned = mongo.db["X_train_cleaned"]
         X_test_cleaned = mongo.db["X_test_cleaned"]
+        state = mongo.db[INGESTION_STATE]
 
-        print("purge des collections existantes...")
-        X_train_cleaned.delete_many({})
-        X_test_cleaned.delete_many({})
-
-        # Nettoyage et insertion des données d'entraînement
         nbre_lignes = len(X_train) if nbre_lignes is None else nbre_lignes
-        for index, row in tqdm(
-            X_train.head(nbre_lignes).iterrows(),
-            desc="Nettoyage et insertion X_train",
-            total=len(X_train.head(nbre_lignes)),
-        ):
-            image_filename = (
-                "image_" + str(row["imageid"]) + "_product_" + str(row["productid"]) + ".jpg"
+        train_images = os.path.join(images_dir, "image_train")
+        test_images = os.path.join(images_dir, "image_test")
+        train_rows, missing_train = prepare_rows(X_train.head(nbre_lignes), train_images, y_train)
+        test_rows, missing_test = prepare_rows(X_test.head(nbre_lignes), test_images)
+        for image_filename in missing_train + missing_test:
+            print(f"Image non trouvée : {image_filename}")
+
+        # Seules les lignes nouvelles ou modifiées depuis le dernier run sont nettoyées
+        config = {"image_format": image_format, "jpeg_draft": JPEG_DRAFT}
+        collections = {"train": X_train_cleaned, "test": X_test_cleaned}
+        plans = {
+            "train": plan_ingestion(
+                X_train_cleaned,
+                state,
+                train_rows,
+                config,
+                get_image_manifest(train_images),
+                full_rebuild,
+            ),
+            "test": plan_ingestion(
+                X_test_cleaned,
+                state,
+                test_rows,
+                config,
+                get_image_manifest(test_images),
+                full_rebuild,
+            ),
+        }
+        for split, plan in plans.items():
+            print(
+                f"🧮 {collections[split].name} : {plan['new']} nouvelles, {plan['changed']} "
+                f"modifiées, {plan['unchanged']} inchangées, {len(plan['stale'])} à supprimer"
             )
-            image_path = os.path.join(images_dir, "image_train", image_filename)
-            if os.path.exists(image_path):
-                img = Image.open(image_path)
-                doc = clean_one_row(row["designation"], row["description"], img)
-                doc["id"] = row["id"]
-                doc["prdtypecode"] = int(y_train.loc[index, "prdtypecode"])
-                X_train_cleaned.insert_one(doc)
-
-            else:
-                print(f"Image non trouvée : {image_filename}")
-
-        # Nettoyage et insertion des données de test
-        for _, row in tqdm(
-            X_test.head(nbre_lignes).iterrows(),
-            desc="Nettoyage et insertion X_test",
-            total=len(X_test.head(nbre_lignes)),
+
+        # Nettoyage des blocs train et test sur le pool ; les upserts groupés partent
+        # en tâche de fond (voir src/mongodb/bulk_writer.py) pendant le nettoyage des blocs suivants
+        tasks = chunk_tasks({split: plan["rows"] for split, plan in plans.items()}, chunk_size)
+        with (
+            BulkMongoWriter(X_train_cleaned) as train_writer,
+            BulkMongoWriter(X_test_cleaned) as test_writer,
         ):
-            image_filename = (
-                "image_" + str(row["imageid"]) + "_product_" + str(row["productid"]) + ".jpg"
+            writers = {"train": train_writer, "test": test_writer}
+            for split, docs in tqdm(
+                clean_chunks(tasks, image_format, workers),
+                desc=f"Nettoyage et insertion X_train/X_test ({workers} processus)",
+                total=len(tasks),
+            ):
+                for doc in docs:
+                    doc["source_hash"] = plans[split]["hashes"][doc["id"]]
+                    operation = ReplaceOne({"id": doc["id"]}, doc, upsert=True)
+                    writers[split].write(operation, size=estimate_size(doc))
+
+        # Le watermark n'avance qu'une fois toutes les écritures terminées
+        for split, plan in plans.items():
+            collection = collections[split]
+            if plan["stale"]:
+                collection.delete_many({"id": {"$in": plan["stale"]}})
+            state.replace_one(
+                {"_id": collection.name},
+                {"watermark": plan["watermark"], "config": config, "updated_at": datetime.now()},
+                upsert=True,
+            )
+        for writer in (train_writer, test_writer):
+            stats = writer.stats()
+            print(
+                f"📤 {stats['collection']} : {stats['docs']} documents | "
+                f"{stats['docs_per_s']:.0f} docs/s | {stats['bytes_per_s'] / 2**20:.1f} Mo/s | "
+                f"bloqué {stats['blocked_s']:.1f}s"
             )
-            image_path = os.path.join(images_dir, "image_test", image_filename)
-            if os.path.exists(image_path):
-                img = Image.open(image_path)
-                doc = clean_one_row(row["designation"], row["description"], Image.open(image_path))
-                doc["id"] = row["id"]
-                X_test_cleaned.insert_one(doc)
-
-            else:
-                print(f"Image non trouvée : {image_filename}")
 
 
 def calcul_lignes_a_lire(date_lancement: str) -> int:
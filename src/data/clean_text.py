@@ -1,12 +1,75 @@
-import re
+"""
+==============================================================
+🧹 Module : clean_text.py — Nettoyage rapide des textes
+==============================================================
+
+`clean_text_reference` est le nettoyage historique : arbre
+BeautifulSoup complet pour chaque champ, puis deux passes de regex.
+C'est le premier coût CPU du nettoyage.
+
+`clean_text` produit exactement le même résultat, plus vite :
+  • le balisage simple (balises sans script/style, entités nommées
+    ou numériques terminées par `;`) est retiré par regex, sans
+    construire d'arbre ; tout autre cas (commentaires, balises mal
+    formées, entités ambiguës…) repasse par BeautifulSoup,
+  • les résultats sont mémoïsés par hash du contenu dans un LRU borné
+    (CLEAN_TEXT_CACHE_SIZE) : champs vides et désignations répétées
+    ne sont nettoyés qu'une fois,
+  • `clean_text_series` traite une Series pandas entière en ne
+    nettoyant que ses valeurs distinctes.
+
+L'équivalence avec `clean_text_reference` est vérifiée par
+tests/test_clean_text.py, y compris sur le corpus Rakuten s'il est
+présent dans data/raw/.
+
+🔁 Mode benchmark :
+-------------------
+$ python -m src.data.clean_text --csv data/raw/X_train_update.csv
+==============================================================
+"""
+
+import argparse
+import hashlib
 import html
+import os
+import re
+import threading
+import time
 import warnings
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
 from bs4 import BeautifulSoup, MarkupResemblesLocatorWarning
+from bs4.dammit import EntitySubstitution
+
 
 warnings.filterwarnings("ignore", category=MarkupResemblesLocatorWarning)
 
+CLEAN_TEXT_CACHE_SIZE = int(os.getenv("CLEAN_TEXT_CACHE_SIZE", "100000"))
 
-def clean_text(text):
+_NON_WORD = re.compile(r"[^A-Za-zÀ-ÖØ-öø-ÿ0-9\s]")
+_SPACES = re.compile(r"\s+")
+# Balises que html.parser découpe comme BeautifulSoup : ouvrantes avec attributs, fermantes nues
+_TAG = re.compile(
+    r"<[a-zA-Z][-.a-zA-Z0-9:_]*"
+    r"(?:\s+[^\s\"'<>/=]+(?:\s*=\s*(?:\"[^\"]*\"|'[^']*'|[^\s\"'<>=`]+))?)*\s*/?>"
+    r"|</[a-zA-Z][-.a-zA-Z0-9:_]*\s*>"
+)
+# Contenu brut (non balisé) pour html.parser selon les versions de Python
+_RAW_TEXT_TAG = re.compile(
+    r"<\s*/?\s*(?:script|style|textarea|title|xmp|iframe|noembed|noframes|noscript"
+    r"|plaintext|template)\b",
+    re.IGNORECASE,
+)
+# `<` restant après retrait des balises : seul un `<` suivi d'un autre caractère est du texte
+_MARKUP_LEFT = re.compile(r"<(?:[a-zA-Z/!?]|$)")
+_AMP = re.compile(r"&(?:#([0-9]+);|#[xX]([0-9a-fA-F]+);|([a-zA-Z][a-zA-Z0-9]*);|(?=[^a-zA-Z#]))")
+_ENTITIES = EntitySubstitution.HTML_ENTITY_TO_CHARACTER
+
+
+def clean_text_reference(text):
+    """Nettoyage historique, référence de `clean_text`."""
     if not isinstance(text, str):
         return ""
     text = BeautifulSoup(text, "html.parser").get_text(" ")
@@ -14,3 +77,166 @@ def clean_text(text):
     text = re.sub(r"[^A-Za-zÀ-ÖØ-öø-ÿ0-9\s]", " ", text)
     text = re.sub(r"\s+", " ", text).strip().lower()
     return text
+
+
+def _same_codepoint(codepoint: int) -> bool:
+    """BeautifulSoup et html.unescape décodent ce caractère numérique de la même façon."""
+    if codepoint > 0x10FFFF:
+        return False
+    if codepoint in (0x0B, 0x7F) or 0x01 <= codepoint <= 0x08 or 0x0E <= codepoint <= 0x1F:
+        return False
+    return not (0xFDD0 <= codepoint <= 0xFDEF or codepoint & 0xFFFE == 0xFFFE)
+
+
+def _simple_entities(text: str) -> bool:
+    """Chaque `&` est une entité connue terminée par `;` ou un `&` littéral suivi d'un caractère."""
+    matches = 0
+    for match in _AMP.finditer(text):
+        matches += 1
+        decimal, hexadecimal, name = match.groups()
+        if name is not None and name not in _ENTITIES:
+            return False
+        if decimal is not None and not _same_codepoint(int(decimal)):
+            return False
+        if hexadecimal is not None and not _same_codepoint(int(hexadecimal, 16)):
+            return False
+    return matches == text.count("&")
+
+
+def strip_markup(text: str) -> str | None:
+    """
+    Équivalent de `BeautifulSoup(text, "html.parser").get_text(" ")` pour le
+    balisage simple ; None quand le texte doit passer par BeautifulSoup.
+    """
+    if "\x00" in text:
+        return None
+    if "<" in text:
+        if _RAW_TEXT_TAG.search(text):
+            return None
+        text = _TAG.sub(" ", text)
+        if _MARKUP_LEFT.search(text):
+            return None
+    if "&" in text:
+        if not _simple_entities(text):
+            return None
+        text = html.unescape(text)
+    return text
+
+
+class TextCleaner:
+    """Nettoyage mémoïsé (LRU borné, clé = hash du texte), partagé entre threads."""
+
+    def __init__(self, max_items: int = CLEAN_TEXT_CACHE_SIZE) -> None:
+        self.max_items = max_items
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.fallbacks = 0
+
+    def _clean(self, text: str) -> str:
+        stripped = strip_markup(text)
+        if stripped is None:
+            self.fallbacks += 1
+            stripped = BeautifulSoup(text, "html.parser").get_text(" ")
+        text = _NON_WORD.sub(" ", html.unescape(stripped))
+        return _SPACES.sub(" ", text).strip().lower()
+
+    def clean(self, text) -> str:
+        if not isinstance(text, str) or not text:
+            return ""
+        key = hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+        with self._lock:
+            cleaned = self._cache.get(key)
+            if cleaned is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return cleaned
+        cleaned = self._clean(text)
+        with self._lock:
+            self.misses += 1
+            self._cache[key] = cleaned
+            if len(self._cache) > self.max_items:
+                self._cache.popitem(last=False)
+        return cleaned
+
+    def clean_series(self, texts) -> pd.Series:
+        """Nettoie une Series (ou liste) en ne traitant qu'une fois chaque valeur distincte."""
+        texts = pd.Series(texts, dtype=object)
+        codes, uniques = pd.factorize(texts)
+        cleaned = np.array([self.clean(text) for text in uniques] + [""], dtype=object)
+        # Code -1 (valeur manquante) → dernière case, la chaîne vide
+        return pd.Series(cleaned[codes], index=texts.index, dtype=object)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "items": len(self._cache),
+                "hits": self.hits,
+                "misses": self.misses,
+                "fallbacks": self.fallbacks,
+            }
+
+
+_cleaner = TextCleaner()
+
+
+def get_text_cleaner() -> TextCleaner:
+    return _cleaner
+
+
+def clean_text(text):
+    return _cleaner.clean(text)
+
+
+def clean_text_series(texts) -> pd.Series:
+    return _cleaner.clean_series(texts)
+
+
+def benchmark(csv_path: str, n_rows: int | None = None) -> dict:
+    """Compare `clean_text_reference` et le moteur rapide sur designation + description."""
+    df = pd.read_csv(csv_path, nrows=n_rows)
+    texts = pd.concat([df["designation"], df["description"]], ignore_index=True)
+
+    start = time.perf_counter()
+    expected = [clean_text_reference(text) for text in texts]
+    reference_s = time.perf_counter() - start
+
+    cleaner = TextCleaner()
+    start = time.perf_counter()
+    cold = cleaner.clean_series(texts)
+    cold_s = time.perf_counter() - start
+    start = time.perf_counter()
+    cleaner.clean_series(texts)
+    warm_s = time.perf_counter() - start
+
+    mismatches = int(sum(a != b for a, b in zip(expected, cold, strict=True)))
+    report = {
+        "fields": len(texts),
+        "distinct": int(texts.nunique()),
+        "reference_s": reference_s,
+        "fast_cold_s": cold_s,
+        "fast_warm_s": warm_s,
+        "speedup_cold": reference_s / cold_s,
+        "mismatches": mismatches,
+        **cleaner.stats(),
+    }
+    print(
+        f"🧹 {report['fields']} champs ({report['distinct']} distincts) | "
+        f"référence {reference_s:.2f}s | rapide {cold_s:.2f}s (x{report['speedup_cold']:.1f}) | "
+        f"cache chaud {warm_s:.3f}s | repli BeautifulSoup {report['fallbacks']} | "
+        f"différences {mismatches}"
+    )
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark du nettoyage des textes.")
+    parser.add_argument("--csv", default=os.path.join("data", "raw", "X_train_update.csv"))
+    parser.add_argument("--n-rows", type=int, default=None)
+    args = parser.parse_args()
+    benchmark(args.csv, args.n_rows)
+
+
+if __name__ == "__main__":
+    main()
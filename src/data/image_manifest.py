@@ -0,0 +1,336 @@
+"""
+==============================================================
+🗃️ Module : image_manifest.py — Manifeste indexé des images
+==============================================================
+
+Le nettoyage et le scoring reconstruisaient le nom de chaque image
+depuis `imageid`/`productid` puis testaient son existence ligne par
+ligne. Le manifeste parcourt une seule fois le dossier avec
+`os.scandir` et enregistre pour chaque fichier, dans
+`data/processed/image_manifest/<dossier>-<hash du chemin>/build-<id>/` :
+
+  • name.npy                  → noms de fichiers triés
+  • size.npy, mtime_ns.npy    → taille et date de modification
+  • width.npy, height.npy     → dimensions lues dans l'en-tête
+  • digest.npy                → hash BLAKE2b (128 bits) du contenu
+  • canonical.npy             → position du premier fichier au contenu
+                                identique (lui-même s'il est unique)
+
+`meta.json` (dossier indexé, date, fichiers relus, dossier `build-<id>`
+courant) est publié en dernier par `os.replace` : une mise à jour
+n'écrase jamais les colonnes memory-mappées par un autre processus,
+elle écrit un nouveau dossier puis bascule dessus.
+
+Aux passages suivants, seuls les fichiers nouveaux ou dont la taille
+ou la date ont changé sont relus et hachés. Les doublons octet pour
+octet sont résolus vers un même fichier canonique : le nettoyage ne
+traite alors qu'une image par contenu et l'embedding n'en calcule
+qu'un vecteur.
+
+⚙️ Configuration (variables d'environnement) :
+  • IMAGE_MANIFEST_DIR (défaut data/processed/image_manifest)
+  • IMAGE_MANIFEST_WORKERS (défaut 8) : threads de lecture/hachage
+
+🔁 Mode CLI :
+-------------
+$ python -m src.data.image_manifest
+==============================================================
+"""
+
+import argparse
+import fcntl
+import hashlib
+import io
+import json
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+from PIL import Image
+
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
+RAW_DIR = os.path.join(BASE_DIR, "data", "raw")
+IMG_DIR = os.path.join(RAW_DIR, "images", "images")
+DATA_DIR = os.path.join(BASE_DIR, "data", "processed")
+MANIFEST_DIR = os.getenv("IMAGE_MANIFEST_DIR", os.path.join(DATA_DIR, "image_manifest"))
+MANIFEST_WORKERS = int(os.getenv("IMAGE_MANIFEST_WORKERS", "8"))
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+COLUMNS = ("name", "size", "mtime_ns", "width", "height", "digest", "canonical")
+
+
+def manifest_dir(images_dir: str) -> str:
+    """Dossier d'index d'un dossier d'images : son nom suivi d'un hash de son chemin absolu."""
+    path = os.path.abspath(images_dir)
+    suffix = hashlib.blake2b(path.encode("utf-8"), digest_size=4).hexdigest()
+    return os.path.join(MANIFEST_DIR, f"{os.path.basename(path)}-{suffix}")
+
+
+def read_image_file(path: str) -> tuple[int, int, bytes]:
+    """Largeur, hauteur (en-tête seul, sans décodage) et hash du contenu d'un fichier image."""
+    with open(path, "rb") as f:
+        data = f.read()
+    digest = hashlib.blake2b(data, digest_size=16).hexdigest().encode("ascii")
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            width, height = img.size
+    except Exception:
+        width, height = 0, 0  # fichier illisible : indexé, mais sans dimensions
+    return width, height, digest
+
+
+class ImageManifest:
+    """Index memory-mappé des fichiers d'un dossier d'images, mis à jour incrémentalement."""
+
+    def __init__(self, images_dir: str, index_dir: str | None = None) -> None:
+        self.images_dir = images_dir
+        self.index_dir = index_dir or manifest_dir(images_dir)
+        self.columns = {}
+        self.positions = {}
+        self.rescanned = 0
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def __contains__(self, filename: str) -> bool:
+        return filename in self.positions
+
+    def load(self) -> "ImageManifest":
+        """Met l'index à jour une fois par processus, puis le memory-mappe."""
+        with self._lock:
+            if not self.ready:
+                self._refresh()
+        return self
+
+    def refresh(self) -> "ImageManifest":
+        """Reparcourt le dossier même si l'index a déjà été chargé."""
+        with self._lock:
+            self._refresh()
+        return self
+
+    def _refresh(self) -> None:
+        os.makedirs(self.index_dir, exist_ok=True)
+        # Verrou fichier : un seul processus met l'index à jour
+        with open(os.path.join(self.index_dir, ".lock"), "a+") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            self._open(self.build())
+        self._ready.set()
+        stats = self.stats()
+        print(
+            f"🗃️ Manifeste {self.images_dir} : {stats['files']} images, "
+            f"{stats['duplicates']} doublons, {stats['rescanned']} relues"
+        )
+
+    def scan(self) -> dict:
+        """Un seul parcours du dossier : nom → (taille, date de modification)."""
+        if not os.path.isdir(self.images_dir):
+            return {}
+        entries = {}
+        with os.scandir(self.images_dir) as it:
+            for entry in it:
+                if entry.name.lower().endswith(IMAGE_EXTENSIONS) and entry.is_file():
+                    stat = entry.stat()
+                    entries[entry.name] = (stat.st_size, stat.st_mtime_ns)
+        return entries
+
+    def _read_meta(self) -> dict | None:
+        try:
+            with open(os.path.join(self.index_dir, "meta.json")) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _build_dir(self, meta: dict) -> str:
+        # Sans "build" : index d'une version antérieure, écrit à plat dans index_dir
+        return os.path.join(self.index_dir, meta.get("build", ""))
+
+    def _previous(self, meta: dict | None) -> dict:
+        """Entrées de l'index publié : nom → (taille, date, largeur, hauteur, hash)."""
+        if meta is None:
+            return {}
+        build_dir = self._build_dir(meta)
+        try:
+            columns = {name: np.load(os.path.join(build_dir, f"{name}.npy")) for name in COLUMNS}
+        except (FileNotFoundError, ValueError):
+            return {}
+        return {
+            name.decode("utf-8"): entry
+            for name, *entry in zip(*(columns[name].tolist() for name in COLUMNS[:-1]), strict=True)
+        }
+
+    def build(self) -> dict:
+        """
+        Parcourt le dossier et ne relit que les fichiers nouveaux ou modifiés ; l'index
+        est écrit dans un nouveau dossier puis publié. Retourne le meta.json courant.
+        """
+        meta = self._read_meta()
+        previous = self._previous(meta)
+        scanned = self.scan()
+        names = sorted(scanned)
+        n = len(names)
+        columns = {
+            "name": np.array([name.encode("utf-8") for name in names], dtype=np.bytes_),
+            "size": np.fromiter((scanned[name][0] for name in names), dtype=np.int64, count=n),
+            "mtime_ns": np.fromiter((scanned[name][1] for name in names), dtype=np.int64, count=n),
+            "width": np.zeros(n, dtype=np.int32),
+            "height": np.zeros(n, dtype=np.int32),
+            "digest": np.zeros(n, dtype="S32"),
+        }
+
+        todo = []
+        for i, name in enumerate(names):
+            entry = previous.get(name)
+            if entry is not None and tuple(entry[:2]) == scanned[name]:
+                columns["width"][i], columns["height"][i], columns["digest"][i] = entry[2:]
+            else:
+                todo.append(i)
+        paths = [os.path.join(self.images_dir, names[i]) for i in todo]
+        with ThreadPoolExecutor(MANIFEST_WORKERS) as executor:
+            for i, info in zip(todo, executor.map(read_image_file, paths), strict=True):
+                columns["width"][i], columns["height"][i], columns["digest"][i] = info
+        self.rescanned = len(todo)
+
+        # Noms triés : le fichier canonique d'un groupe de doublons est le premier par nom
+        _, first, inverse = np.unique(columns["digest"], return_index=True, return_inverse=True)
+        columns["canonical"] = first[inverse].astype(np.int64)
+
+        if previous and not todo and len(previous) == n:
+            return meta  # rien n'a changé : l'index existant est conservé
+        build = f"build-{time.time_ns():x}"
+        build_dir = os.path.join(self.index_dir, build)
+        os.makedirs(build_dir)
+        for name, values in columns.items():
+            np.save(os.path.join(build_dir, f"{name}.npy"), values)
+        # meta.json publié en dernier d'un seul os.replace : un index incomplet n'est jamais lu
+        meta = {
+            "images_dir": os.path.abspath(self.images_dir),
+            "files": n,
+            "rescanned": len(todo),
+            "updated_at": datetime.now().isoformat(),
+            "build": build,
+        }
+        tmp_path = os.path.join(build_dir, "meta.json")
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, os.path.join(self.index_dir, "meta.json"))
+        for entry in os.listdir(self.index_dir):
+            if entry.startswith("build-") and entry != build:
+                shutil.rmtree(os.path.join(self.index_dir, entry), ignore_errors=True)
+        return meta
+
+    def _open(self, meta: dict) -> None:
+        build_dir = self._build_dir(meta)
+        self.columns = {
+            name: np.load(os.path.join(build_dir, f"{name}.npy"), mmap_mode="r") for name in COLUMNS
+        }
+        self.positions = {
+            name.decode("utf-8"): i for i, name in enumerate(self.columns["name"].tolist())
+        }
+
+    def path(self, filename: str) -> str | None:
+        """Chemin du fichier s'il est indexé, None sinon."""
+        if filename not in self.positions:
+            return None
+        return os.path.join(self.images_dir, filename)
+
+    def canonical_path(self, filename: str) -> str | None:
+        """Chemin du premier fichier au contenu identique (le fichier lui-même s'il est unique)."""
+        position = self.positions.get(filename)
+        if position is None:
+            return None
+        canonical = int(self.columns["canonical"][position])
+        return os.path.join(self.images_dir, self.columns["name"][canonical].decode("utf-8"))
+
+    def stat(self, filename: str) -> tuple[int, int] | None:
+        """Taille et date de modification (ns) relevées au dernier parcours."""
+        position = self.positions.get(filename)
+        if position is None:
+            return None
+        return int(self.columns["size"][position]), int(self.columns["mtime_ns"][position])
+
+    def info(self, filename: str) -> dict | None:
+        position = self.positions.get(filename)
+        if position is None:
+            return None
+        return {
+            "name": filename,
+            "size": int(self.columns["size"][position]),
+            "mtime_ns": int(self.columns["mtime_ns"][position]),
+            "width": int(self.columns["width"][position]),
+            "height": int(self.columns["height"][position]),
+            "digest": self.columns["digest"][position].decode("ascii"),
+            "canonical": self.canonical_path(filename),
+        }
+
+    def duplicates(self) -> dict:
+        """Groupes de doublons : nom du fichier canonique → noms des copies."""
+        canonical = np.asarray(self.columns["canonical"])
+        copies = np.flatnonzero(canonical != np.arange(len(canonical)))
+        groups = {}
+        for i in copies.tolist():
+            original = self.columns["name"][canonical[i]].decode("utf-8")
+            groups.setdefault(original, []).append(self.columns["name"][i].decode("utf-8"))
+        return groups
+
+    def stats(self) -> dict:
+        canonical = np.asarray(self.columns["canonical"]) if self.columns else np.empty(0)
+        copies = canonical != np.arange(len(canonical))
+        sizes = np.asarray(self.columns["size"]) if self.columns else np.empty(0)
+        return {
+            "files": len(canonical),
+            "bytes": int(sizes.sum()),
+            "unique": int((~copies).sum()),
+            "duplicates": int(copies.sum()),
+            "duplicate_bytes": int(sizes[copies].sum()),
+            "rescanned": self.rescanned,
+        }
+
+
+_manifests = {}
+_manifests_lock = threading.Lock()
+
+
+def get_image_manifest(images_dir: str) -> ImageManifest:
+    """Retourne le manifeste partagé d'un dossier (non chargé tant que `load()` n'est pas appelé)."""
+    key = os.path.abspath(images_dir)
+    with _manifests_lock:
+        if key not in _manifests:
+            _manifests[key] = ImageManifest(images_dir)
+        return _manifests[key]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Indexe les dossiers d'images (manifeste).")
+    parser.add_argument(
+        "images_dirs",
+        nargs="*",
+        default=[os.path.join(IMG_DIR, "image_train"), os.path.join(IMG_DIR, "image_test")],
+    )
+    parser.add_argument("--duplicates", action="store_true", help="Affiche les doublons")
+    args = parser.parse_args()
+    for images_dir in args.images_dirs:
+        manifest = get_image_manifest(images_dir).load()
+        stats = manifest.stats()
+        print(
+            f"📦 {stats['files']} fichiers ({stats['bytes'] / 2**20:.1f} Mo), "
+            f"{stats['unique']} contenus distincts, {stats['duplicates']} doublons "
+            f"({stats['duplicate_bytes'] / 2**20:.1f} Mo)"
+        )
+        if args.duplicates:
+            for original, copies in manifest.duplicates().items():
+                print(f"  {original} ← {', '.join(copies)}")
+
+
+if __name__ == "__main__":
+    main()
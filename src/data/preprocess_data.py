@@ -1,75 +1,347 @@
 import io
+import math
 import os
+import warnings
 
 import joblib
 import numpy as np
 import pandas as pd
 import torch
+from numpy.lib.format import open_memmap
 from PIL import Image
-from scipy import sparse
-from scipy.sparse import hstack
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.model_selection import train_test_split
-from torch import nn
-from torchvision import models, transforms
+from torchvision import transforms
 from tqdm.auto import tqdm
 
+from src.data.clean_data import IMAGE_SIZE, decode_raw_image, encode_raw_image, is_raw_image
+from src.features.backbones import backbone_weights_path, build_backbone, embedding_dim
+from src.features.build_features import embedding_namespace, save_feature_config
+from src.features.embedding_cache import EmbeddingCache, image_key
+from src.features.feature_matrix import FeatureWriter, split_dir, write_features
+from src.features.hashed_text import TEXT_FEATURIZER, HashedTfidf, text_columns
+from src.features.image_backends import load_backend
+from src.features.image_loader import (
+    EMBED_BATCH_SIZE,
+    EMBED_WORKERS,
+    ImageBatchLoader,
+    make_batch_sizer,
+    timed_embed,
+)
 from src.mongodb.conf_loader import MongoConfLoader
 from src.mongodb.utils import MongoUtils
 
 
+# Les pixels "raw" lus depuis un blob sont en lecture seule : le tenseur uint8 n'est jamais modifié
+warnings.filterwarnings("ignore", message="The given NumPy array is not writable")
+
+# Mode flux : documents lus par blocs et features écrites sur disque bloc par bloc
+PREPROCESS_STREAMING = os.getenv("PREPROCESS_STREAMING", "1") == "1"
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "512"))
+
+
 class Preprocessor:
-    def __init__(self, tfidf=None, input_model=None, output_dir=None, batch_size=32):
+    def __init__(
+        self,
+        tfidf=None,
+        input_model=None,
+        output_dir=None,
+        batch_size=32,
+        progress=True,
+        embedding_cache=None,
+        image_backend="torch",
+        backbone="resnet50",
+        image_size=224,
+        loader_workers=EMBED_WORKERS,
+    ):
         if output_dir is None:
             output_dir = os.path.join("data", "processed")
         if input_model is None:
-            input_model = os.path.join("models", "resnet50-weights.pth")
+            input_model = backbone_weights_path("models", backbone)
         if tfidf is None:
             self.tfidf = joblib.load(os.path.join(output_dir, "tfidf_vectorizer.joblib"))
         else:
             self.tfidf = tfidf
-        self.preprocess = transforms.Compose(
-            [
-                transforms.ToTensor(),
-                transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
-            ]
+        # Les images stockées font IMAGE_SIZE : on ne redimensionne que pour une autre résolution
+        resize = []
+        if (image_size, image_size) != IMAGE_SIZE:
+            resize = [transforms.Resize((image_size, image_size), antialias=True)]
+        normalize = transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
+        self.preprocess = transforms.Compose(resize + [transforms.ToTensor(), normalize])
+        # Images "raw" (uint8 HWC) : même mise à l'échelle [0, 1] que ToTensor, sans passer par PIL
+        self.preprocess_array = transforms.Compose(
+            resize + [transforms.ConvertImageDtype(torch.float32), normalize]
         )
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        self.resnet = models.resnet50(weights=None)
-        self.resnet.load_state_dict(torch.load(input_model))
-        self.resnet.fc = nn.Identity()
+        self.backbone = backbone
+        self.image_size = image_size
+        self.cnn = build_backbone(backbone, input_model)
+        # Préfixe des artefacts exportés ; `resnet50` seul pour la configuration historique
+        self.artifact_name = backbone if image_size == 224 else f"{backbone}-{image_size}"
+        # Backend d'exécution du backbone : eager fp32 par défaut, TorchScript/ONNX/int8 en option
+        self.image_backend = load_backend(
+            image_backend,
+            self.cnn,
+            self.device,
+            os.path.dirname(input_model),
+            image_size,
+            self.artifact_name,
+        )
+        self.embedding_dim = embedding_dim(backbone)
+        # Taille des lots du backbone : entière, ou "auto" (mémoire disponible et débit mesuré)
         self.batch_size = batch_size
+        self.batch_sizer = make_batch_sizer(batch_size, image_size, self.device)
+        # Décodage des images sur un pool de threads, en avance sur le backbone
+        self.loader = ImageBatchLoader(self.load_tensor, self.device, workers=loader_workers)
+        self.progress = progress
+        self.embedding_cache = embedding_cache
 
-    def preprocess_data(self, df: pd.DataFrame) -> tuple:
-        X_tfidf = self.tfidf.transform(tqdm(df["text"], desc="Vectorisation TF-IDF"))
-
-        self.resnet.eval().to(self.device)
-        feats = []
-        for i in tqdm(range(0, len(df), self.batch_size), desc="ResNet50 embeddings"):
-            batch_tensors = []
-            for image_binary in df["image_binary"][i : i + self.batch_size]:
-                try:
-                    img_byte_arr = io.BytesIO(image_binary)
-                    img = Image.open(img_byte_arr)
-                    x = self.preprocess(img).to(self.device)
-                except Exception:
-                    x = torch.zeros(3, 224, 224)  # image manquante/cassée
-                batch_tensors.append(x)
-            xb = torch.stack(batch_tensors).to(self.device)
-            with torch.no_grad():
-                emb = self.resnet(xb).cpu().numpy()  # (B, 2048, 1, 1) ou (B, 2048)
-                emb = emb.reshape(emb.shape[0], -1)
-            feats.append(emb)
-
-        X_img = np.vstack(feats).astype(np.float32)
+    def load_tensor(self, image_binary) -> torch.Tensor:
+        """Tenseur normalisé (3, H, W) d'une image JPEG, d'un blob "raw" ou d'un tableau uint8 HWC."""
+        try:
+            if is_raw_image(image_binary):
+                image_binary = decode_raw_image(image_binary)
+            if isinstance(image_binary, np.ndarray):
+                # Pas de décodage : les pixels sont vus par torch sans copie
+                return self.preprocess_array(torch.from_numpy(image_binary).permute(2, 0, 1))
+            img_byte_arr = io.BytesIO(image_binary)
+            img = Image.open(img_byte_arr)
+            return self.preprocess(img)
+        except Exception:
+            return torch.zeros(3, self.image_size, self.image_size)  # image manquante/cassée
 
+    def preprocess_data(self, df: pd.DataFrame) -> tuple:
+        X_tfidf = self.transform_text(df["text"])
+        X_img = self.embed_images(df["image_binary"].tolist())
         return X_tfidf, X_img
 
+    def transform_text(self, texts):
+        return self.tfidf.transform(
+            tqdm(texts, desc="Vectorisation TF-IDF", disable=not self.progress)
+        )
+
+    def embed_images(self, images: list) -> np.ndarray:
+        X_img = np.empty((len(images), self.embedding_dim), dtype=np.float32)
+
+        # Une seule ligne par contenu : les images en double du lot sont recopiées à la fin
+        keys = [None] * len(images)
+        todo, copies, first = [], [], {}
+        for i, image_binary in enumerate(images):
+            if isinstance(image_binary, np.ndarray):
+                # Même clé que le blob "raw" stocké pour ces pixels
+                image_binary = encode_raw_image(image_binary)
+            if isinstance(image_binary, bytes):
+                keys[i] = image_key(image_binary)
+                if keys[i] in first:
+                    copies.append((i, first[keys[i]]))
+                    continue
+                first[keys[i]] = i
+            todo.append(i)
+
+        # Embeddings déjà connus relus d'un coup ; seules les autres images passent dans le backbone
+        if self.embedding_cache is not None:
+            keyed = [i for i in todo if keys[i] is not None]
+            found = self.embedding_cache.get_many([keys[i] for i in keyed], X_img, keyed)
+            known = {i for i, hit in zip(keyed, found, strict=True) if hit}
+            todo = [i for i in todo if i not in known]
+
+        progress = tqdm(
+            total=len(todo), desc=f"{self.backbone} embeddings", disable=not self.progress
+        )
+        for positions, xb in self.loader.batches([images[i] for i in todo], self.batch_sizer):
+            rows = [todo[p] for p in positions]
+            X_img[rows] = timed_embed(self.image_backend.embed, xb, self.batch_sizer)
+
+            if self.embedding_cache is not None:
+                keyed = [i for i in rows if keys[i] is not None]
+                self.embedding_cache.put_many([keys[i] for i in keyed], X_img[keyed])
+            progress.update(len(rows))
+        progress.close()
+
+        for i, source in copies:
+            X_img[i] = X_img[source]
+        return X_img
+
+
+def embedding_store(output_dir: str, feature_config: dict, input_model: str) -> EmbeddingCache:
+    """
+    Feature store des embeddings image, partagé avec l'API : un dossier par version
+    des features (voir `embedding_namespace`). Créé après le Preprocessor, qui
+    télécharge les poids du backbone s'ils sont absents.
+    """
+    namespace = embedding_namespace(feature_config, input_model)
+    print("🗄️ Embeddings :", namespace)
+    return EmbeddingCache(
+        disk_dir=os.path.join(output_dir, "embedding_cache", namespace),
+        dim=embedding_dim(feature_config["backbone"]),
+    )
+
+
+def make_tfidf() -> TfidfVectorizer:
+    return TfidfVectorizer(
+        max_features=20000,  # limite stricte
+        ngram_range=(1, 2),  # mots simples + bi-grammes
+        sublinear_tf=True,
+        min_df=2,  # ignorer termes rares
+    )
+
+
+def make_text_featurizer(kind: str = TEXT_FEATURIZER):
+    """TfidfVectorizer historique, ou TF-IDF haché sans vocabulaire (voir hashed_text.py)."""
+    if kind == "tfidf":
+        return make_tfidf()
+    if kind == "hashed":
+        return HashedTfidf()
+    raise ValueError(f"TEXT_FEATURIZER inconnu : {kind} (attendu : tfidf ou hashed)")
+
+
+def text_feature_config(featurizer) -> dict:
+    """Entrées de feature_config.json décrivant le featurizer texte."""
+    if isinstance(featurizer, HashedTfidf):
+        return {"text_featurizer": "hashed", "text_hash_bits": featurizer.n_bits}
+    return {"text_featurizer": "tfidf"}
+
+
+def document_text(doc: dict) -> str:
+    return (doc.get("designation") or "") + " " + (doc.get("description") or "")
+
+
+def stream_documents(collection, projection: dict, batch_size: int = STREAM_BATCH_SIZE):
+    """Documents de la collection par blocs de `batch_size` (curseur MongoDB lu par lots)."""
+    batch = []
+    for doc in collection.find({}, projection, batch_size=batch_size):
+        batch.append(doc)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def preprocess_data_streaming(
+    collection,
+    output_dir,
+    input_model,
+    backbone="resnet50",
+    image_size=224,
+    batch_size=STREAM_BATCH_SIZE,
+    text_featurizer=TEXT_FEATURIZER,
+) -> dict:
+    """
+    Features de X_train_cleaned calculées bloc par bloc, à mémoire constante.
+
+    1. ids et labels seuls → split train/val stratifié par `id`
+    2. textes du train seuls, lus en flux → ajustement du TF-IDF
+    3. documents complets par blocs de `batch_size` → TF-IDF + embeddings du
+       bloc, écrits directement dans X_train/ et X_val/ (voir
+       `FeatureWriter`) et dans y_train.npy / y_val.npy préalloués
+    """
+    labels = pd.DataFrame(list(collection.find({}, {"_id": 0, "id": 1, "prdtypecode": 1})))
+    train_ids, val_ids = train_test_split(
+        labels["id"].to_numpy(), test_size=0.2, stratify=labels["prdtypecode"].to_numpy()
+    )
+    split_of = dict.fromkeys(train_ids.tolist(), "train") | dict.fromkeys(val_ids.tolist(), "val")
+    sizes = {"train": len(train_ids), "val": len(val_ids)}
+    del labels
+
+    texts = (
+        document_text(doc)
+        for batch in stream_documents(
+            collection, {"_id": 0, "id": 1, "designation": 1, "description": 1}, batch_size
+        )
+        for doc in batch
+        if split_of.get(doc["id"]) == "train"
+    )
+    tfidf = make_text_featurizer(text_featurizer)
+    tfidf = tfidf.fit(tqdm(texts, total=sizes["train"], desc="Fitting TF-IDF"))
+    joblib.dump(tfidf, os.path.join(output_dir, "tfidf_vectorizer.joblib"))
+
+    # Représentation des images choisie au nettoyage (IMAGE_FORMAT) : le serving doit la reproduire
+    first = collection.find_one({}, {"_id": 0, "image_binary": 1}) or {}
+    image_format = "raw" if is_raw_image(first.get("image_binary")) else "jpeg"
+    feature_config = {"backbone": backbone, "image_size": image_size, "image_format": image_format}
+    feature_config |= text_feature_config(tfidf)
+    preprocessor = Preprocessor(
+        tfidf=tfidf,
+        input_model=input_model,
+        output_dir=output_dir,
+        batch_size=EMBED_BATCH_SIZE,
+        progress=False,
+        backbone=backbone,
+        image_size=image_size,
+    )
+    embedding_cache = embedding_store(output_dir, feature_config, input_model)
+    preprocessor.embedding_cache = embedding_cache
+
+    writers = {
+        split: FeatureWriter(
+            split_dir(output_dir, split), n, text_columns(tfidf), preprocessor.embedding_dim
+        )
+        for split, n in sizes.items()
+    }
+    labels_out = {
+        split: open_memmap(
+            os.path.join(output_dir, f"y_{split}.npy"), mode="w+", dtype=np.int64, shape=(n,)
+        )
+        for split, n in sizes.items()
+    }
+    projection = {
+        "_id": 0,
+        "id": 1,
+        "designation": 1,
+        "description": 1,
+        "prdtypecode": 1,
+        "image_binary": 1,
+    }
+    for batch in tqdm(
+        stream_documents(collection, projection, batch_size),
+        total=math.ceil(sum(sizes.values()) / batch_size),
+        desc="Features par blocs",
+    ):
+        for split, writer in writers.items():
+            docs = [doc for doc in batch if split_of.get(doc["id"]) == split]
+            if not docs:
+                continue
+            X_text = preprocessor.transform_text([document_text(doc) for doc in docs])
+            X_img = preprocessor.embed_images([doc.get("image_binary") for doc in docs])
+            labels_out[split][writer.rows : writer.rows + len(docs)] = [
+                doc["prdtypecode"] for doc in docs
+            ]
+            writer.write(X_text, X_img)
+    for split, writer in writers.items():
+        writer.close()
+        labels_out[split].flush()
+    print("Cache des embeddings :", embedding_cache.stats())
+    return feature_config
+
 
 def preprocess_data(
     output_dir=os.path.join("data", "processed"),
-    input_model=os.path.join("models", "resnet50-weights.pth"),
+    input_model=None,
+    backbone="resnet50",
+    image_size=224,
+    streaming=PREPROCESS_STREAMING,
+    text_featurizer=TEXT_FEATURIZER,
 ):
+    if input_model is None:
+        input_model = backbone_weights_path("models", backbone)
+
+    if streaming:
+        conf_loader = MongoConfLoader()
+        mongo_host = os.getenv("MONGO_HOST", "localhost")
+        with MongoUtils(conf_loader=conf_loader, host=mongo_host) as mongo:
+            feature_config = preprocess_data_streaming(
+                mongo.db["X_train_cleaned"],
+                output_dir,
+                input_model,
+                backbone,
+                image_size,
+                text_featurizer=text_featurizer,
+            )
+        # Backbone et résolution utilisés : copiés avec le modèle par train() pour le serving
+        save_feature_config(output_dir, feature_config)
+        return
+
     # Recuperation des données depuis MongoDB
     conf_loader = MongoConfLoader()
     print("Connection à MongoDB...")
@@ -114,42 +386,50 @@ def preprocess_data(
         df_test = pd.DataFrame(X_test_data)
 
     df_train["text"] = df_train["designation"].fillna("") + " " + df_train["description"].fillna("")
+    # Représentation des images choisie au nettoyage (IMAGE_FORMAT) : le serving doit la reproduire
+    image_format = "raw" if is_raw_image(df_train["image_binary"].iloc[0]) else "jpeg"
+    feature_config = {"backbone": backbone, "image_size": image_size, "image_format": image_format}
     X = df_train[["text", "image_binary"]]
     y = df_train["prdtypecode"].values
 
     X_train, X_val, y_train, y_val = train_test_split(X, y, test_size=0.2, stratify=y)
 
     # Preparation TF-IDF
-    tfidf = TfidfVectorizer(
-        max_features=20000,  # limite stricte
-        ngram_range=(1, 2),  # mots simples + bi-grammes
-        sublinear_tf=True,
-        min_df=2,  # ignorer termes rares
-    )
+    tfidf = make_text_featurizer(text_featurizer)
     tqdm.pandas(desc="TF-IDF vectorizer : Fitting and transforming Train")
     # df_train["text"] = df_train["designation"].fillna("") + " " + df_train["description"].fillna("")
     tfidf = tfidf.fit(tqdm(X_train["text"], desc="Fitting TF-IDF"))
     joblib.dump(tfidf, os.path.join(output_dir, "tfidf_vectorizer.joblib"))
+    feature_config |= text_feature_config(tfidf)
 
     preprocessor = Preprocessor(
-        tfidf=tfidf, input_model=input_model, output_dir=output_dir, batch_size=32
+        tfidf=tfidf,
+        input_model=input_model,
+        output_dir=output_dir,
+        batch_size=EMBED_BATCH_SIZE,
+        backbone=backbone,
+        image_size=image_size,
     )
+    embedding_cache = embedding_store(output_dir, feature_config, input_model)
+    preprocessor.embedding_cache = embedding_cache
     X_train_text, X_train_img = preprocessor.preprocess_data(X_train)
     X_val_text, X_val_img = preprocessor.preprocess_data(X_val)
+    print("Cache des embeddings :", embedding_cache.stats())
 
-    X_train_full = hstack([X_train_text, X_train_img])
-    X_val_full = hstack([X_val_text, X_val_img])
     # y = df_train["prdtypecode"].values
 
     # X_train, X_val, y_train, y_val = train_test_split(X, y, test_size=0.2, stratify=y)
 
-    sparse.save_npz(os.path.join(output_dir, "X_train.npz"), X_train_full)
-    sparse.save_npz(os.path.join(output_dir, "X_val.npz"), X_val_full)
+    write_features(split_dir(output_dir, "train"), X_train_text, X_train_img)
+    write_features(split_dir(output_dir, "val"), X_val_text, X_val_img)
     np.save(os.path.join(output_dir, "y_train.npy"), y_train)
     np.save(os.path.join(output_dir, "y_val.npy"), y_val)
+    # Backbone et résolution utilisés : copiés avec le modèle par train() pour le serving
+    save_feature_config(output_dir, feature_config)
 
 
 if __name__ == "__main__":
     output_dir = os.path.join("data", "processed")
-    input_model = os.path.join("models", "resnet50-weights.pth")
-    preprocess_data(output_dir=output_dir, input_model=input_model)
+    backbone = os.getenv("IMAGE_BACKBONE", "resnet50")
+    image_size = int(os.getenv("IMAGE_INPUT_SIZE", "224"))
+    preprocess_data(output_dir=output_dir, backbone=backbone, image_size=image_size)
@@ -0,0 +1,163 @@
+"""
+==============================================================
+🦴 Module : backbones.py — Backbones image sélectionnables
+==============================================================
+
+Catalogue des extracteurs de features image utilisables par le
+Preprocessor. La tête de classification de chaque backbone est
+remplacée par `nn.Identity()` :
+
+  backbone             dimension
+  resnet50             2048   (historique)
+  resnet18             512
+  mobilenet_v3_small   576
+  mobilenet_v3_large   960
+  efficientnet_b0      1280
+
+Les poids sont lus dans `models/<backbone>-weights.pth` ; à défaut,
+les poids ImageNet de torchvision sont téléchargés puis sauvegardés
+à cet emplacement.
+
+🔁 Mode benchmark :
+-------------------
+$ python -m src.features.backbones --backbones resnet50 resnet18 efficientnet_b0 --image-sizes 224 160
+
+Compare, sur un échantillon étiqueté de `X_train_cleaned`, le débit
+d'extraction (images/s) et l'accuracy d'un XGBoost court entraîné sur
+TF-IDF + embeddings, pour chaque couple (backbone, résolution).
+==============================================================
+"""
+
+import argparse
+import json
+import os
+import time
+
+import torch
+from torch import nn
+from torchvision import models
+
+
+BACKBONES = {
+    "resnet50": (models.resnet50, "fc", 2048),
+    "resnet18": (models.resnet18, "fc", 512),
+    "mobilenet_v3_small": (models.mobilenet_v3_small, "classifier", 576),
+    "mobilenet_v3_large": (models.mobilenet_v3_large, "classifier", 960),
+    "efficientnet_b0": (models.efficientnet_b0, "classifier", 1280),
+}
+
+
+def backbone_weights_path(model_dir: str, backbone: str) -> str:
+    return os.path.join(model_dir, f"{backbone}-weights.pth")
+
+
+def embedding_dim(backbone: str) -> int:
+    return BACKBONES[backbone][2]
+
+
+def build_backbone(backbone: str, weights_path: str) -> nn.Module:
+    """Construit le backbone sans tête de classification, en mode eval."""
+    if backbone not in BACKBONES:
+        raise ValueError(f"Backbone inconnu : {backbone} (choix : {list(BACKBONES)})")
+    constructor, head, _ = BACKBONES[backbone]
+    if os.path.exists(weights_path):
+        model = constructor(weights=None)
+        model.load_state_dict(torch.load(weights_path))
+    else:
+        print(f"⬇️ Poids {backbone} absents, téléchargement des poids ImageNet...")
+        model = constructor(weights="DEFAULT")
+        torch.save(model.state_dict(), weights_path)
+    setattr(model, head, nn.Identity())
+    return model.eval()
+
+
+def benchmark_backbones(backbones, image_sizes, n_samples=2000, output=None) -> list[dict]:
+    """Compare débit d'extraction et accuracy aval des couples (backbone, résolution)."""
+    import numpy as np
+    import pandas as pd
+    import xgboost as xgb
+    from scipy.sparse import hstack
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.model_selection import train_test_split
+    from sklearn.preprocessing import LabelEncoder
+
+    from src.data.preprocess_data import Preprocessor
+    from src.mongodb.conf_loader import MongoConfLoader
+    from src.mongodb.utils import MongoUtils
+    from src.predict.runtime import MODEL_DIR
+
+    mongo_host = os.getenv("MONGO_HOST", "localhost")
+    with MongoUtils(conf_loader=MongoConfLoader(), host=mongo_host) as mongo:
+        docs = list(
+            mongo.db["X_train_cleaned"].aggregate(
+                [{"$sample": {"size": n_samples}}, {"$project": {"_id": 0}}]
+            )
+        )
+    df = pd.DataFrame(docs)
+    df["text"] = df["designation"].fillna("") + " " + df["description"].fillna("")
+    y = LabelEncoder().fit_transform(df["prdtypecode"].values)
+    train_idx, val_idx = train_test_split(np.arange(len(df)), test_size=0.2, random_state=0)
+    tfidf = TfidfVectorizer(max_features=20000, ngram_range=(1, 2), sublinear_tf=True)
+    tfidf.fit(df["text"].iloc[train_idx])
+
+    results = []
+    for backbone in backbones:
+        for image_size in image_sizes:
+            preprocessor = Preprocessor(
+                tfidf=tfidf,
+                input_model=backbone_weights_path(MODEL_DIR, backbone),
+                progress=False,
+                backbone=backbone,
+                image_size=image_size,
+            )
+            start = time.perf_counter()
+            X_text, X_img = preprocessor.preprocess_data(df)
+            images_per_s = len(df) / (time.perf_counter() - start)
+
+            X = hstack([X_text, X_img]).tocsr()
+            params = {
+                "objective": "multi:softprob",
+                "num_class": int(y.max()) + 1,
+                "eta": 0.3,
+                "max_depth": 6,
+                "tree_method": "hist",
+            }
+            start = time.perf_counter()
+            bst = xgb.train(params, xgb.DMatrix(X[train_idx], label=y[train_idx]), 30)
+            train_seconds = time.perf_counter() - start
+            proba = bst.predict(xgb.DMatrix(X[val_idx]))
+            accuracy = float((np.argmax(proba, axis=1) == y[val_idx]).mean())
+
+            result = {
+                "backbone": backbone,
+                "image_size": image_size,
+                "embedding_dim": X_img.shape[1],
+                "images_per_s": images_per_s,
+                "xgb_train_seconds": train_seconds,
+                "accuracy": accuracy,
+            }
+            print(
+                f"🦴 {backbone:<20} {image_size}px | dim={X_img.shape[1]} | "
+                f"{images_per_s:.1f} img/s | XGB {train_seconds:.1f}s | acc={accuracy:.4f}"
+            )
+            results.append(result)
+
+    if output:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
+        print("💾 Rapport :", output)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark des backbones d'extraction d'images.")
+    parser.add_argument("--backbones", nargs="+", default=list(BACKBONES), choices=BACKBONES)
+    parser.add_argument("--image-sizes", nargs="+", type=int, default=[224])
+    parser.add_argument("--n-samples", type=int, default=2000)
+    parser.add_argument("--output", default=os.path.join("reports", "backbones.json"))
+    args = parser.parse_args()
+    benchmark_backbones(args.backbones, args.image_sizes, args.n_samples, args.output)
+
+
+if __name__ == "__main__":
+    main()
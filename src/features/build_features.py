@@ -0,0 +1,77 @@
+"""
+==============================================================
+🧩 Module : build_features.py — Configuration des features
+==============================================================
+
+La configuration des features (backbone image, résolution d'entrée,
+représentation des images "jpeg" ou "raw", featurizer texte "tfidf"
+ou "hashed"…) est écrite par
+`preprocess_data` dans `data/processed/feature_config.json`, puis
+copiée par `train()` à côté de `xgb_fusion.json` dans `models/`.
+Le runtime de prédiction la relit pour extraire les features avec
+exactement le même backbone et la même représentation d'image que
+ceux utilisés à l'entraînement.
+
+`embedding_namespace` identifie une version des embeddings image :
+configuration ci-dessus, empreinte des poids du backbone et
+PREPROCESSING_VERSION, à incrémenter à chaque changement du
+prétraitement des images (décodage, normalisation…). Le cache disque
+des embeddings (voir src/features/embedding_cache.py) est rangé sous
+ce nom : des embeddings d'une autre version ne sont jamais relus.
+==============================================================
+"""
+
+import hashlib
+import json
+import os
+
+
+FEATURE_CONFIG_FILE = "feature_config.json"
+DEFAULT_FEATURE_CONFIG = {
+    "backbone": "resnet50",
+    "image_size": 224,
+    "image_format": "jpeg",
+    "text_featurizer": "tfidf",
+}
+PREPROCESSING_VERSION = 1
+
+
+def load_feature_config(directory: str) -> dict:
+    """Lit `feature_config.json` ; un dossier sans fichier correspond au ResNet50 224×224 historique."""
+    config = dict(DEFAULT_FEATURE_CONFIG)
+    path = os.path.join(directory, FEATURE_CONFIG_FILE)
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            config.update(json.load(f))
+    return config
+
+
+def save_feature_config(directory: str, config: dict) -> str:
+    path = os.path.join(directory, FEATURE_CONFIG_FILE)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(config, f, indent=2)
+    return path
+
+
+def feature_tag(config: dict) -> str:
+    """Identifiant court d'une configuration image, ex. `resnet50-224` ou `resnet50-224-raw`."""
+    tag = f"{config['backbone']}-{config['image_size']}"
+    if config.get("image_format", "jpeg") != "jpeg":
+        tag = f"{tag}-{config['image_format']}"
+    return tag
+
+
+def weights_version(weights_path: str) -> str:
+    """Empreinte courte (BLAKE2b) du fichier de poids du backbone ; "none" s'il est absent."""
+    if not os.path.exists(weights_path):
+        return "none"
+    with open(weights_path, "rb") as f:
+        digest = hashlib.file_digest(f, lambda: hashlib.blake2b(digest_size=8))
+    return digest.hexdigest()
+
+
+def embedding_namespace(config: dict, weights_path: str) -> str:
+    """Dossier relatif d'une version des embeddings, ex. `resnet50-224/w1a2b3c4d5e6f7a8b-p1`."""
+    return os.path.join(
+        feature_tag(config), f"w{weights_version(weights_path)}-p{PREPROCESSING_VERSION}"
+    )
@@ -0,0 +1,276 @@
+"""
+==============================================================
+🗂️ Module : embedding_cache.py — Cache des embeddings image
+==============================================================
+
+Les images produits Rakuten sont souvent réutilisées d'une offre à
+l'autre. Ce cache évite de recalculer l'embedding ResNet50 (2048
+floats) d'une image déjà vue. La clé est un hash du contenu de
+l'image normalisée produite par `clean_one_row` (`image_binary`).
+
+Deux niveaux :
+  • mémoire : LRU borné en nombre d'embeddings,
+  • disque  : blocs float32 memory-mappés (`block_XXXXX.npy`) et un
+    index append-only (`index.tsv` : clé → slot). Les écritures sont
+    protégées par un verrou fichier, plusieurs processus (workers de
+    l'API, preprocessing) peuvent donc partager le même dossier.
+
+Accès en masse (preprocessing de l'entraînement) : `get_many` résout
+toutes les clés en slots d'un coup et recopie les vecteurs bloc par
+bloc par indexation vectorisée ; `put_many` ajoute un lot de vecteurs
+sous un seul verrou. Les vecteurs lus ou écrits ainsi sont aussi
+placés dans le LRU mémoire : un lot de l'API déjà vu ne touche plus
+le disque.
+
+Le dossier disque est propre à une version des features (voir
+`embedding_namespace` dans src/features/build_features.py) : backbone,
+résolution, format d'image, poids du backbone et version du
+prétraitement. Le dossier sert ainsi de feature store d'entraînement :
+seules les images jamais vues passent dans le backbone.
+
+Compteurs exposés par `stats()` : hits (mémoire / disque), misses,
+évictions du LRU.
+==============================================================
+"""
+
+import fcntl
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def image_key(image_binary: bytes) -> str:
+    """Clé de cache d'une image : hash BLAKE2b (128 bits) de ses octets normalisés."""
+    return hashlib.blake2b(image_binary, digest_size=16).hexdigest()
+
+
+class DiskEmbeddingTier:
+    """
+    Stockage persistant des embeddings sous forme de blocs memory-mappés.
+
+    Le slot N est la ligne `N % block_rows` du bloc `N // block_rows`.
+    """
+
+    def __init__(self, root: str, dim: int = 2048, block_rows: int = 4096) -> None:
+        self.root = root
+        self.dim = dim
+        self.block_rows = block_rows
+        os.makedirs(root, exist_ok=True)
+        self.index_path = os.path.join(root, "index.tsv")
+        self.lock_path = os.path.join(root, ".lock")
+        self.index = {}
+        self._offset = 0
+        self._blocks = {}
+        self._lock = threading.Lock()
+        with self._lock:
+            self._refresh_index()
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def _refresh_index(self) -> None:
+        # Relit uniquement les lignes ajoutées (par ce processus ou un autre) depuis le dernier appel
+        if not os.path.exists(self.index_path):
+            return
+        if os.path.getsize(self.index_path) == self._offset:
+            return
+        with open(self.index_path, "rb") as f:
+            f.seek(self._offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # ligne en cours d'écriture
+                key, slot = line.decode("ascii").split("\t")
+                self.index[key] = int(slot)
+                self._offset += len(line)
+
+    def _block(self, block_id: int, create: bool = False) -> np.ndarray:
+        block = self._blocks.get(block_id)
+        if block is None:
+            path = os.path.join(self.root, f"block_{block_id:05d}.npy")
+            if os.path.exists(path):
+                block = np.load(path, mmap_mode="r+")
+            elif create:
+                block = np.lib.format.open_memmap(
+                    path, mode="w+", dtype=np.float32, shape=(self.block_rows, self.dim)
+                )
+            else:
+                raise FileNotFoundError(path)
+            self._blocks[block_id] = block
+        return block
+
+    def get(self, key: str) -> np.ndarray | None:
+        with self._lock:
+            slot = self.index.get(key)
+            if slot is None:
+                self._refresh_index()
+                slot = self.index.get(key)
+                if slot is None:
+                    return None
+            block = self._block(slot // self.block_rows)
+            return np.array(block[slot % self.block_rows])
+
+    def slots(self, keys: list) -> np.ndarray:
+        """Slot de chaque clé, -1 pour une clé absente."""
+        with self._lock:
+            self._refresh_index()
+            return np.fromiter(
+                (self.index.get(key, -1) for key in keys), dtype=np.int64, count=len(keys)
+            )
+
+    def gather(self, slots: np.ndarray, out: np.ndarray, rows: np.ndarray) -> None:
+        """Copie le vecteur de `slots[i]` dans `out[rows[i]]`, un bloc à la fois."""
+        blocks = slots // self.block_rows
+        with self._lock:
+            for block_id in np.unique(blocks):
+                mask = blocks == block_id
+                out[rows[mask]] = self._block(int(block_id))[slots[mask] % self.block_rows]
+
+    def put_many(self, keys: list, vectors: np.ndarray) -> None:
+        """Ajoute un lot de vecteurs (clés déjà présentes ignorées) sous un seul verrou."""
+        with self._lock, open(self.lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self._refresh_index()
+                lines, touched = [], set()
+                slot = len(self.index)
+                for key, vector in zip(keys, vectors, strict=True):
+                    if key in self.index:
+                        continue
+                    block_id = slot // self.block_rows
+                    self._block(block_id, create=True)[slot % self.block_rows] = vector
+                    touched.add(block_id)
+                    self.index[key] = slot
+                    lines.append(f"{key}\t{slot}\n")
+                    slot += 1
+                for block_id in touched:
+                    self._blocks[block_id].flush()
+                # Vecteurs écrits avant les entrées d'index : un lecteur ne voit jamais un slot vide
+                data = "".join(lines).encode("ascii")
+                with open(self.index_path, "ab") as f:
+                    f.write(data)
+                self._offset += len(data)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def put(self, key: str, vector: np.ndarray) -> None:
+        with self._lock, open(self.lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self._refresh_index()
+                if key in self.index:
+                    return
+                slot = len(self.index)
+                block = self._block(slot // self.block_rows, create=True)
+                block[slot % self.block_rows] = vector
+                block.flush()
+                # Le vecteur est écrit avant l'entrée d'index : un lecteur ne voit jamais un slot vide
+                line = f"{key}\t{slot}\n".encode("ascii")
+                with open(self.index_path, "ab") as f:
+                    f.write(line)
+                self.index[key] = slot
+                self._offset += len(line)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class EmbeddingCache:
+    """
+    Cache à deux niveaux : LRU mémoire borné devant un `DiskEmbeddingTier` optionnel.
+    """
+
+    def __init__(self, max_items: int = 10_000, disk_dir: str | None = None, dim: int = 2048):
+        self.max_items = max_items
+        self.dim = dim
+        self.disk = DiskEmbeddingTier(disk_dir, dim=dim) if disk_dir else None
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _remember(self, key: str, vector: np.ndarray) -> None:
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_items:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, key: str) -> np.ndarray | None:
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return vector
+        vector = self.disk.get(key) if self.disk is not None else None
+        with self._lock:
+            if vector is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(key, vector)
+        return vector
+
+    def put(self, key: str, vector: np.ndarray) -> None:
+        vector = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            self._remember(key, vector)
+        if self.disk is not None:
+            self.disk.put(key, vector)
+
+    def get_many(self, keys: list, out: np.ndarray, rows=None) -> np.ndarray:
+        """
+        Écrit dans `out[rows[i]]` le vecteur connu de `keys[i]` (`rows` : 0..n-1 par
+        défaut) et retourne le masque des clés trouvées. Les vecteurs lus sur disque
+        sont promus dans le LRU, comme avec `get`.
+        """
+        rows = np.arange(len(keys)) if rows is None else np.asarray(rows)
+        found = np.zeros(len(keys), dtype=bool)
+        with self._lock:
+            for i, key in enumerate(keys):
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    out[rows[i]] = vector
+                    found[i] = True
+            hits = int(found.sum())
+        disk_hits = 0
+        if self.disk is not None and not found.all():
+            missing = np.flatnonzero(~found)
+            slots = self.disk.slots([keys[i] for i in missing])
+            hit = slots >= 0
+            self.disk.gather(slots[hit], out, rows[missing[hit]])
+            found[missing[hit]] = True
+            disk_hits = int(hit.sum())
+        with self._lock:
+            if disk_hits:
+                for i in missing[hit].tolist():
+                    self._remember(keys[i], out[rows[i]].copy())
+            self.hits += hits
+            self.disk_hits += disk_hits
+            self.misses += len(keys) - hits - disk_hits
+        return found
+
+    def put_many(self, keys: list, vectors: np.ndarray) -> None:
+        """Enregistre un lot de vecteurs dans le LRU mémoire et, d'une seule écriture, sur disque."""
+        vectors = np.array(vectors, dtype=np.float32)  # copie : le lot appelant peut être réutilisé
+        with self._lock:
+            for key, vector in zip(keys, vectors, strict=True):
+                self._remember(key, vector)
+        if self.disk is not None:
+            self.disk.put_many(keys, vectors)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "memory_items": len(self._memory),
+                "disk_items": len(self.disk) if self.disk is not None else 0,
+            }
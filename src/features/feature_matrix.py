@@ -0,0 +1,224 @@
+"""
+==============================================================
+🧱 Module : feature_matrix.py — Features texte + image sur disque
+==============================================================
+
+Les features d'un split étaient écrites en un seul `.npz` compressé
+issu de `hstack([X_tfidf, X_img])` : chaque valeur du bloc dense
+d'embeddings portait en plus un indice de colonne int32, et lire une
+seule ligne obligeait à décompresser toute l'archive.
+
+Chaque split est désormais un dossier `X_<split>/` de tableaux `.npy`
+non compressés, memory-mappables :
+
+  • text_data.npy, text_indices.npy, text_indptr.npy
+                      → matrice CSR TF-IDF (float32, int32, int32)
+  • image.npy         → bloc dense des embeddings (n_lignes, dim), float32
+  • meta.json         → nombre de lignes, colonnes texte et image,
+                        écrit en dernier (un dossier incomplet n'est
+                        jamais relu)
+
+`FeatureMatrix` lit une ligne ou une plage de lignes sans toucher au
+reste des fichiers. `fused()` reconstruit, plage par plage, la matrice
+CSR `[texte | image]` sur laquelle le booster est entraîné via
+`fuse_features` (zéros du bloc dense exclus, comme avec `hstack`).
+
+🔁 Conversion d'un ancien X_<split>.npz :
+-----------------------------------------
+$ python -m src.features.feature_matrix data/processed/X_val.npz --n-text 10164
+==============================================================
+"""
+
+import argparse
+import json
+import os
+import shutil
+
+import numpy as np
+from numpy.lib.format import open_memmap
+from scipy import sparse
+
+from src.predict.fusion import fuse_features
+
+
+META_FILE = "meta.json"
+# Lignes lues à la fois pour reconstruire la matrice fusionnée
+FUSE_CHUNK_ROWS = int(os.getenv("FUSE_CHUNK_ROWS", "4096"))
+
+
+def split_dir(output_dir: str, split: str) -> str:
+    return os.path.join(output_dir, f"X_{split}")
+
+
+class FeatureWriter:
+    """
+    Features d'un split écrites bloc de lignes par bloc de lignes, sans être tenues en mémoire.
+
+    `text_indptr.npy` et `image.npy` sont préalloués (nombre de lignes connu) ;
+    `data` et `indices` du CSR sont ajoutés à des fichiers bruts puis recopiés
+    en `.npy` par `close()`, une fois leur taille connue.
+    """
+
+    def __init__(self, directory: str, n_rows: int, n_text: int, n_img: int) -> None:
+        self.directory = directory
+        self.shape = (n_rows, n_text, n_img)
+        if os.path.exists(directory):
+            shutil.rmtree(directory)
+        os.makedirs(directory)
+        # Fichiers fermés par close()
+        self._data = open(os.path.join(directory, "text_data.bin"), "wb")  # noqa: SIM115
+        self._indices = open(os.path.join(directory, "text_indices.bin"), "wb")  # noqa: SIM115
+        self.indptr = open_memmap(
+            os.path.join(directory, "text_indptr.npy"),
+            mode="w+",
+            dtype=np.int32,
+            shape=(n_rows + 1,),
+        )
+        self.image = open_memmap(
+            os.path.join(directory, "image.npy"), mode="w+", dtype=np.float32, shape=(n_rows, n_img)
+        )
+        self.rows = 0
+        self.nnz = 0
+
+    def write(self, X_text, X_img: np.ndarray) -> None:
+        X_text = sparse.csr_matrix(X_text)
+        n = X_text.shape[0]
+        n_rows, n_text, n_img = self.shape
+        if self.rows + n > n_rows or X_text.shape[1] != n_text or X_img.shape != (n, n_img):
+            raise ValueError(f"Bloc {X_text.shape} + {X_img.shape} hors des features {self.shape}")
+        # Index int32 : les plages relues deviennent des CSR scipy sans conversion
+        if self.nnz + X_text.nnz >= 2**31:
+            raise ValueError("Plus de 2**31 valeurs non nulles : indices int32 insuffisants")
+        self._data.write(X_text.data.astype(np.float32).tobytes())
+        self._indices.write(X_text.indices.astype(np.int32).tobytes())
+        self.indptr[self.rows + 1 : self.rows + n + 1] = self.nnz + X_text.indptr[1:]
+        self.image[self.rows : self.rows + n] = X_img
+        self.rows += n
+        self.nnz += X_text.nnz
+
+    def _to_npy(self, name: str, dtype, chunk: int = 1 << 22) -> None:
+        raw_path = os.path.join(self.directory, f"{name}.bin")
+        out = open_memmap(
+            os.path.join(self.directory, f"{name}.npy"), mode="w+", dtype=dtype, shape=(self.nnz,)
+        )
+        if self.nnz:
+            raw = np.memmap(raw_path, dtype=dtype, mode="r", shape=(self.nnz,))
+            for start in range(0, self.nnz, chunk):
+                out[start : start + chunk] = raw[start : start + chunk]
+            del raw
+        out.flush()
+        del out
+        os.remove(raw_path)
+
+    def close(self) -> None:
+        self._data.close()
+        self._indices.close()
+        if self.rows != self.shape[0]:
+            raise ValueError(f"{self.rows} lignes écrites sur {self.shape[0]} attendues")
+        self.indptr.flush()
+        self.image.flush()
+        self.indptr = self.image = None
+        self._to_npy("text_data", np.float32)
+        self._to_npy("text_indices", np.int32)
+        n_rows, n_text, n_img = self.shape
+        with open(os.path.join(self.directory, META_FILE), "w") as f:
+            json.dump(
+                {"rows": n_rows, "text_columns": n_text, "image_columns": n_img, "nnz": self.nnz}, f
+            )
+
+
+def write_features(directory: str, X_text, X_img: np.ndarray) -> None:
+    """Écrit d'un coup les features d'un split tenues en mémoire."""
+    writer = FeatureWriter(directory, X_text.shape[0], X_text.shape[1], X_img.shape[1])
+    writer.write(X_text, X_img)
+    writer.close()
+
+
+class FeatureMatrix:
+    """Features d'un split memory-mappées : lignes et plages lues à la demande."""
+
+    def __init__(self, directory: str) -> None:
+        meta_path = os.path.join(directory, META_FILE)
+        if not os.path.exists(meta_path):
+            raise FileNotFoundError(f"Features absentes ou incomplètes : {directory}")
+        with open(meta_path) as f:
+            meta = json.load(f)
+        self.directory = directory
+        self.n_rows = meta["rows"]
+        self.n_text = meta["text_columns"]
+        self.n_img = meta["image_columns"]
+
+        def load(name):
+            return np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+
+        self.text_data = load("text_data")
+        self.text_indices = load("text_indices")
+        self.text_indptr = load("text_indptr")
+        self.image = load("image")
+
+    def __len__(self) -> int:
+        return self.n_rows
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return self.n_rows, self.n_text + self.n_img
+
+    def rows(self, start: int, stop: int) -> tuple[sparse.csr_matrix, np.ndarray]:
+        """(CSR texte, bloc image) des lignes [start, stop) ; seules ces lignes sont lues."""
+        start, stop, _ = slice(start, stop).indices(self.n_rows)
+        stop = max(start, stop)
+        indptr = np.array(self.text_indptr[start : stop + 1])
+        lo, hi = indptr[0], indptr[-1]
+        X_text = sparse.csr_matrix(
+            (
+                np.array(self.text_data[lo:hi]),
+                np.array(self.text_indices[lo:hi]),
+                indptr - lo,
+            ),
+            shape=(stop - start, self.n_text),
+        )
+        return X_text, np.array(self.image[start:stop])
+
+    def row(self, index: int) -> tuple[sparse.csr_matrix, np.ndarray]:
+        if not 0 <= index < self.n_rows:
+            raise IndexError(f"Ligne {index} hors de [0, {self.n_rows})")
+        return self.rows(index, index + 1)
+
+    def ranges(self, chunk_rows: int = FUSE_CHUNK_ROWS):
+        """Itère sur `(start, stop)` par plages de `chunk_rows` lignes."""
+        for start in range(0, self.n_rows, chunk_rows):
+            yield start, min(start + chunk_rows, self.n_rows)
+
+    def fused(self, chunk_rows: int = FUSE_CHUNK_ROWS) -> sparse.csr_matrix:
+        """Matrice CSR `[texte | image]` du booster, construite plage par plage."""
+        blocks = [fuse_features(*self.rows(start, stop)) for start, stop in self.ranges(chunk_rows)]
+        if not blocks:
+            return sparse.csr_matrix(self.shape, dtype=np.float32)
+        return sparse.vstack(blocks, format="csr")
+
+
+def convert_npz(npz_path: str, directory: str, n_text: int) -> FeatureMatrix:
+    """Convertit un ancien X_<split>.npz (hstack texte + image) en dossier de features."""
+    X = sparse.load_npz(npz_path).tocsr()
+    X_text = X[:, :n_text]
+    X_img = X[:, n_text:].toarray().astype(np.float32)
+    write_features(directory, X_text, X_img)
+    return FeatureMatrix(directory)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convertit un X_<split>.npz en dossier de features."
+    )
+    parser.add_argument("npz_path")
+    parser.add_argument("--n-text", type=int, required=True, help="Nombre de colonnes TF-IDF")
+    args = parser.parse_args()
+    directory = os.path.splitext(args.npz_path)[0]
+    features = convert_npz(args.npz_path, directory, args.n_text)
+    print(
+        f"✅ {directory} : {features.n_rows} lignes, {features.n_text} + {features.n_img} colonnes"
+    )
+
+
+if __name__ == "__main__":
+    main()
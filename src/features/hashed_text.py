@@ -0,0 +1,285 @@
+"""
+==============================================================
+#️⃣ Module : hashed_text.py — TF-IDF haché sans vocabulaire
+==============================================================
+
+Le `TfidfVectorizer` (max_features=20000, uni+bigrammes) demande une
+passe complète pour construire le vocabulaire, garde en mémoire un
+dictionnaire de tous les bigrammes vus, et chaque worker de l'API doit
+recharger ce dictionnaire picklé.
+
+`HashedTfidf` remplace le vocabulaire par un hachage des termes
+(`HashingVectorizer`, 2**TEXT_HASH_BITS colonnes) :
+  • l'apprentissage se résume aux fréquences documentaires (DF) de
+    chaque colonne, comptées en une seule passe, bloc par bloc ;
+  • les DF de blocs, de processus ou de machines différents
+    s'additionnent (`merge`) : l'apprentissage se parallélise ;
+  • aucun vocabulaire à l'inférence : l'artefact ne contient que les DF
+    (int32, une par colonne), d'où l'IDF est recalculé au chargement ;
+    l'objet picklé expose `.transform` comme le TfidfVectorizer et se
+    charge de la même façon.
+
+Pondération identique au TfidfVectorizer du projet : TF sous-linéaire
+(1 + log tf), IDF lissé log((1 + n) / (1 + df)) + 1, normalisation L2 ;
+les colonnes vues dans moins de `min_df` documents sont ignorées.
+
+⚙️ Configuration (variables d'environnement) :
+  • TEXT_FEATURIZER (défaut tfidf) : "tfidf" ou "hashed"
+  • TEXT_HASH_BITS (défaut 18) : 2**18 colonnes
+  • TEXT_HASH_WORKERS (défaut 1) : processus de comptage des DF
+
+🔁 Mode benchmark :
+-------------------
+$ python -m src.features.hashed_text --csv data/raw/X_train_update.csv
+==============================================================
+"""
+
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import time
+import tracemalloc
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import joblib
+import numpy as np
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.preprocessing import normalize
+
+
+TEXT_FEATURIZER = os.getenv("TEXT_FEATURIZER", "tfidf")
+TEXT_HASH_BITS = int(os.getenv("TEXT_HASH_BITS", "18"))
+TEXT_HASH_WORKERS = int(os.getenv("TEXT_HASH_WORKERS", "1"))
+TEXT_HASH_CHUNK_SIZE = 4096
+
+
+def make_hasher(n_features: int) -> HashingVectorizer:
+    """Comptes bruts des uni+bigrammes, même découpage en mots que le TfidfVectorizer."""
+    return HashingVectorizer(
+        n_features=n_features,
+        ngram_range=(1, 2),
+        alternate_sign=False,
+        norm=None,
+        dtype=np.float32,
+    )
+
+
+def document_frequencies(texts: list, n_features: int) -> tuple[np.ndarray, int]:
+    """(DF de chaque colonne, nombre de documents) d'un bloc de textes."""
+    X = make_hasher(n_features).transform(texts)
+    return np.bincount(X.indices, minlength=n_features).astype(np.int32), X.shape[0]
+
+
+def text_columns(vectorizer) -> int:
+    """Nombre de colonnes produites par un TfidfVectorizer ou un HashedTfidf."""
+    if isinstance(vectorizer, HashedTfidf):
+        return vectorizer.n_features
+    return len(vectorizer.vocabulary_)
+
+
+class HashedTfidf:
+    """TF-IDF sur termes hachés : l'état appris se limite aux fréquences documentaires."""
+
+    def __init__(
+        self,
+        n_bits: int = TEXT_HASH_BITS,
+        min_df: int = 2,
+        workers: int = TEXT_HASH_WORKERS,
+        chunk_size: int = TEXT_HASH_CHUNK_SIZE,
+    ) -> None:
+        self.n_bits = n_bits
+        self.n_features = 2**n_bits
+        self.min_df = min_df
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.df_ = np.zeros(self.n_features, dtype=np.int32)
+        self.n_docs_ = 0
+        self._idf = None
+        self._hasher = make_hasher(self.n_features)
+
+    def __getstate__(self) -> dict:
+        # DF seules (int32) : l'IDF et le hacheur sont recalculés au chargement
+        state = dict(self.__dict__)
+        state["_idf"] = None
+        del state["_hasher"]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._hasher = make_hasher(self.n_features)
+
+    def add_counts(self, df: np.ndarray, n_docs: int) -> "HashedTfidf":
+        self.df_ += df
+        self.n_docs_ += n_docs
+        self._idf = None
+        return self
+
+    def partial_fit(self, texts) -> "HashedTfidf":
+        """Ajoute les DF d'un bloc de textes."""
+        return self.add_counts(*document_frequencies(list(texts), self.n_features))
+
+    def merge(self, other: "HashedTfidf") -> "HashedTfidf":
+        """Additionne les DF apprises ailleurs (autre bloc, processus ou machine)."""
+        if other.n_features != self.n_features:
+            raise ValueError(f"Hachages incompatibles : {other.n_features} ≠ {self.n_features}")
+        return self.add_counts(other.df_, other.n_docs_)
+
+    def _chunks(self, texts):
+        it = iter(texts)
+        while chunk := list(islice(it, self.chunk_size)):
+            yield chunk
+
+    def fit(self, texts) -> "HashedTfidf":
+        """Une seule passe sur `texts` (itérable quelconque), bloc par bloc."""
+        if self.workers <= 1:
+            for chunk in self._chunks(texts):
+                self.partial_fit(chunk)
+            return self
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(self.workers, mp_context=context) as executor:
+            pending = deque()
+            for chunk in self._chunks(texts):
+                pending.append(executor.submit(document_frequencies, chunk, self.n_features))
+                # Au plus deux blocs d'avance par processus : la mémoire reste bornée
+                if len(pending) >= 2 * self.workers:
+                    self.add_counts(*pending.popleft().result())
+            while pending:
+                self.add_counts(*pending.popleft().result())
+        return self
+
+    @property
+    def idf_(self) -> np.ndarray:
+        if self._idf is None:
+            idf = np.log((1 + self.n_docs_) / (1 + self.df_)) + 1
+            idf[self.df_ < self.min_df] = 0
+            self._idf = idf.astype(np.float32)
+        return self._idf
+
+    def transform(self, texts):
+        X = self._hasher.transform(texts)
+        np.log(X.data, out=X.data)
+        X.data += 1
+        X.data *= self.idf_[X.indices]
+        X.eliminate_zeros()
+        return normalize(X, copy=False)
+
+    def fit_transform(self, texts):
+        texts = list(texts)
+        return self.fit(texts).transform(texts)
+
+
+def load_texts(csv_path: str, labels_path: str) -> tuple[list, np.ndarray]:
+    """Textes nettoyés (désignation + description) et labels de X_train_update.csv."""
+    import pandas as pd
+
+    from src.data.clean_text import clean_text_series
+
+    X = pd.read_csv(csv_path)
+    y = pd.read_csv(labels_path)["prdtypecode"].to_numpy()
+    texts = clean_text_series(X["designation"]) + " " + clean_text_series(X["description"])
+    return texts.tolist(), y
+
+
+def benchmark(texts: list, y: np.ndarray, rounds: int = 30, output: str | None = None) -> list:
+    """
+    Compare TfidfVectorizer et HashedTfidf : durée et pic mémoire de l'apprentissage,
+    taille de l'artefact, latence de transformation, accuracy d'un XGBoost court.
+    """
+    import xgboost as xgb
+    from sklearn.model_selection import train_test_split
+    from sklearn.preprocessing import LabelEncoder
+
+    from src.data.preprocess_data import make_tfidf
+
+    y = LabelEncoder().fit_transform(y)
+    counts = np.bincount(y)
+    stratify = y if counts.min() >= 2 else None
+    train_idx, val_idx = train_test_split(
+        np.arange(len(texts)), test_size=0.2, random_state=0, stratify=stratify
+    )
+    train_texts = [texts[i] for i in train_idx]
+    val_texts = [texts[i] for i in val_idx]
+    featurizers = [("tfidf", make_tfidf)] + [
+        (f"hashed-{w}w", lambda w=w: HashedTfidf(workers=w))
+        for w in sorted({1, max(1, os.cpu_count() or 1)})
+    ]
+
+    report = []
+    for name, factory in featurizers:
+        start = time.perf_counter()
+        vectorizer = factory().fit(train_texts)
+        fit_s = time.perf_counter() - start
+        # Second apprentissage pour le pic mémoire : tracemalloc ralentit le premier
+        tracemalloc.start()
+        factory().fit(train_texts)
+        fit_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        buffer = io.BytesIO()
+        joblib.dump(vectorizer, buffer)
+        start = time.perf_counter()
+        joblib.load(io.BytesIO(buffer.getvalue())).transform(val_texts[:1])
+        load_s = time.perf_counter() - start
+
+        single = []
+        for text in val_texts[:200]:
+            start = time.perf_counter()
+            vectorizer.transform([text])
+            single.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        X_val = vectorizer.transform(val_texts)
+        batch_s = time.perf_counter() - start
+        X_train = vectorizer.transform(train_texts)
+
+        params = {
+            "objective": "multi:softprob",
+            "num_class": int(y.max()) + 1,
+            "eta": 0.3,
+            "max_depth": 6,
+            "tree_method": "hist",
+        }
+        bst = xgb.train(params, xgb.DMatrix(X_train, label=y[train_idx]), rounds)
+        accuracy = float((bst.predict(xgb.DMatrix(X_val)).argmax(axis=1) == y[val_idx]).mean())
+
+        result = {
+            "featurizer": name,
+            "columns": text_columns(vectorizer),
+            "fit_s": round(fit_s, 3),
+            "fit_peak_mb": round(fit_peak / 2**20, 1),
+            "artifact_mb": round(len(buffer.getvalue()) / 2**20, 2),
+            "load_ms": round(load_s * 1000, 1),
+            "transform_one_ms": round(float(np.median(single)) * 1000, 3),
+            "transform_docs_per_s": round(len(val_texts) / batch_s),
+            "accuracy": round(accuracy, 4),
+        }
+        report.append(result)
+        print(
+            f"#️⃣ {name:<10} | fit {result['fit_s']:>6.2f} s, pic {result['fit_peak_mb']:>7.1f} Mo | "
+            f"artefact {result['artifact_mb']:>6.2f} Mo | 1 doc {result['transform_one_ms']:.2f} ms | "
+            f"{result['transform_docs_per_s']} docs/s | acc={result['accuracy']:.4f}"
+        )
+    if output:
+        os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+        print("💾 Rapport :", output)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark TF-IDF vs TF-IDF haché.")
+    parser.add_argument("--csv", default=os.path.join("data", "raw", "X_train_update.csv"))
+    parser.add_argument("--labels", default=os.path.join("data", "raw", "Y_train_CVw08PX.csv"))
+    parser.add_argument("--rounds", type=int, default=30)
+    parser.add_argument("--output", default=os.path.join("reports", "hashed_text.json"))
+    args = parser.parse_args()
+    texts, y = load_texts(args.csv, args.labels)
+    benchmark(texts, y, args.rounds, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,351 @@
+"""
+==============================================================
+🖼️ Module : image_backends.py — Backends d'inférence de l'extracteur d'images
+==============================================================
+
+Le backbone image tronqué (ResNet50 par défaut, voir backbones.py)
+peut être exécuté par plusieurs backends interchangeables, du plus
+fidèle au plus rapide :
+
+  • torch              → modèle eager fp32 (référence, comportement historique)
+  • torchscript        → modèle tracé et figé, fp32
+  • torchscript-int8   → quantification statique int8 (FX graph mode), calibrée
+  • onnx               → export ONNX exécuté par ONNX Runtime, fp32
+  • onnx-int8-dynamic  → ONNX Runtime, poids int8 (quantification dynamique)
+  • onnx-int8-static   → ONNX Runtime, poids et activations int8, calibrée
+
+Les backends autres que `torch` sont exportés dans le dossier des
+modèles (`models/<backbone>-<backend>.pt|.onnx`). Les variantes statiques
+ont besoin d'un échantillon de calibration tiré des images stockées
+d'entraînement (collection `X_train_cleaned`) : elles se construisent
+avec la commande ci-dessous, qui mesure aussi l'écart des embeddings
+par rapport au fp32 et l'effet sur l'accuracy XGBoost.
+
+🔁 Exemple d'exécution :
+------------------------
+$ python -m src.features.image_backends --backends onnx-int8-static torchscript-int8
+
+ONNX Runtime est optionnel (`pip install onnx onnxruntime`) : seuls
+les backends `onnx*` en ont besoin.
+==============================================================
+"""
+
+import argparse
+import copy
+import json
+import os
+import time
+
+import numpy as np
+import torch
+
+
+IMAGE_BACKENDS = (
+    "torch",
+    "torchscript",
+    "torchscript-int8",
+    "onnx",
+    "onnx-int8-dynamic",
+    "onnx-int8-static",
+)
+CALIBRATED_BACKENDS = ("torchscript-int8", "onnx-int8-static")
+
+
+def backend_artifact_path(model_dir: str, backend: str, name: str = "resnet50") -> str:
+    extension = "onnx" if backend.startswith("onnx") else "pt"
+    return os.path.join(model_dir, f"{name}-{backend}.{extension}")
+
+
+# ---------- Backends ----------
+class TorchBackend:
+    """Modèle eager fp32 sur le device du Preprocessor."""
+
+    def __init__(self, model: torch.nn.Module, device: torch.device) -> None:
+        self.name = "torch"
+        self.device = device
+        self.model = model.eval().to(device)
+
+    def embed(self, xb: torch.Tensor) -> np.ndarray:
+        with torch.no_grad():
+            # Lot en mémoire épinglée (voir image_loader.py) : copie asynchrone vers le GPU
+            emb = self.model(xb.to(self.device, non_blocking=True)).cpu().numpy()
+        return emb.reshape(emb.shape[0], -1)
+
+
+class TorchScriptBackend:
+    """Module TorchScript (fp32 ou int8) exécuté sur CPU."""
+
+    def __init__(self, path: str, name: str) -> None:
+        self.name = name
+        self.device = torch.device("cpu")
+        self.model = torch.jit.load(path, map_location="cpu").eval()
+
+    def embed(self, xb: torch.Tensor) -> np.ndarray:
+        with torch.no_grad():
+            emb = self.model(xb.cpu()).numpy()
+        return emb.reshape(emb.shape[0], -1)
+
+
+class OnnxBackend:
+    """Session ONNX Runtime (fp32 ou int8) exécutée sur CPU."""
+
+    def __init__(self, path: str, name: str) -> None:
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise ImportError(
+                f"Le backend {name} nécessite onnxruntime (pip install onnx onnxruntime)"
+            ) from e
+        self.name = name
+        self.device = torch.device("cpu")
+        self.session = ort.InferenceSession(path, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def embed(self, xb: torch.Tensor) -> np.ndarray:
+        emb = self.session.run(None, {self.input_name: xb.cpu().numpy()})[0]
+        return emb.reshape(emb.shape[0], -1)
+
+
+# ---------- Export ----------
+def export_backend(model, backend, path, example, calibration_batches=None) -> str:
+    """Exporte `model` (fp32, eval) vers l'artefact du backend demandé."""
+    if backend in CALIBRATED_BACKENDS and not calibration_batches:
+        raise ValueError(f"Le backend {backend} nécessite des images de calibration")
+    model = copy.deepcopy(model).cpu().eval()
+    example = example.cpu()
+
+    if backend in ("torchscript", "torchscript-int8"):
+        if backend == "torchscript-int8":
+            from torch.ao.quantization import get_default_qconfig_mapping
+            from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+            torch.backends.quantized.engine = "x86"
+            model = prepare_fx(model, get_default_qconfig_mapping("x86"), (example,))
+            with torch.no_grad():
+                for xb in calibration_batches:
+                    model(xb.cpu())
+            model = convert_fx(model)
+        with torch.no_grad():
+            traced = torch.jit.freeze(torch.jit.trace(model, example))
+        torch.jit.save(traced, path)
+        return path
+
+    name = os.path.basename(path).rsplit(f"-{backend}.", 1)[0]
+    fp32_path = backend_artifact_path(os.path.dirname(path), "onnx", name)
+    if backend == "onnx" or not os.path.exists(fp32_path):
+        torch.onnx.export(
+            model,
+            example,
+            fp32_path,
+            input_names=["input"],
+            output_names=["embedding"],
+            dynamic_axes={"input": {0: "batch"}, "embedding": {0: "batch"}},
+            dynamo=False,
+        )
+    if backend == "onnx-int8-dynamic":
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantize_dynamic(fp32_path, path, weight_type=QuantType.QInt8)
+    elif backend == "onnx-int8-static":
+        from onnxruntime.quantization import (
+            CalibrationDataReader,
+            QuantFormat,
+            QuantType,
+            quantize_static,
+        )
+
+        class _Reader(CalibrationDataReader):
+            def __init__(self):
+                self.batches = iter(calibration_batches)
+
+            def get_next(self):
+                xb = next(self.batches, None)
+                return None if xb is None else {"input": xb.cpu().numpy()}
+
+        quantize_static(
+            fp32_path,
+            path,
+            _Reader(),
+            quant_format=QuantFormat.QDQ,
+            per_channel=True,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+        )
+    return path
+
+
+def load_backend(backend, model, device, model_dir, image_size=224, name="resnet50"):
+    """
+    Retourne le backend demandé pour `model` (backbone tronqué fp32).
+
+    `name` préfixe les artefacts exportés : un backbone ou une résolution
+    différente ne réutilise jamais l'export d'un autre.
+
+    Les artefacts manquants sont exportés à la volée, sauf pour les
+    backends calibrés qui doivent être construits au préalable (voir CLI).
+    """
+    if backend not in IMAGE_BACKENDS:
+        raise ValueError(f"Backend image inconnu : {backend} (choix : {IMAGE_BACKENDS})")
+    if backend == "torch":
+        return TorchBackend(model, device)
+
+    path = backend_artifact_path(model_dir, backend, name)
+    if not os.path.exists(path):
+        if backend in CALIBRATED_BACKENDS:
+            raise FileNotFoundError(
+                f"Artefact {path} introuvable : lancer "
+                f"`python -m src.features.image_backends --backends {backend}`"
+            )
+        print(f"📦 Export du backend {backend} vers {path}...")
+        export_backend(model, backend, path, torch.zeros(1, 3, image_size, image_size))
+    if backend.startswith("onnx"):
+        return OnnxBackend(path, backend)
+    return TorchScriptBackend(path, backend)
+
+
+# ---------- Comparaison vitesse / fidélité ----------
+def embed_all(backend, tensors: torch.Tensor, batch_size: int = 32) -> tuple[np.ndarray, float]:
+    """Retourne les embeddings de `tensors` et le débit en images/s."""
+    start = time.perf_counter()
+    feats = [backend.embed(tensors[i : i + batch_size]) for i in range(0, len(tensors), batch_size)]
+    elapsed = time.perf_counter() - start
+    return np.vstack(feats).astype(np.float32), len(tensors) / elapsed
+
+
+def embedding_deviation(reference: np.ndarray, candidate: np.ndarray) -> dict:
+    """Écarts d'un backend par rapport aux embeddings fp32 de référence."""
+    ref_norm = np.linalg.norm(reference, axis=1)
+    cand_norm = np.linalg.norm(candidate, axis=1)
+    cosine = (reference * candidate).sum(axis=1) / np.maximum(ref_norm * cand_norm, 1e-12)
+    rel_l2 = np.linalg.norm(reference - candidate, axis=1) / np.maximum(ref_norm, 1e-12)
+    return {
+        "cosine_mean": float(cosine.mean()),
+        "cosine_min": float(cosine.min()),
+        "relative_l2_mean": float(rel_l2.mean()),
+        "max_abs_error": float(np.abs(reference - candidate).max()),
+    }
+
+
+def compare_backends(backends, n_calibration=256, n_eval=512, batch_size=32, output=None):
+    """
+    Construit les backends demandés et compare leurs embeddings au fp32.
+
+    Calibration et évaluation utilisent deux échantillons disjoints de
+    `X_train_cleaned`. L'accuracy est celle du booster déployé sur
+    l'échantillon d'évaluation : ces lignes ont pu servir à
+    l'entraînement, seul l'écart entre backends est significatif.
+    Le backbone et la résolution sont ceux du modèle déployé
+    (`models/feature_config.json`).
+    """
+    import joblib
+    import pandas as pd
+    import xgboost as xgb
+    from scipy.sparse import hstack
+
+    from src.data.preprocess_data import Preprocessor
+    from src.features.backbones import backbone_weights_path
+    from src.features.build_features import load_feature_config
+    from src.mongodb.conf_loader import MongoConfLoader
+    from src.mongodb.utils import MongoUtils
+    from src.predict.runtime import DATA_DIR, MODEL_DIR
+
+    mongo_host = os.getenv("MONGO_HOST", "localhost")
+    with MongoUtils(conf_loader=MongoConfLoader(), host=mongo_host) as mongo:
+        docs = list(
+            mongo.db["X_train_cleaned"].aggregate(
+                [
+                    {"$sample": {"size": n_calibration + n_eval}},
+                    {"$project": {"_id": 0, "id": 0}},
+                ]
+            )
+        )
+    df = pd.DataFrame(docs)
+    df["text"] = df["designation"].fillna("") + " " + df["description"].fillna("")
+    df_cal, df_eval = df.iloc[:n_calibration], df.iloc[n_calibration:]
+
+    config = load_feature_config(MODEL_DIR)
+    preprocessor = Preprocessor(
+        tfidf=joblib.load(os.path.join(DATA_DIR, "tfidf_vectorizer.joblib")),
+        input_model=backbone_weights_path(MODEL_DIR, config["backbone"]),
+        progress=False,
+        backbone=config["backbone"],
+        image_size=config["image_size"],
+    )
+    cal_tensors = torch.stack([preprocessor.load_tensor(b) for b in df_cal["image_binary"]])
+    eval_tensors = torch.stack([preprocessor.load_tensor(b) for b in df_eval["image_binary"]])
+    calibration_batches = [
+        cal_tensors[i : i + batch_size] for i in range(0, len(cal_tensors), batch_size)
+    ]
+
+    bst = xgb.Booster()
+    bst.load_model(os.path.join(MODEL_DIR, "xgb_fusion.json"))
+    encoder = joblib.load(os.path.join(MODEL_DIR, "label_encoder.joblib"))
+    X_text = preprocessor.tfidf.transform(df_eval["text"])
+    labels = df_eval["prdtypecode"].values
+
+    def accuracy(X_img):
+        proba = bst.predict(xgb.DMatrix(hstack([X_text, X_img])))
+        return float((encoder.inverse_transform(np.argmax(proba, axis=1)) == labels).mean())
+
+    reference, reference_rate = embed_all(
+        TorchBackend(preprocessor.cnn, preprocessor.device), eval_tensors, batch_size
+    )
+    reference_accuracy = accuracy(reference)
+    report = {
+        "torch": {"images_per_s": reference_rate, "accuracy": reference_accuracy},
+    }
+    for name in backends:
+        if name == "torch":
+            continue
+        path = backend_artifact_path(MODEL_DIR, name, preprocessor.artifact_name)
+        print(f"📦 Export du backend {name} vers {path}...")
+        export_backend(preprocessor.cnn, name, path, eval_tensors[:1], calibration_batches)
+        backend = load_backend(
+            name,
+            preprocessor.cnn,
+            preprocessor.device,
+            MODEL_DIR,
+            preprocessor.image_size,
+            preprocessor.artifact_name,
+        )
+        emb, rate = embed_all(backend, eval_tensors, batch_size)
+        backend_accuracy = accuracy(emb)
+        report[name] = {
+            "images_per_s": rate,
+            "speedup": rate / reference_rate,
+            "accuracy": backend_accuracy,
+            "accuracy_delta": backend_accuracy - reference_accuracy,
+            **embedding_deviation(reference, emb),
+        }
+
+    for name, metrics in report.items():
+        print(f"🖼️ {name:<18} " + " | ".join(f"{k}={v:.4f}" for k, v in metrics.items()))
+    if output:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+        print("💾 Rapport :", output)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Construit et compare les backends de l'extracteur d'images."
+    )
+    parser.add_argument(
+        "--backends",
+        nargs="+",
+        default=["onnx-int8-dynamic", "onnx-int8-static", "torchscript-int8"],
+        choices=IMAGE_BACKENDS,
+    )
+    parser.add_argument("--n-calibration", type=int, default=256)
+    parser.add_argument("--n-eval", type=int, default=512)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--output", default=os.path.join("reports", "image_backends.json"))
+    args = parser.parse_args()
+    compare_backends(
+        args.backends, args.n_calibration, args.n_eval, args.batch_size, args.output
+    )
+
+
+if __name__ == "__main__":
+    main()
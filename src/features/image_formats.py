@@ -0,0 +1,233 @@
+"""
+==============================================================
+🖼️ Module : image_formats.py — JPEG ou pixels bruts ?
+==============================================================
+
+Deux représentations des images nettoyées (IMAGE_FORMAT, voir
+src/data/clean_data.py) :
+
+  • "jpeg" (historique) : l'image redimensionnée est ré-encodée en
+    JPEG, puis décodée une seconde fois avant l'embedding
+  • "raw"  : les pixels uint8 (224, 224, 3) sont conservés tels quels ;
+    stockés dans un blob de 8 octets d'en-tête + pixels (MongoDB),
+    ou passés directement à l'embedder au serving, puis donnés à torch
+    par `from_numpy` sans copie
+
+Le benchmark mesure, sur un échantillon étiqueté du CSV d'entraînement :
+temps CPU de normalisation (encodage) et de décodage vers le tenseur,
+taille stockée, écart des pixels (PSNR), similarité des embeddings et
+accuracy du modèle déployé avec chacune des deux représentations.
+
+`--draft` mesure le décodage JPEG réduit des images sources (JPEG_DRAFT) :
+temps CPU de décodage + redimensionnement, pixels décodés (mémoire du
+buffer PIL) et écart au décodage en pleine résolution.
+
+🔁 Mode benchmark :
+-------------------
+$ python -m src.features.image_formats --n-samples 500
+$ python -m src.features.image_formats --draft --n-samples 2000
+==============================================================
+"""
+
+import argparse
+import copy
+import io
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import torch
+from PIL import Image
+
+from src.data.clean_data import (
+    IMAGE_SIZE,
+    clean_text,
+    decode_raw_image,
+    encode_raw_image,
+    normalize_image,
+)
+from src.data.image_manifest import get_image_manifest
+from src.predict.catalog import image_filename
+from src.predict.fusion import predict_fused
+
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
+RAW_DIR = os.path.join(BASE_DIR, "data", "raw")
+IMG_DIR = os.path.join(RAW_DIR, "images", "images")
+
+
+def load_labelled_sample(n_samples: int, seed: int = 0) -> pd.DataFrame:
+    """Lignes étiquetées de X_train_update.csv dont l'image existe, tirées au hasard."""
+    X = pd.read_csv(os.path.join(RAW_DIR, "X_train_update.csv"))
+    y = pd.read_csv(os.path.join(RAW_DIR, "Y_train_CVw08PX.csv"))
+    df = X.assign(prdtypecode=y["prdtypecode"].values)
+    manifest = get_image_manifest(os.path.join(IMG_DIR, "image_train")).load()
+    df["image_path"] = [
+        manifest.path(image_filename(imageid, productid))
+        for imageid, productid in zip(df["imageid"], df["productid"], strict=True)
+    ]
+    df = df[df["image_path"].notna()]
+    return df.sample(min(n_samples, len(df)), random_state=seed).reset_index(drop=True)
+
+
+def _timed(fn, items) -> tuple[list, float]:
+    """Applique `fn` à chaque élément ; retourne les résultats et le temps CPU du thread par élément (ms)."""
+    start = time.thread_time()
+    results = [fn(item) for item in items]
+    return results, (time.thread_time() - start) / len(items) * 1000
+
+
+def psnr(a: np.ndarray, b: np.ndarray) -> float:
+    mse = np.mean((a.astype(np.float32) - b.astype(np.float32)) ** 2)
+    return float("inf") if mse == 0 else float(10 * np.log10(255**2 / mse))
+
+
+def benchmark_jpeg_draft(n_samples: int = 2000, output: str | None = None) -> dict:
+    """Compare le décodage JPEG des sources en pleine résolution et à taille réduite (draft)."""
+    paths = load_labelled_sample(n_samples)["image_path"].tolist()
+
+    def decode(path, draft):
+        with Image.open(path) as img:
+            if draft:
+                img.draft("RGB", IMAGE_SIZE)
+            img.load()
+            decoded = img.size[0] * img.size[1] * len(img.getbands())
+            return normalize_image(img, "raw", draft=False), decoded
+
+    report, pixels = {}, {}
+    for name, draft in (("full", False), ("draft", True)):
+        _timed(lambda path, draft=draft: decode(path, draft), paths[:8])  # chauffe
+        results, decode_ms = _timed(lambda path, draft=draft: decode(path, draft), paths)
+        pixels[name] = [array for array, _ in results]
+        decoded = np.array([size for _, size in results]) / 2**20
+        report[name] = {
+            "decode_cpu_ms": decode_ms,
+            "decoded_mb_mean": float(decoded.mean()),
+            "decoded_mb_max": float(decoded.max()),
+        }
+        print(
+            f"🗜️ {name:<5} | décodage + redimensionnement {decode_ms:.2f} ms | "
+            f"buffer décodé {decoded.mean():.2f} Mo (max {decoded.max():.2f} Mo)"
+        )
+    report["comparison"] = {
+        "n_samples": len(paths),
+        "speedup": report["full"]["decode_cpu_ms"] / report["draft"]["decode_cpu_ms"],
+        "pixel_psnr_db": float(
+            np.mean([psnr(f, d) for f, d in zip(pixels["full"], pixels["draft"], strict=True)])
+        ),
+    }
+    print(
+        f"🔍 x{report['comparison']['speedup']:.1f} | "
+        f"PSNR pleine résolution/draft {report['comparison']['pixel_psnr_db']:.1f} dB"
+    )
+    if output:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+        print("💾 Rapport :", output)
+    return report
+
+
+def benchmark_image_formats(n_samples: int = 500, output: str | None = None) -> dict:
+    """Compare les représentations "jpeg" et "raw" avec le modèle déployé."""
+    from src.predict.runtime import get_runtime
+
+    runtime = get_runtime().load()
+    # Sans cache : chaque représentation passe réellement dans le backbone
+    preprocessor = copy.copy(runtime.preprocessor)
+    preprocessor.embedding_cache = None
+
+    df = load_labelled_sample(n_samples)
+    texts = [
+        clean_text(designation) + " " + clean_text(description)
+        for designation, description in zip(df["designation"], df["description"], strict=True)
+    ]
+    X_text = preprocessor.transform_text(texts)
+    # Décodage des JPEG sources hors chronomètre : il est commun aux deux représentations
+    sources = []
+    for path in df["image_path"]:
+        with Image.open(path) as img:
+            img.load()
+            sources.append(img)
+
+    encoders = {
+        "jpeg": normalize_image,
+        "raw": lambda img: encode_raw_image(normalize_image(img, "raw")),
+    }
+    report, pixels, embeddings, predictions = {}, {}, {}, {}
+    for image_format, encode in encoders.items():
+        _timed(preprocessor.load_tensor, _timed(encode, sources[:8])[0])  # chauffe
+        stored, encode_ms = _timed(encode, sources)
+        tensors, decode_ms = _timed(preprocessor.load_tensor, stored)
+        with torch.inference_mode():
+            X_img = np.concatenate(
+                [
+                    preprocessor.image_backend.embed(torch.stack(tensors[i : i + 32]))
+                    for i in range(0, len(tensors), 32)
+                ]
+            )
+        proba = predict_fused(runtime.bst, X_text, X_img)
+        codes = runtime.encoder.inverse_transform(np.argmax(proba, axis=1))
+
+        if image_format == "jpeg":
+            pixels[image_format] = [np.asarray(Image.open(io.BytesIO(b))) for b in stored]
+        else:
+            pixels[image_format] = [decode_raw_image(b) for b in stored]
+        embeddings[image_format], predictions[image_format] = X_img, codes
+        report[image_format] = {
+            "encode_cpu_ms": encode_ms,
+            "decode_cpu_ms": decode_ms,
+            "stored_bytes": float(np.mean([len(b) for b in stored])),
+            "accuracy": float((codes == df["prdtypecode"].values).mean()),
+        }
+
+    a, b = embeddings["jpeg"], embeddings["raw"]
+    cosine = (a * b).sum(axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1) + 1e-12)
+    report["comparison"] = {
+        "n_samples": len(df),
+        "pixel_psnr_db": float(
+            np.mean([psnr(j, r) for j, r in zip(pixels["jpeg"], pixels["raw"], strict=True)])
+        ),
+        "embedding_cosine": float(cosine.mean()),
+        "prediction_agreement": float((predictions["jpeg"] == predictions["raw"]).mean()),
+    }
+
+    for image_format in encoders:
+        r = report[image_format]
+        print(
+            f"🖼️ {image_format:<4} | encodage {r['encode_cpu_ms']:.2f} ms | "
+            f"décodage {r['decode_cpu_ms']:.2f} ms | {r['stored_bytes'] / 1024:.1f} Ko | "
+            f"acc={r['accuracy']:.4f}"
+        )
+    comparison = report["comparison"]
+    print(
+        f"🔍 PSNR JPEG/raw {comparison['pixel_psnr_db']:.1f} dB | "
+        f"cosinus embeddings {comparison['embedding_cosine']:.4f} | "
+        f"prédictions identiques {comparison['prediction_agreement']:.1%}"
+    )
+    if output:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+        print("💾 Rapport :", output)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark des représentations d'images.")
+    parser.add_argument("--n-samples", type=int, default=500)
+    parser.add_argument("--draft", action="store_true", help="Décodage JPEG réduit des sources")
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+    if args.draft:
+        benchmark_jpeg_draft(
+            args.n_samples, args.output or os.path.join("reports", "jpeg_draft.json")
+        )
+    else:
+        benchmark_image_formats(
+            args.n_samples, args.output or os.path.join("reports", "image_formats.json")
+        )
+
+
+if __name__ == "__main__":
+    main()
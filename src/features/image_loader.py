@@ -0,0 +1,188 @@
+"""
+==============================================================
+🚚 Module : image_loader.py — Chargement des images par lots
+==============================================================
+
+`Preprocessor.embed_images` décodait et normalisait chaque image dans
+le thread qui exécute le backbone : le forward attendait le décodage,
+et le décodage attendait le forward.
+
+`ImageBatchLoader` décode et normalise les images sur un pool de
+threads (décodage PIL, redimensionnement et opérations torch
+relâchent le GIL) et garde EMBED_PREFETCH lots d'avance pendant que
+le lot courant passe dans le backbone. Sur GPU, chaque lot est
+assemblé dans un buffer en mémoire épinglée (pinned), copié vers la
+carte sans passer par un buffer intermédiaire.
+
+`AdaptiveBatchSizer` choisit la taille des lots :
+  • plafond fixé par la mémoire disponible (RAM, limite du cgroup,
+    mémoire libre du GPU) et le coût estimé d'une image,
+  • puis montée par doublement tant que le débit mesuré (images/s)
+    progresse d'au moins 5 %, et retour à la meilleure taille.
+
+⚙️ Configuration (variables d'environnement) :
+  • EMBED_WORKERS (défaut min(4, nombre de CPU)) : 0 = décodage en ligne
+  • EMBED_PREFETCH (défaut 2) : lots décodés d'avance
+  • EMBED_BATCH_SIZE (défaut auto) : taille fixe, ou "auto"
+  • EMBED_MAX_BATCH_SIZE (défaut 256)
+==============================================================
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+
+
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", str(min(4, os.cpu_count() or 1))))
+EMBED_PREFETCH = int(os.getenv("EMBED_PREFETCH", "2"))
+EMBED_BATCH_SIZE = os.getenv("EMBED_BATCH_SIZE", "auto")
+EMBED_MAX_BATCH_SIZE = int(os.getenv("EMBED_MAX_BATCH_SIZE", "256"))
+# Mémoire de pointe d'une image pendant le forward, en multiples de son tenseur d'entrée
+ACTIVATION_FACTOR = 40
+# Part de la mémoire disponible réservée aux lots
+MEMORY_BUDGET = 0.5
+
+
+def available_memory(device: torch.device) -> int:
+    """Mémoire disponible (octets) : mémoire libre du GPU, ou RAM bornée par le cgroup."""
+    if device.type == "cuda":
+        free, _ = torch.cuda.mem_get_info(device)
+        return free
+    available = os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    available = int(line.split()[1]) * 1024
+                    break
+    except OSError:
+        pass
+    try:
+        # Conteneur (cgroup v2) : limite moins la consommation courante
+        with open("/sys/fs/cgroup/memory.max") as f:
+            limit = f.read().strip()
+        if limit != "max":
+            with open("/sys/fs/cgroup/memory.current") as f:
+                available = min(available, int(limit) - int(f.read()))
+    except (OSError, ValueError):
+        pass
+    return max(available, 0)
+
+
+def max_batch_for_memory(image_size: int, device: torch.device) -> int:
+    """Plus grande taille de lot tenant dans MEMORY_BUDGET de la mémoire disponible."""
+    per_image = 3 * image_size * image_size * 4 * ACTIVATION_FACTOR
+    return max(1, int(available_memory(device) * MEMORY_BUDGET // per_image))
+
+
+class AdaptiveBatchSizer:
+    """Taille de lot choisie par le débit mesuré, sous un plafond mémoire."""
+
+    def __init__(self, initial: int = 32, maximum: int = EMBED_MAX_BATCH_SIZE) -> None:
+        self.maximum = max(1, maximum)
+        self.batch_size = min(initial, self.maximum)
+        self.best_size = self.batch_size
+        self.best_throughput = 0.0
+        self.settled = self.batch_size >= self.maximum
+        self._warm = False
+        self.history = []
+
+    def record(self, batch_size: int, seconds: float) -> None:
+        """Enregistre le temps de forward d'un lot et ajuste la taille des suivants."""
+        if self.settled or batch_size != self.batch_size or seconds <= 0:
+            return
+        if not self._warm:
+            self._warm = True  # premier lot : initialisation du backbone, non mesuré
+            return
+        throughput = batch_size / seconds
+        self.history.append((batch_size, throughput))
+        if throughput > self.best_throughput * 1.05:
+            self.best_size, self.best_throughput = batch_size, throughput
+            if batch_size * 2 <= self.maximum:
+                self.batch_size = batch_size * 2
+                return
+        self.batch_size = self.best_size
+        self.settled = True
+
+
+class FixedBatchSizer:
+    def __init__(self, batch_size: int) -> None:
+        self.batch_size = batch_size
+
+    def record(self, batch_size: int, seconds: float) -> None:
+        pass
+
+
+class ImageBatchLoader:
+    """Lots de tenseurs normalisés décodés sur un pool de threads, avec lots d'avance."""
+
+    def __init__(
+        self,
+        load_tensor,
+        device: torch.device,
+        workers: int = EMBED_WORKERS,
+        prefetch: int = EMBED_PREFETCH,
+    ) -> None:
+        self.load_tensor = load_tensor
+        self.pin_memory = device.type == "cuda"
+        self.prefetch = max(1, prefetch)
+        self._executor = ThreadPoolExecutor(workers, "image-loader") if workers > 0 else None
+        # Un buffer épinglé par thread appelant (les workers de l'API embarquent en parallèle)
+        self._local = threading.local()
+
+    def _decode(self, items: list) -> list:
+        if self._executor is None:
+            return [self.load_tensor(item) for item in items]
+        return [self._executor.submit(self.load_tensor, item) for item in items]
+
+    def _stack(self, tensors: list) -> torch.Tensor:
+        if not self.pin_memory:
+            return torch.stack(tensors)
+        shape = (len(tensors), *tensors[0].shape)
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is None or buffer.shape[0] < shape[0] or buffer.shape[1:] != shape[1:]:
+            buffer = torch.empty(shape, dtype=tensors[0].dtype).pin_memory()
+            self._local.buffer = buffer
+        return torch.stack(tensors, out=buffer[: shape[0]])
+
+    def batches(self, items: list, sizer):
+        """
+        Itère sur `(positions, lot)` ; la taille de chaque lot est lue sur `sizer`
+        au moment où il est soumis au pool.
+        """
+        pending = deque()
+        start = 0
+        while start < len(items) or pending:
+            while start < len(items) and len(pending) <= self.prefetch:
+                size = sizer.batch_size
+                positions = range(start, min(start + size, len(items)))
+                pending.append((positions, self._decode([items[i] for i in positions])))
+                start = positions.stop
+            positions, decoded = pending.popleft()
+            if self._executor is not None:
+                decoded = [future.result() for future in decoded]
+            yield list(positions), self._stack(decoded)
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+
+
+def make_batch_sizer(batch_size, image_size: int, device: torch.device):
+    """Taille fixe (entier) ou adaptative ("auto", plafonnée par la mémoire disponible)."""
+    if batch_size != "auto":
+        return FixedBatchSizer(int(batch_size))
+    maximum = min(EMBED_MAX_BATCH_SIZE, max_batch_for_memory(image_size, device))
+    return AdaptiveBatchSizer(initial=32, maximum=maximum)
+
+
+def timed_embed(embed, xb: torch.Tensor, sizer):
+    """Forward d'un lot, mesuré pour le choix de la taille des lots suivants."""
+    start = time.perf_counter()
+    emb = embed(xb)
+    sizer.record(len(xb), time.perf_counter() - start)
+    return emb
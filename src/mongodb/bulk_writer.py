@@ -0,0 +1,191 @@
+"""
+==============================================================
+📤 Module : bulk_writer.py — Écritures MongoDB groupées en tâche de fond
+==============================================================
+
+`BulkMongoWriter` accumule des documents (ou des opérations pymongo
+`InsertOne`, `UpdateOne`, `ReplaceOne`…) et les envoie par lots :
+
+  • un lot part dès `max_docs` documents ou `max_bytes` octets estimés,
+  • les lots sont écrits par un thread dédié avec
+    `insert_many(ordered=False)` (documents seuls) ou
+    `bulk_write(ordered=False)` (opérations),
+  • la file des lots est bornée (`max_pending`) : quand MongoDB ne suit
+    plus, `write()` bloque le producteur (backpressure) au lieu
+    d'accumuler les documents en mémoire.
+
+Une erreur d'écriture est relevée au `write()` ou au `close()` suivant.
+`stats()` donne documents/s, octets/s et le temps passé bloqué.
+
+Utilisation :
+    with BulkMongoWriter(mongo.db["X_train_cleaned"]) as writer:
+        for doc in docs:
+            writer.write(doc)
+==============================================================
+"""
+
+import os
+import queue
+import threading
+import time
+
+from pymongo import InsertOne
+
+
+MONGO_BATCH_DOCS = int(os.getenv("MONGO_BATCH_DOCS", "500"))
+MONGO_BATCH_MB = float(os.getenv("MONGO_BATCH_MB", "16"))
+MONGO_MAX_PENDING = int(os.getenv("MONGO_MAX_PENDING", "4"))
+_STOP = object()
+
+
+def estimate_size(doc: dict) -> int:
+    """Taille approximative d'un document une fois encodé en BSON (sans l'encoder)."""
+    size = 5
+    for key, value in doc.items():
+        size += len(key) + 2
+        if isinstance(value, (bytes, str)):
+            size += len(value) + 5
+        elif isinstance(value, dict):
+            size += estimate_size(value)
+        elif isinstance(value, (list, tuple)):
+            size += sum(estimate_size(v) if isinstance(v, dict) else 16 for v in value) + 5
+        else:
+            size += 8
+    return size
+
+
+class BulkMongoWriter:
+    """Écrit par lots, sur un thread dédié, les documents passés à `write()`."""
+
+    def __init__(
+        self,
+        collection,
+        max_docs: int = MONGO_BATCH_DOCS,
+        max_bytes: int = int(MONGO_BATCH_MB * 2**20),
+        max_pending: int = MONGO_MAX_PENDING,
+    ) -> None:
+        self.collection = collection
+        self.max_docs = max_docs
+        self.max_bytes = max_bytes
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._batch, self._batch_bytes = [], 0
+        self._thread = None
+        self._error = None
+        self._closed = False
+
+        self.docs = 0
+        self.bytes = 0
+        self.batches = 0
+        self.write_s = 0.0
+        self.blocked_s = 0.0
+        self._start = None
+        self._end = None
+
+    def __enter__(self) -> "BulkMongoWriter":
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close(flush=exc_type is None)
+
+    def start(self) -> "BulkMongoWriter":
+        self._start = time.perf_counter()
+        self._thread = threading.Thread(
+            target=self._run, name=f"bulk-writer-{self.collection.name}", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def write(self, item, size: int | None = None) -> None:
+        """Ajoute un document (dict) ou une opération pymongo au lot courant."""
+        self._raise_error()
+        if size is None:
+            size = estimate_size(item) if isinstance(item, dict) else 0
+        self._batch.append(item)
+        self._batch_bytes += size
+        if len(self._batch) >= self.max_docs or self._batch_bytes >= self.max_bytes:
+            self.flush()
+
+    def write_many(self, items) -> None:
+        for item in items:
+            self.write(item)
+
+    def flush(self) -> None:
+        """Confie le lot courant au thread d'écriture (bloque si la file est pleine)."""
+        if not self._batch:
+            return
+        batch = (self._batch, self._batch_bytes)
+        self._batch, self._batch_bytes = [], 0
+        self._put(batch)
+
+    def close(self, flush: bool = True) -> dict:
+        """
+        Envoie le dernier lot, attend la fin des écritures et retourne les statistiques.
+
+        `flush=False` (sortie sur exception) abandonne le lot courant sans relever
+        d'erreur d'écriture, pour ne pas masquer l'exception d'origine.
+        """
+        if self._closed:
+            return self.stats()
+        self._closed = True
+        if flush and self._error is None:
+            self.flush()
+        self._put(_STOP)
+        self._thread.join()
+        self._end = time.perf_counter()
+        if flush:
+            self._raise_error()
+        return self.stats()
+
+    def stats(self) -> dict:
+        end = self._end or time.perf_counter()
+        elapsed = end - self._start if self._start is not None else 0.0
+        return {
+            "collection": self.collection.name,
+            "docs": self.docs,
+            "bytes": self.bytes,
+            "batches": self.batches,
+            "elapsed_s": elapsed,
+            "write_s": self.write_s,
+            "blocked_s": self.blocked_s,
+            "docs_per_s": self.docs / elapsed if elapsed else 0.0,
+            "bytes_per_s": self.bytes / elapsed if elapsed else 0.0,
+        }
+
+    def _put(self, item) -> None:
+        start = time.perf_counter()
+        while True:
+            try:
+                self._queue.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                # Thread d'écriture arrêté : la place ne se libérera plus
+                if not self._thread.is_alive():
+                    break
+        self.blocked_s += time.perf_counter() - start
+
+    def _raise_error(self) -> None:
+        if self._error is not None:
+            raise self._error
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            if self._error is not None:
+                continue  # on vide la file sans écrire après une erreur
+            batch, size = item
+            start = time.perf_counter()
+            try:
+                if all(isinstance(doc, dict) for doc in batch):
+                    self.collection.insert_many(batch, ordered=False)
+                else:
+                    operations = [InsertOne(op) if isinstance(op, dict) else op for op in batch]
+                    self.collection.bulk_write(operations, ordered=False)
+            except Exception as e:
+                self._error = e
+                continue
+            self.write_s += time.perf_counter() - start
+            self.docs += len(batch)
+            self.bytes += size
+            self.batches += 1
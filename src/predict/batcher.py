@@ -0,0 +1,133 @@
+"""
+==============================================================
+📦 Module : batcher.py — Micro-batching dynamique des prédictions
+==============================================================
+
+Les requêtes concurrentes de /predict sont mises en file d'attente
+et regroupées par un thread dédié. Un lot est envoyé au runtime dès
+que l'une des deux conditions est atteinte :
+  • `max_batch_size` documents sont en attente,
+  • le plus ancien document attend depuis `max_wait_ms` millisecondes.
+
+Chaque lot déclenche une seule transformation TF-IDF, une seule passe
+ResNet50 et un seul `predict` XGBoost ; le résultat de chaque document
+est renvoyé à son appelant via un `concurrent.futures.Future`.
+
+⚙️ Configuration (variables d'environnement) :
+  • PREDICT_MAX_BATCH_SIZE (défaut 32, 1 = micro-batching désactivé)
+  • PREDICT_MAX_WAIT_MS    (défaut 10)
+==============================================================
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from src.api.metrics import STAGE_SECONDS, observe_batch
+from src.predict.runtime import get_runtime
+
+
+MAX_BATCH_SIZE = int(os.getenv("PREDICT_MAX_BATCH_SIZE", "32"))
+MAX_WAIT_MS = float(os.getenv("PREDICT_MAX_WAIT_MS", "10"))
+
+_STOP = object()
+
+
+class MicroBatcher:
+    """
+    File d'attente de documents nettoyés vidée par lots vers le runtime.
+
+    `submit()` est thread-safe et peut être appelé depuis les threads
+    du threadpool FastAPI ; il retourne immédiatement un Future.
+    """
+
+    def __init__(self, runtime=None, max_batch_size: int = None, max_wait_ms: float = None):
+        self.runtime = runtime
+        self.max_batch_size = max_batch_size or MAX_BATCH_SIZE
+        self.max_wait = (MAX_WAIT_MS if max_wait_ms is None else max_wait_ms) / 1000
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self) -> "MicroBatcher":
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="micro-batcher", daemon=True
+                )
+                self._thread.start()
+        return self
+
+    def stop(self, timeout: float | None = None) -> None:
+        with self._lock:
+            if self._thread is not None:
+                self._queue.put(_STOP)
+                self._thread.join(timeout)
+                self._thread = None
+
+    def submit(self, doc: dict) -> Future:
+        """Ajoute un document nettoyé à la file et retourne le Future de son code prédit."""
+        future = Future()
+        self._queue.put((doc, future, time.perf_counter()))
+        if self._thread is None:
+            self.start()
+        return future
+
+    def _collect(self, first) -> tuple[list, bool]:
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            batch, stop = self._collect(item)
+            self._flush(batch)
+            if stop:
+                return
+
+    def _flush(self, batch: list) -> None:
+        docs = [doc for doc, _, _ in batch]
+        futures = [future for _, future, _ in batch]
+        # Attente dans la file du plus ancien document du lot
+        STAGE_SECONDS.labels("batch_wait").observe(time.perf_counter() - batch[0][2])
+        observe_batch("micro_batcher", len(batch))
+        try:
+            runtime = self.runtime or get_runtime()
+            codes = runtime.predict_codes(docs)
+        except Exception as e:
+            for future in futures:
+                future.set_exception(e)
+            return
+        for future, code in zip(futures, codes, strict=True):
+            future.set_result(code)
+
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+
+def get_batcher() -> MicroBatcher | None:
+    """Retourne le batcher partagé du processus, ou None si PREDICT_MAX_BATCH_SIZE vaut 1."""
+    global _batcher
+    if MAX_BATCH_SIZE <= 1:
+        return None
+    with _batcher_lock:
+        if _batcher is None:
+            _batcher = MicroBatcher().start()
+        return _batcher
@@ -0,0 +1,488 @@
+"""
+==============================================================
+📦 Module : bulk_score.py — Scoring en masse du catalogue de test
+==============================================================
+
+Score tout `X_test_update.csv` (ou la collection `X_test_cleaned`)
+par blocs de lignes, au lieu d'une prédiction à la fois. Chaque bloc
+traverse un pipeline d'étapes qui tournent en parallèle, chacune dans
+son thread, reliées par des files bornées :
+
+  lecture → nettoyage → TF-IDF → embeddings image → XGBoost → écriture
+
+  • lecture    : bloc de lignes du CSV, ou bloc d'`id` triés (Mongo)
+  • nettoyage  : CSV → lecture des images + clean_one_row (pool de
+                 processus optionnel) ; Mongo → chargement des
+                 documents déjà nettoyés du bloc
+  • TF-IDF, embeddings image, XGBoost : runtime de prédiction
+    (voir runtime.py), XGBoost sans DMatrix (voir fusion.py)
+  • écriture   : un fichier Parquet par bloc (`part-00012.parquet`),
+                 ou écritures Mongo groupées (`bulk_write`)
+
+Reprise : les blocs déjà écrits sont sautés dès la lecture. Le
+découpage dépend de la source, de la taille de bloc et de `--since-id` ;
+il est enregistré avec la version du modèle (manifest Parquet ou
+collection `bulk_scoring_state`) et une reprise incompatible est
+refusée (`--restart` repart de zéro). Pour Mongo, les bornes des blocs
+(premier `id` de chaque bloc, dernier `id`) sont figées au premier
+passage et relues à la reprise : des documents insérés entre-temps ne
+décalent pas les blocs. `--since-id` ne score que les lignes ajoutées
+depuis le dernier passage (deltas nocturnes).
+
+En fin de run, chaque étape affiche son débit (lignes/s de temps actif)
+et le débit global.
+
+🔁 Exemple d'exécution :
+------------------------
+$ python -m src.predict.bulk_score --source csv --output parquet --chunk-size 512 --clean-workers 4
+$ python -m src.predict.bulk_score --source mongo --output mongo --since-id 84915
+==============================================================
+"""
+
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import pairwise
+
+import numpy as np
+import pandas as pd
+from PIL import Image
+
+from src.data.clean_data import clean_one_row
+from src.data.image_manifest import get_image_manifest
+from src.predict.catalog import image_filename
+from src.predict.fusion import predict_fused
+
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
+RAW_DIR = os.path.join(BASE_DIR, "data", "raw")
+IMG_DIR = os.path.join(RAW_DIR, "images", "images")
+DATA_DIR = os.path.join(BASE_DIR, "data", "processed")
+
+STAGES = ("lecture", "nettoyage", "tfidf", "images", "xgboost", "écriture")
+_STOP = object()
+
+
+def same_run(previous: dict, run: dict) -> bool:
+    """Runs compatibles pour une reprise : le découpage figé (`boundaries`) n'est pas comparé."""
+    return {k: v for k, v in previous.items() if k != "boundaries"} == {
+        k: v for k, v in run.items() if k != "boundaries"
+    }
+
+
+class PipelineAborted(Exception):
+    """Une autre étape a échoué : l'étape courante s'arrête sans traiter la suite."""
+
+
+# ---------- Sources ----------
+def _clean_csv_row(row: tuple) -> dict:
+    """Nettoie une ligne du CSV dont l'image a été résolue par le manifeste."""
+    row_id, designation, description, image_path, image_format = row
+    with Image.open(image_path) as img:
+        doc = clean_one_row(designation, description, img, image_format)
+    doc["id"] = row_id
+    return doc
+
+
+class CsvSource:
+    """Blocs de `X_test_update.csv` ; les images sont lues et nettoyées à l'étape de nettoyage."""
+
+    name = "csv"
+
+    def __init__(
+        self,
+        csv_path: str = os.path.join(RAW_DIR, "X_test_update.csv"),
+        images_dir: str = os.path.join(IMG_DIR, "image_test"),
+        clean_workers: int = 1,
+        image_format: str = "jpeg",
+    ) -> None:
+        self.csv_path = csv_path
+        self.images_dir = images_dir
+        self.clean_workers = clean_workers
+        self.image_format = image_format
+        self._executor = None
+
+    def __enter__(self):
+        if self.clean_workers > 1:
+            self._executor = ProcessPoolExecutor(
+                self.clean_workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self
+
+    def __exit__(self, *exc):
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+
+    def boundaries(self, chunk_size: int, since_id: int | None = None) -> None:
+        # Blocs positionnels : un CSV n'est complété que par la fin
+        return None
+
+    def chunks(self, chunk_size: int, since_id: int | None = None, boundaries=None):
+        reader = pd.read_csv(self.csv_path, chunksize=chunk_size)
+        for index, df in enumerate(reader):
+            df = df.rename(columns={df.columns[0]: "id"})
+            if since_id is not None:
+                df = df[df["id"] > since_id]
+            yield index, df
+
+    def clean(self, df: pd.DataFrame) -> list[dict]:
+        # Images résolues par le manifeste du dossier : les lignes sans image sont ignorées
+        manifest = get_image_manifest(self.images_dir).load()
+        rows = []
+        for row in df.itertuples(index=False):
+            image_path = manifest.canonical_path(image_filename(row.imageid, row.productid))
+            if image_path is not None:
+                rows.append(
+                    (int(row.id), row.designation, row.description, image_path, self.image_format)
+                )
+        if self._executor is None:
+            return list(map(_clean_csv_row, rows))
+        return list(self._executor.map(_clean_csv_row, rows, chunksize=16))
+
+
+class MongoSource:
+    """Blocs d'`id` triés de `X_test_cleaned` ; les documents sont chargés au nettoyage."""
+
+    name = "mongo"
+
+    def __init__(self, db, collection: str = "X_test_cleaned") -> None:
+        self.collection = db[collection]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return None
+
+    def _ids(self, query: dict) -> list:
+        return [doc["id"] for doc in self.collection.find(query, {"_id": 0, "id": 1}).sort("id", 1)]
+
+    def boundaries(self, chunk_size: int, since_id: int | None = None) -> list:
+        """Premier `id` de chaque bloc puis dernier `id` : découpage figé pour la reprise."""
+        ids = self._ids({} if since_id is None else {"id": {"$gt": since_id}})
+        if not ids:
+            return []
+        return ids[::chunk_size] + [ids[-1]]
+
+    def chunks(self, chunk_size: int, since_id: int | None = None, boundaries=None):
+        if boundaries is None:
+            boundaries = self.boundaries(chunk_size, since_id)
+        # Bloc i : [bornes[i], bornes[i + 1]), le dernier inclut sa borne haute
+        for index, (low, high) in enumerate(pairwise(boundaries)):
+            upper = "$lte" if index == len(boundaries) - 2 else "$lt"
+            yield index, self._ids({"id": {"$gte": low, upper: high}})
+
+    def clean(self, ids: list) -> list[dict]:
+        projection = {"_id": 0, "id": 1, "designation": 1, "description": 1, "image_binary": 1}
+        docs = {doc["id"]: doc for doc in self.collection.find({"id": {"$in": ids}}, projection)}
+        return [docs[i] for i in ids if i in docs]
+
+
+# ---------- Sorties ----------
+class ParquetSink:
+    """Un fichier Parquet par bloc, écrit de façon atomique ; `_manifest.json` décrit le run."""
+
+    def __init__(self, output_dir: str = os.path.join(DATA_DIR, "predictions")) -> None:
+        self.output_dir = output_dir
+        self.manifest_path = os.path.join(output_dir, "_manifest.json")
+
+    def _part_path(self, index: int) -> str:
+        return os.path.join(self.output_dir, f"part-{index:05d}.parquet")
+
+    def start(self, run: dict, restart: bool = False) -> tuple[set[int], dict]:
+        """Prépare la sortie ; retourne les blocs déjà écrits et le run (repris s'il existe)."""
+        os.makedirs(self.output_dir, exist_ok=True)
+        parts = glob.glob(os.path.join(self.output_dir, "part-*.parquet"))
+        if restart:
+            for path in parts:
+                os.remove(path)
+            parts = []
+        if parts:
+            with open(self.manifest_path) as f:
+                previous = json.load(f)
+            if not same_run(previous, run):
+                raise ValueError(
+                    f"{self.output_dir} contient un run différent ({previous}) : "
+                    "utiliser --restart ou un autre dossier de sortie"
+                )
+            run = previous
+        with open(self.manifest_path, "w") as f:
+            json.dump(run, f, indent=2)
+        return {int(os.path.basename(p)[5:10]) for p in parts}, run
+
+    def write(self, index: int, df: pd.DataFrame) -> None:
+        path = self._part_path(index)
+        df.to_parquet(f"{path}.tmp", index=False)
+        os.replace(f"{path}.tmp", path)
+
+
+class MongoSink:
+    """Upserts groupés dans `X_test_predictions` ; blocs terminés dans `bulk_scoring_state`."""
+
+    def __init__(self, db, collection: str = "X_test_predictions") -> None:
+        self.collection = db[collection]
+        self.state = db["bulk_scoring_state"]
+        self.state_id = collection
+
+    def start(self, run: dict, restart: bool = False) -> tuple[set[int], dict]:
+        self.collection.create_index("id", unique=True)
+        state = self.state.find_one({"_id": self.state_id})
+        if state is None or restart or not state["chunks"]:
+            self.state.replace_one({"_id": self.state_id}, {"run": run, "chunks": []}, upsert=True)
+            return set(), run
+        if not same_run(state["run"], run):
+            raise ValueError(
+                f"Run précédent différent ({state['run']}) : utiliser --restart pour repartir de zéro"
+            )
+        return set(state["chunks"]), state["run"]
+
+    def write(self, index: int, df: pd.DataFrame) -> None:
+        from pymongo import UpdateOne
+
+        operations = [
+            UpdateOne({"id": record["id"]}, {"$set": record}, upsert=True)
+            for record in df.to_dict("records")
+        ]
+        if operations:
+            self.collection.bulk_write(operations, ordered=False)
+        self.state.update_one({"_id": self.state_id}, {"$addToSet": {"chunks": index}})
+
+
+# ---------- Pipeline ----------
+class StageStats:
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.rows = 0
+        self.chunks = 0
+        self.busy_s = 0.0
+
+    def as_dict(self) -> dict:
+        rate = self.rows / self.busy_s if self.busy_s else 0.0
+        return {"rows": self.rows, "chunks": self.chunks, "busy_s": self.busy_s, "rows_per_s": rate}
+
+
+class BulkScorer:
+    """
+    Pipeline à étapes parallèles (un thread par étape, files bornées).
+
+    Une erreur dans une étape arrête toutes les autres et est relevée
+    par `run()` ; les blocs déjà écrits restent acquis pour la reprise.
+    """
+
+    def __init__(self, runtime, source, sink, chunk_size: int = 512, queue_size: int = 4) -> None:
+        self.runtime = runtime
+        self.source = source
+        self.sink = sink
+        self.chunk_size = chunk_size
+        self.queue_size = queue_size
+        self.stats = {name: StageStats(name) for name in STAGES}
+        self._failed = threading.Event()
+        self._errors = []
+
+    # --- Étapes : chacune reçoit et retourne un dict décrivant le bloc ---
+    def _clean(self, batch: dict) -> dict:
+        docs = self.source.clean(batch.pop("raw"))
+        batch["ids"] = [doc["id"] for doc in docs]
+        batch["texts"] = [
+            (doc.get("designation") or "") + " " + (doc.get("description") or "") for doc in docs
+        ]
+        batch["images"] = [doc["image_binary"] for doc in docs]
+        return batch
+
+    def _tfidf(self, batch: dict) -> dict:
+        batch["X_text"] = self.runtime.preprocessor.transform_text(batch.pop("texts"))
+        return batch
+
+    def _images(self, batch: dict) -> dict:
+        batch["X_img"] = self.runtime.preprocessor.embed_images(batch.pop("images"))
+        return batch
+
+    def _xgboost(self, batch: dict) -> dict:
+        from src.predict.predict import cat_map
+
+        codes, confidence = [], np.empty(0, dtype=np.float32)
+        if batch["ids"]:
+            proba = predict_fused(self.runtime.bst, batch.pop("X_text"), batch.pop("X_img"))
+            best = np.argmax(proba, axis=1)
+            codes = [int(c) for c in self.runtime.encoder.inverse_transform(best)]
+            confidence = proba[np.arange(len(best)), best]
+        batch["result"] = pd.DataFrame(
+            {
+                "id": batch["ids"],
+                "predicted_code": codes,
+                "category": [cat_map.get(code, "Non défini") for code in codes],
+                "confidence": confidence.astype(float),
+                "model_version": self.runtime.model_version,
+            }
+        )
+        return batch
+
+    def _write(self, batch: dict) -> dict:
+        self.sink.write(batch["index"], batch["result"])
+        return batch
+
+    # --- Orchestration ---
+    def _put(self, q: queue.Queue, item) -> None:
+        while True:
+            if self._failed.is_set():
+                raise PipelineAborted
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _get(self, q: queue.Queue):
+        while True:
+            if self._failed.is_set():
+                raise PipelineAborted
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+    def _run_reader(self, chunks, outbox: queue.Queue) -> None:
+        stats = self.stats["lecture"]
+        try:
+            iterator = iter(chunks)
+            while True:
+                start = time.perf_counter()
+                item = next(iterator, _STOP)
+                stats.busy_s += time.perf_counter() - start
+                if item is _STOP:
+                    break
+                index, raw = item
+                stats.rows += len(raw)
+                stats.chunks += 1
+                self._put(outbox, {"index": index, "raw": raw})
+            self._put(outbox, _STOP)
+        except PipelineAborted:
+            pass
+        except BaseException as e:
+            self._errors.append(e)
+            self._failed.set()
+
+    def _run_stage(self, name: str, fn, inbox: queue.Queue, outbox: queue.Queue | None) -> None:
+        stats = self.stats[name]
+        try:
+            while True:
+                batch = self._get(inbox)
+                if batch is _STOP:
+                    break
+                start = time.perf_counter()
+                batch = fn(batch)
+                stats.busy_s += time.perf_counter() - start
+                stats.rows += len(batch["ids"])
+                stats.chunks += 1
+                if outbox is None:
+                    print(f"💾 Bloc {batch['index']} écrit ({len(batch['ids'])} lignes)")
+                else:
+                    self._put(outbox, batch)
+            if outbox is not None:
+                self._put(outbox, _STOP)
+        except PipelineAborted:
+            pass
+        except BaseException as e:
+            self._errors.append(e)
+            self._failed.set()
+
+    def run(self, since_id: int | None = None, restart: bool = False) -> dict:
+        """Score tous les blocs restants et retourne le rapport de débit par étape."""
+        run = {
+            "source": self.source.name,
+            "chunk_size": self.chunk_size,
+            "since_id": since_id,
+            "model_version": self.runtime.model_version,
+            "boundaries": self.source.boundaries(self.chunk_size, since_id),
+        }
+        # Reprise : découpage du run enregistré, pas celui de la source actuelle
+        done, run = self.sink.start(run, restart=restart)
+        if done:
+            print(f"⏩ Reprise : {len(done)} bloc(s) déjà écrits")
+        chunks = (
+            (index, raw)
+            for index, raw in self.source.chunks(self.chunk_size, since_id, run["boundaries"])
+            if index not in done
+        )
+
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in STAGES[1:]]
+        steps = (self._clean, self._tfidf, self._images, self._xgboost, self._write)
+        threads = [threading.Thread(target=self._run_reader, args=(chunks, queues[0]))]
+        for i, (name, fn) in enumerate(zip(STAGES[1:], steps, strict=True)):
+            outbox = queues[i + 1] if i + 1 < len(queues) else None
+            threads.append(
+                threading.Thread(target=self._run_stage, args=(name, fn, queues[i], outbox))
+            )
+
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        wall_s = time.perf_counter() - start
+        if self._errors:
+            raise self._errors[0]
+
+        written = self.stats["écriture"].rows
+        report = {
+            "run": run,
+            "rows": written,
+            "skipped_chunks": len(done),
+            "wall_s": wall_s,
+            "rows_per_s": written / wall_s if wall_s else 0.0,
+            "stages": {name: stats.as_dict() for name, stats in self.stats.items()},
+        }
+        for name, stats in report["stages"].items():
+            print(
+                f"⏱️ {name:<10} {stats['rows']:>8} lignes | {stats['busy_s']:8.2f}s actives | "
+                f"{stats['rows_per_s']:10.1f} lignes/s"
+            )
+        print(f"✅ {written} lignes scorées en {wall_s:.2f}s ({report['rows_per_s']:.1f} lignes/s)")
+        return report
+
+
+def main():
+    from src.mongodb.conf_loader import MongoConfLoader
+    from src.mongodb.utils import MongoUtils
+    from src.predict.runtime import get_runtime
+
+    parser = argparse.ArgumentParser(description="Scoring en masse du catalogue de test.")
+    parser.add_argument("--source", choices=("csv", "mongo"), default="csv")
+    parser.add_argument("--output", choices=("parquet", "mongo"), default="parquet")
+    parser.add_argument("--output-dir", default=os.path.join(DATA_DIR, "predictions"))
+    parser.add_argument("--chunk-size", type=int, default=512)
+    parser.add_argument("--queue-size", type=int, default=4)
+    parser.add_argument("--clean-workers", type=int, default=1)
+    parser.add_argument("--since-id", type=int, default=None)
+    parser.add_argument("--restart", action="store_true")
+    args = parser.parse_args()
+
+    runtime = get_runtime().load()
+    mongo = None
+    if "mongo" in (args.source, args.output):
+        mongo_host = os.getenv("MONGO_HOST", "localhost")
+        mongo = MongoUtils(conf_loader=MongoConfLoader(), host=mongo_host)
+        mongo.connect()
+    try:
+        if args.source == "csv":
+            source = CsvSource(clean_workers=args.clean_workers, image_format=runtime.image_format)
+        else:
+            source = MongoSource(mongo.db)
+        sink = ParquetSink(args.output_dir) if args.output == "parquet" else MongoSink(mongo.db)
+        with source:
+            scorer = BulkScorer(runtime, source, sink, args.chunk_size, args.queue_size)
+            report = scorer.run(since_id=args.since_id, restart=args.restart)
+    finally:
+        if mongo is not None:
+            mongo.close()
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
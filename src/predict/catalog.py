@@ -0,0 +1,246 @@
+"""
+==============================================================
+📚 Module : catalog.py — Catalogue indexé des produits de test
+==============================================================
+
+L'API tirait une ligne au hasard en relisant `X_test_update.csv` à
+chaque requête, puis testait l'existence de l'image sur disque. Le
+catalogue lit le CSV une seule fois et en construit un index colonne
+par colonne dans un dossier `data/processed/catalog/build-<id>/` :
+
+  • row_id.npy, productid.npy, imageid.npy → colonnes int64 (memmap)
+  • designation_offsets.npy, description_offsets.npy + text.bin
+                                           → textes UTF-8 concaténés
+  • has_image.npy                          → table des images résolues
+
+`catalog/meta.json` (taille/date du CSV et du dossier d'images indexés,
+dossier `build-<id>` courant) est publié en dernier par `os.replace` :
+une reconstruction n'écrase jamais les fichiers que les workers de
+l'API ont memory-mappés, elle écrit un nouveau dossier puis bascule
+dessus ; les anciens dossiers sont supprimés (les mappings ouverts
+restent valides jusqu'à leur fermeture).
+
+L'index est reconstruit seulement si le CSV ou le dossier d'images a
+changé ; sinon il est simplement memory-mappé. Les recherches par
+`productid` ou par identifiant de ligne sont en O(1), et le tirage
+aléatoire ne touche que la ligne tirée.
+
+⚙️ Configuration (variables d'environnement) :
+  • CATALOG_DIR (défaut data/processed/catalog)
+==============================================================
+"""
+
+import fcntl
+import json
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
+RAW_DIR = os.path.join(BASE_DIR, "data", "raw")
+IMG_DIR = os.path.join(RAW_DIR, "images", "images")
+DATA_DIR = os.path.join(BASE_DIR, "data", "processed")
+CATALOG_DIR = os.getenv("CATALOG_DIR", os.path.join(DATA_DIR, "catalog"))
+
+INT_COLUMNS = ("row_id", "productid", "imageid")
+TEXT_COLUMNS = ("designation", "description")
+
+
+def image_filename(imageid: int, productid: int) -> str:
+    return f"image_{imageid}_product_{productid}.jpg"
+
+
+def source_signature(csv_path: str, images_dir: str) -> dict:
+    """Identifie la version des sources indexées (taille et date du CSV, date du dossier d'images)."""
+    csv_stat = os.stat(csv_path)
+    images_mtime = os.stat(images_dir).st_mtime_ns if os.path.isdir(images_dir) else None
+    return {
+        "csv_size": csv_stat.st_size,
+        "csv_mtime_ns": csv_stat.st_mtime_ns,
+        "images_mtime_ns": images_mtime,
+    }
+
+
+class ProductCatalog:
+    """Index memory-mappé des produits de `X_test_update.csv` et de leurs images."""
+
+    def __init__(
+        self,
+        csv_path: str = os.path.join(RAW_DIR, "X_test_update.csv"),
+        images_dir: str = os.path.join(IMG_DIR, "image_test"),
+        index_dir: str = CATALOG_DIR,
+    ) -> None:
+        self.csv_path = csv_path
+        self.images_dir = images_dir
+        self.index_dir = index_dir
+        self.columns = {}
+        self.text = None
+        self.by_productid = {}
+        self.by_row_id = {}
+        self.with_image = None
+        self.error = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def __len__(self) -> int:
+        return len(self.columns["row_id"]) if self.columns else 0
+
+    def load(self) -> "ProductCatalog":
+        """Construit l'index si les sources ont changé, puis le memory-mappe."""
+        with self._lock:
+            if self.ready:
+                return self
+            try:
+                os.makedirs(self.index_dir, exist_ok=True)
+                # Verrou fichier : un seul processus (worker uvicorn) reconstruit l'index
+                with open(os.path.join(self.index_dir, ".lock"), "a+") as lock_file:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                    signature = source_signature(self.csv_path, self.images_dir)
+                    meta = self._read_meta()
+                    if meta is None or meta.get("source") != signature:
+                        meta = self.build(signature)
+                    # Sous le verrou : la version ouverte ne peut pas être supprimée entre-temps
+                    self._open(meta)
+            except Exception as e:
+                self.error = str(e)
+                raise
+            self.error = None
+            self._ready.set()
+            print(f"📚 Catalogue prêt : {len(self)} produits, {len(self.with_image)} avec image")
+        return self
+
+    def _read_meta(self) -> dict | None:
+        try:
+            with open(os.path.join(self.index_dir, "meta.json")) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _build_dir(self, meta: dict) -> str:
+        # Sans "build" : index d'une version antérieure, écrit à plat dans index_dir
+        return os.path.join(self.index_dir, meta.get("build", ""))
+
+    def build(self, signature: dict) -> dict:
+        """
+        Lit le CSV une fois, écrit les colonnes, les textes et la table des images dans
+        un nouveau dossier puis le publie ; retourne le nouveau meta.json.
+        """
+        print(f"🗂️ Indexation du catalogue {self.csv_path}...")
+        df = pd.read_csv(self.csv_path)
+        columns = {
+            "row_id": df.iloc[:, 0].to_numpy(dtype=np.int64),
+            "productid": df["productid"].to_numpy(dtype=np.int64),
+            "imageid": df["imageid"].to_numpy(dtype=np.int64),
+        }
+
+        # Un seul scan du dossier au lieu d'un os.path.exists par requête
+        existing = set(os.listdir(self.images_dir)) if os.path.isdir(self.images_dir) else set()
+        columns["has_image"] = np.fromiter(
+            (
+                image_filename(imageid, productid) in existing
+                for imageid, productid in zip(columns["imageid"], columns["productid"], strict=True)
+            ),
+            dtype=bool,
+            count=len(df),
+        )
+
+        blob = bytearray()
+        for name in TEXT_COLUMNS:
+            # Description absente (NaN dans le CSV) → chaîne vide
+            encoded = [value.encode("utf-8") for value in df[name].fillna("").astype(str)]
+            lengths = np.fromiter((len(b) for b in encoded), dtype=np.int64, count=len(encoded))
+            columns[f"{name}_offsets"] = len(blob) + np.concatenate(([0], np.cumsum(lengths)))
+            blob += b"".join(encoded)
+
+        build = f"build-{time.time_ns():x}"
+        build_dir = os.path.join(self.index_dir, build)
+        os.makedirs(build_dir)
+        for name, values in columns.items():
+            np.save(os.path.join(build_dir, f"{name}.npy"), values)
+        with open(os.path.join(build_dir, "text.bin"), "wb") as f:
+            f.write(blob)
+        # meta.json publié en dernier d'un seul os.replace : un index incomplet n'est jamais lu
+        meta = {"source": signature, "rows": len(df), "build": build}
+        tmp_path = os.path.join(build_dir, "meta.json")
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, os.path.join(self.index_dir, "meta.json"))
+        for entry in os.listdir(self.index_dir):
+            if entry.startswith("build-") and entry != build:
+                shutil.rmtree(os.path.join(self.index_dir, entry), ignore_errors=True)
+        return meta
+
+    def _open(self, meta: dict) -> None:
+        build_dir = self._build_dir(meta)
+        names = (*INT_COLUMNS, "has_image", *(f"{name}_offsets" for name in TEXT_COLUMNS))
+        self.columns = {
+            name: np.load(os.path.join(build_dir, f"{name}.npy"), mmap_mode="r") for name in names
+        }
+        text_path = os.path.join(build_dir, "text.bin")
+        self.text = (
+            np.memmap(text_path, dtype=np.uint8, mode="r")
+            if os.path.getsize(text_path)
+            else np.empty(0, dtype=np.uint8)
+        )
+        self.by_productid = {int(p): i for i, p in enumerate(self.columns["productid"])}
+        self.by_row_id = {int(r): i for i, r in enumerate(self.columns["row_id"])}
+        self.with_image = np.flatnonzero(self.columns["has_image"])
+
+    def _text(self, name: str, position: int) -> str:
+        offsets = self.columns[f"{name}_offsets"]
+        return bytes(self.text[offsets[position] : offsets[position + 1]]).decode("utf-8")
+
+    def row(self, position: int) -> dict:
+        """Ligne du catalogue à la position donnée ; `image_path` vaut None sans image."""
+        productid = int(self.columns["productid"][position])
+        imageid = int(self.columns["imageid"][position])
+        image_path = None
+        if self.columns["has_image"][position]:
+            image_path = os.path.join(self.images_dir, image_filename(imageid, productid))
+        return {
+            "row_id": int(self.columns["row_id"][position]),
+            "productid": productid,
+            "imageid": imageid,
+            "designation": self._text("designation", position),
+            "description": self._text("description", position),
+            "image_path": image_path,
+        }
+
+    def by_product(self, productid: int) -> dict | None:
+        position = self.by_productid.get(int(productid))
+        return None if position is None else self.row(position)
+
+    def by_row(self, row_id: int) -> dict | None:
+        position = self.by_row_id.get(int(row_id))
+        return None if position is None else self.row(position)
+
+    def sample(self, rng=np.random) -> dict:
+        """Tire un produit au hasard parmi ceux qui ont une image."""
+        if not len(self.with_image):
+            raise LookupError("Aucun produit du catalogue n'a d'image")
+        return self.row(int(self.with_image[rng.randint(len(self.with_image))]))
+
+    def stats(self) -> dict:
+        return {"products": len(self), "with_image": int(len(self.with_image))}
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog() -> ProductCatalog:
+    """Retourne le catalogue partagé du processus (non chargé tant que `load()` n'est pas appelé)."""
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = ProductCatalog()
+        return _catalog
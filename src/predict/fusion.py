@@ -0,0 +1,124 @@
+"""
+==============================================================
+⚡ Module : fusion.py — Inférence XGBoost fusion sans DMatrix
+==============================================================
+
+Le modèle `xgb_fusion.json` est entraîné sur `hstack([X_tfidf, X_img])`.
+À l'inférence, ce `hstack` (passage par COO puis conversion CSR) et la
+construction d'un `xgb.DMatrix` coûtent plus cher que le parcours des
+arbres pour un lot de quelques lignes.
+
+`fuse_features` construit directement la matrice CSR fusionnée à partir
+du CSR TF-IDF et du bloc dense d'embeddings, en une passe vectorisée,
+puis `predict_fused` la donne à `Booster.inplace_predict`.
+
+⚠️ Valeurs manquantes : `hstack` ne conserve pas les zéros du bloc dense,
+XGBoost les voit donc comme des valeurs manquantes à l'entraînement.
+`fuse_features` les écarte de la même façon, ce qui donne des
+probabilités identiques au chemin DMatrix.
+
+🔁 Mesure de latence :
+----------------------
+$ python -m src.predict.fusion --batch-sizes 1 8 32
+==============================================================
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+import xgboost as xgb
+from scipy import sparse
+
+
+def fuse_features(X_text, X_img: np.ndarray) -> sparse.csr_matrix:
+    """Équivalent CSR de `hstack([X_text, X_img])`, sans les zéros du bloc dense."""
+    X_text = sparse.csr_matrix(X_text)
+    X_img = np.asarray(X_img, dtype=np.float32)
+    n_rows, n_text = X_text.shape
+
+    mask = X_img != 0
+    img_counts = mask.sum(axis=1)
+    img_rows, img_cols = np.nonzero(mask)
+    text_counts = np.diff(X_text.indptr)
+    img_offsets = np.concatenate(([0], np.cumsum(img_counts)))
+
+    indptr = X_text.indptr + img_offsets
+    nnz = indptr[-1]
+    indices = np.empty(nnz, dtype=np.int32)
+    data = np.empty(nnz, dtype=np.float32)
+
+    # Ligne r : ses termes TF-IDF puis ses composantes d'embedding non nulles
+    text_pos = np.arange(X_text.nnz) + np.repeat(img_offsets[:-1], text_counts)
+    img_pos = np.arange(len(img_rows)) + np.repeat(X_text.indptr[1:], img_counts)
+    indices[text_pos] = X_text.indices
+    data[text_pos] = X_text.data
+    indices[img_pos] = img_cols + n_text
+    data[img_pos] = X_img[img_rows, img_cols]
+
+    return sparse.csr_matrix((data, indices, indptr), shape=(n_rows, n_text + X_img.shape[1]))
+
+
+def predict_fused(bst: xgb.Booster, X_text, X_img: np.ndarray) -> np.ndarray:
+    """Probabilités (n_lignes, n_classes) du booster fusion pour un lot, sans DMatrix."""
+    return bst.inplace_predict(fuse_features(X_text, X_img))
+
+
+def benchmark(model_path: str, n_text: int, batch_sizes, repeat: int = 200) -> dict:
+    """Compare la latence hstack + DMatrix et le chemin fusionné sur des lignes synthétiques."""
+    bst = xgb.Booster()
+    bst.load_model(model_path)
+    n_img = bst.num_features() - n_text
+    rng = np.random.default_rng(0)
+
+    report = {}
+    for batch_size in batch_sizes:
+        X_text = sparse.random(batch_size, n_text, density=0.002, format="csr", random_state=0)
+        X_img = np.maximum(rng.standard_normal((batch_size, n_img), dtype=np.float32), 0)
+
+        def dmatrix_path(X_text=X_text, X_img=X_img):
+            return bst.predict(xgb.DMatrix(sparse.hstack([X_text, X_img])))
+
+        def fused_path(X_text=X_text, X_img=X_img):
+            return predict_fused(bst, X_text, X_img)
+
+        np.testing.assert_allclose(dmatrix_path(), fused_path(), rtol=1e-5, atol=1e-6)
+        timings = {}
+        for name, fn in (("dmatrix", dmatrix_path), ("fused", fused_path)):
+            start = time.perf_counter()
+            for _ in range(repeat):
+                fn()
+            timings[name] = (time.perf_counter() - start) / repeat * 1000
+        report[batch_size] = timings
+        print(
+            f"⚡ lot de {batch_size:>3} | DMatrix {timings['dmatrix']:.2f} ms | "
+            f"fusionné {timings['fused']:.2f} ms | x{timings['dmatrix'] / timings['fused']:.1f}"
+        )
+    return report
+
+
+def main():
+    from src.predict.runtime import MODEL_DIR
+
+    parser = argparse.ArgumentParser(description="Latence de l'inférence fusion sans DMatrix.")
+    parser.add_argument("--model", default=os.path.join(MODEL_DIR, "xgb_fusion.json"))
+    parser.add_argument("--n-text", type=int, default=None, help="Nombre de colonnes TF-IDF")
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 8, 32])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    n_text = args.n_text
+    if n_text is None:
+        import joblib
+
+        from src.features.hashed_text import text_columns
+        from src.predict.runtime import DATA_DIR
+
+        tfidf = joblib.load(os.path.join(DATA_DIR, "tfidf_vectorizer.joblib"))
+        n_text = text_columns(tfidf)
+    benchmark(args.model, n_text, args.batch_sizes, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
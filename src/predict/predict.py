@@ -1,22 +1,14 @@
 # src/api/predict.py
 import argparse
-import base64
-import io
-import json
 import os
-from typing import Dict, Optional, Tuple
 
-import joblib
-import numpy as np
-import pandas as pd
-import torch
-import xgboost as xgb
 from PIL import Image
-from scipy.sparse import csr_matrix, hstack
-from torchvision import models, transforms
 
-from src.data.clean_data import clean_one_row
-from src.data.preprocess_data import Preprocessor
+from src.api.metrics import stage
+from src.data.clean_data import clean_text, normalize_image
+from src.predict.catalog import get_catalog
+from src.predict.runtime import get_runtime
+
 
 # === Dictionnaire des catégories ===
 cat_map = {
@@ -75,29 +67,31 @@ print("📂 MLRUNS_DIR :", MLRUNS_DIR)
 # ENCODER_PATH = os.getenv("ENCODER_PATH", os.path.join(MODEL_DIR, "label_encoder.joblib"))
 
 
-def predict(designation: str, description: str, image: Image) -> dict:
-    print("📦 Chargement des artefacts...")
-    bst = xgb.Booster()
-    bst.load_model(os.path.join(MODEL_DIR, "xgb_fusion.json"))
-    encoder = joblib.load(os.path.join(MODEL_DIR, "label_encoder.joblib"))
-
-    print("🧹 Data cleaning...")
-    data_cleaned = clean_one_row(designation, description, image)
-    #    print(data_cleaned)
-    df_clean = pd.DataFrame([data_cleaned])
-    df_clean["text"] = df_clean["designation"].fillna("") + " " + df_clean["description"].fillna("")
+def predict(designation: str, description: str, image: Image, batcher=None) -> dict:
+    return describe_prediction(predict_code(designation, description, image, batcher=batcher))
 
-    preprocessor = Preprocessor()
-    X_tfidf, X_img = preprocessor.preprocess_data(df_clean)
-    X = hstack([X_tfidf, X_img])
 
-    dtest = xgb.DMatrix(X)
-
-    # Prédiction
-    proba = bst.predict(dtest)[0]
-    pred_id = np.argmax(proba)
-    prdtypecode = encoder.inverse_transform([pred_id])[0]
+def predict_code(designation: str, description: str, image: Image, batcher=None) -> int:
+    # Les artefacts sont chargés une seule fois par processus (voir src/predict/runtime.py)
+    runtime = get_runtime().load()
 
+    print("🧹 Data cleaning...")
+    # Équivalent de clean_one_row, en deux étapes mesurées (voir src/api/metrics.py)
+    with stage("clean_text"):
+        data_cleaned = {
+            "designation": clean_text(designation),
+            "description": clean_text(description),
+        }
+    with stage("image_normalize"):
+        data_cleaned["image_binary"] = normalize_image(image, runtime.image_format)
+
+    # Prédiction : directe, ou regroupée avec les requêtes concurrentes (voir batcher.py)
+    if batcher is None:
+        return runtime.predict_codes([data_cleaned])[0]
+    return batcher.submit(data_cleaned).result()
+
+
+def describe_prediction(prdtypecode: int) -> dict:
     category = cat_map.get(int(prdtypecode), "Non défini")
     print(f"\n🎯 Code produit prédit : {prdtypecode}")
     print(f"🪄 Catégorie : {category}\n")
@@ -110,22 +104,26 @@ def predict(designation: str, description: str, image: Image) -> dict:
 
 # ---------- CLI ----------
 def main():
-    X_test = pd.read_csv(os.path.join(RAW_DIR, "X_test_update.csv"))
-    row = X_test.sample(n=1)
+    parser = argparse.ArgumentParser(description="Prédiction d'un produit du catalogue de test.")
+    parser.add_argument("--productid", type=int, default=None)
+    parser.add_argument("--row-id", type=int, default=None)
+    args = parser.parse_args()
+
+    # Catalogue indexé du CSV de test (voir src/predict/catalog.py)
+    catalog = get_catalog().load()
+    if args.productid is not None:
+        row = catalog.by_product(args.productid)
+    elif args.row_id is not None:
+        row = catalog.by_row(args.row_id)
+    else:
+        row = catalog.sample()
     print(row)
-    image_filename = (
-        "image_"
-        + str(row["imageid"].values[0])
-        + "_product_"
-        + str(row["productid"].values[0])
-        + ".jpg"
-    )
-    image_path = os.path.join(IMG_DIR, "image_test", image_filename)
-    print(image_path)
-    if os.path.exists(image_path):
-        img = Image.open(image_path)
+    if row is None or row["image_path"] is None:
+        print("❌ Produit introuvable ou sans image")
+        return
+    img = Image.open(row["image_path"])
     img.show()
-    result = predict(row["designation"].values[0], row["description"].values[0], img)
+    result = predict(row["designation"], row["description"], img)
 
     print("Retour predict : ", result)
 
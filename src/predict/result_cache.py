@@ -0,0 +1,189 @@
+"""
+==============================================================
+🧾 Module : result_cache.py — Cache des prédictions complètes
+==============================================================
+
+Cache TTL borné placé devant tout le pipeline de prédiction
+(clean_text, TF-IDF, ResNet50, XGBoost). La clé combine :
+  • la désignation et la description reçues,
+  • un hash des octets de l'image,
+  • la version du modèle chargé par le runtime ou les workers
+    (voir runtime.model_version), relevée sans stat par requête.
+
+Le nettoyage étant déterministe, des entrées brutes identiques donnent
+des entrées nettoyées identiques : indexer sur les entrées brutes
+permet de sauter aussi `clean_text` en cas de hit.
+
+Les requêtes identiques simultanées sont fusionnées : une seule calcule
+le résultat, les autres attendent son Future. Si la requête qui calcule
+est annulée (client déconnecté), le calcul est abandonné sans erreur
+pour les autres : l'une d'elles le reprend. Le cache est vidé dès
+qu'une nouvelle version du modèle est observée ; la version ne fait
+qu'avancer : une clé portant une version déjà remplacée (requête
+commencée avant un redéploiement) est calculée sans être mise en
+cache, sans revenir en arrière ni vider le cache.
+
+⚙️ Configuration (variables d'environnement) :
+  • PREDICTION_CACHE_SIZE  (défaut 50000, 0 = cache désactivé)
+  • PREDICTION_CACHE_TTL_S (défaut 3600)
+==============================================================
+"""
+
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+PREDICTION_CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", "50000"))
+PREDICTION_CACHE_TTL_S = float(os.getenv("PREDICTION_CACHE_TTL_S", "3600"))
+# Résultat d'un calcul abandonné : les appelants qui l'attendaient recommencent
+_ABANDONED = object()
+
+
+def prediction_key(designation, description, image_bytes: bytes, model_version: str) -> tuple:
+    image_hash = hashlib.blake2b(image_bytes, digest_size=16).hexdigest()
+    return (str(designation), str(description), image_hash, model_version)
+
+
+class PredictionCache:
+    """
+    Cache LRU à durée de vie avec fusion des calculs en cours.
+
+    La version du modèle est le dernier élément de la clé : une clé portant
+    une version jamais vue vide le cache avant d'être traitée.
+    """
+
+    def __init__(self, max_items: int = None, ttl_s: float = None, clock=time.monotonic):
+        self.max_items = PREDICTION_CACHE_SIZE if max_items is None else max_items
+        self.ttl_s = PREDICTION_CACHE_TTL_S if ttl_s is None else ttl_s
+        self.clock = clock
+        self.model_version = None
+        self._retired = set()
+        self._items = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.invalidations = 0
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self.invalidations += 1
+
+    def _lookup(self, key: tuple):
+        """Retourne (trouvé, valeur, future, propriétaire) sous verrou."""
+        with self._lock:
+            version = key[-1]
+            if version != self.model_version and version not in self._retired:
+                if self.model_version is not None:
+                    self._retired.add(self.model_version)
+                    self._items.clear()
+                    self.invalidations += 1
+                self.model_version = version
+
+            entry = self._items.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires > self.clock():
+                    self._items.move_to_end(key)
+                    self.hits += 1
+                    return True, value, None, False
+                del self._items[key]
+
+            future = self._inflight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return False, None, future, False
+            future = Future()
+            self._inflight[key] = future
+            self.misses += 1
+            return False, None, future, True
+
+    def _store(self, key: tuple, future: Future, value=None, error: Exception = None) -> None:
+        with self._lock:
+            self._inflight.pop(key, None)
+            cacheable = error is None and value is not _ABANDONED
+            if cacheable and key[-1] == self.model_version and self.max_items > 0:
+                self._items[key] = (value, self.clock() + self.ttl_s)
+                self._items.move_to_end(key)
+                while len(self._items) > self.max_items:
+                    self._items.popitem(last=False)
+        if error is None:
+            future.set_result(value)
+        else:
+            future.set_exception(error)
+
+    def get_or_compute(self, key: tuple, compute):
+        """Retourne la valeur en cache, ou la calcule une seule fois pour tous les appelants."""
+        while True:
+            found, value, future, owner = self._lookup(key)
+            if found:
+                return value
+            if owner:
+                break
+            value = future.result()
+            if value is not _ABANDONED:
+                return value
+        try:
+            value = compute()
+        except Exception as e:
+            self._store(key, future, error=e)
+            raise
+        except BaseException:
+            # Annulation : la clé est libérée, les appelants en attente relancent le calcul
+            self._store(key, future, value=_ABANDONED)
+            raise
+        self._store(key, future, value=value)
+        return value
+
+    async def aget_or_compute(self, key: tuple, compute):
+        """Variante async de `get_or_compute` : `compute` est une fonction retournant une coroutine."""
+        while True:
+            found, value, future, owner = self._lookup(key)
+            if found:
+                return value
+            if owner:
+                break
+            value = await asyncio.wrap_future(future)
+            if value is not _ABANDONED:
+                return value
+        try:
+            value = await compute()
+        except Exception as e:
+            self._store(key, future, error=e)
+            raise
+        except BaseException:
+            # Annulation : la clé est libérée, les appelants en attente relancent le calcul
+            self._store(key, future, value=_ABANDONED)
+            raise
+        self._store(key, future, value=value)
+        return value
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "invalidations": self.invalidations,
+                "items": len(self._items),
+                "model_version": self.model_version,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_prediction_cache() -> PredictionCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = PredictionCache()
+        return _cache
@@ -0,0 +1,282 @@
+"""
+==============================================================
+🧠 Module : runtime.py — Runtime de prédiction résident
+==============================================================
+
+Charge une seule fois par processus les artefacts utilisés
+à l'inférence :
+  • models/xgb_fusion.json              → modèle XGBoost fusion
+  • models/label_encoder.joblib         → encodeur des labels
+  • models/feature_config.json          → backbone image et résolution d'entraînement
+  • data/processed/tfidf_vectorizer.joblib → vectoriseur TF-IDF (TfidfVectorizer,
+                                            ou HashedTfidf : IDF seul, sans vocabulaire)
+  • models/<backbone>-weights.pth       → poids du backbone image
+
+Une inférence de chauffe est exécutée juste après le chargement,
+puis le runtime passe à l'état « prêt ». Les appels suivants ne
+paient plus que le calcul (TF-IDF, backbone image, XGBoost).
+
+Utilisation :
+    from src.predict.runtime import get_runtime
+    runtime = get_runtime().load()
+    codes = runtime.predict_codes([clean_one_row(designation, description, image)])
+==============================================================
+"""
+
+import copy
+import hashlib
+import os
+import threading
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+from PIL import Image
+
+from src.api.metrics import observe_batch, stage
+from src.data.clean_data import IMAGE_SIZE, clean_one_row
+from src.data.preprocess_data import Preprocessor
+from src.features.backbones import backbone_weights_path, embedding_dim
+from src.features.build_features import (
+    FEATURE_CONFIG_FILE,
+    embedding_namespace,
+    feature_tag,
+    load_feature_config,
+)
+from src.features.embedding_cache import EmbeddingCache
+from src.features.image_loader import EMBED_WORKERS
+from src.predict.fusion import fuse_features
+
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
+DATA_DIR = os.path.join(BASE_DIR, "data", "processed")
+MODEL_DIR = os.path.join(BASE_DIR, "models")
+# Taille des lots du backbone image : au moins la taille maximale d'un micro-batch (voir batcher.py)
+RESNET_BATCH_SIZE = max(32, int(os.getenv("PREDICT_MAX_BATCH_SIZE", "32")))
+# Backend du backbone image (voir src/features/image_backends.py) : torch, onnx-int8-static, ...
+IMAGE_BACKEND = os.getenv("IMAGE_BACKEND", "torch")
+# Cache des embeddings image (voir src/features/embedding_cache.py) ; "" désactive le niveau disque
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", os.path.join(DATA_DIR, "embedding_cache"))
+# Intervalle de recherche d'artefacts redéployés par l'API (les hits du cache n'atteignent pas le runtime)
+MODEL_REFRESH_S = float(os.getenv("MODEL_REFRESH_S", "30"))
+
+
+class ModelRuntime:
+    """
+    Détient les artefacts de prédiction chargés en mémoire.
+
+    Le chargement est idempotent et protégé par un verrou : plusieurs
+    threads peuvent appeler `load()` en même temps, un seul charge.
+    """
+
+    def __init__(self, model_dir: str = MODEL_DIR, data_dir: str = DATA_DIR) -> None:
+        self.model_path = os.path.join(model_dir, "xgb_fusion.json")
+        self.encoder_path = os.path.join(model_dir, "label_encoder.joblib")
+        self.vectorizer_path = os.path.join(data_dir, "tfidf_vectorizer.joblib")
+        self.model_dir = model_dir
+        self.data_dir = data_dir
+
+        self.bst = None
+        self.encoder = None
+        self.preprocessor = None
+        self.feature_config = None
+        self.model_version = None
+        self.nthread = None
+        # Threads de décodage des images du Preprocessor (0 : décodage en ligne)
+        self.loader_workers = EMBED_WORKERS
+        self.error = None
+        self.load_seconds = None
+
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    @property
+    def image_format(self) -> str:
+        """Représentation des images vue à l'entraînement : "jpeg" ou "raw" (voir clean_data.py)."""
+        return self.feature_config["image_format"]
+
+    def load(self) -> "ModelRuntime":
+        """Charge les artefacts, exécute la chauffe puis marque le runtime prêt."""
+        with self._lock:
+            if self.ready:
+                return self
+            start = time.perf_counter()
+            try:
+                print("📦 Chargement des artefacts...")
+                version = model_version(self.model_dir, self.data_dir)
+                bst = xgb.Booster()
+                bst.load_model(self.model_path)
+                encoder = joblib.load(self.encoder_path)
+                config = load_feature_config(self.model_dir)
+                preprocessor = self._build_preprocessor(config, joblib.load(self.vectorizer_path))
+                self.bst, self.encoder, self.preprocessor = bst, encoder, preprocessor
+                self.feature_config = config
+                self.model_version = version
+
+                print("🔥 Inférence de chauffe...")
+                self.warmup()
+            except Exception as e:
+                self.error = str(e)
+                raise
+            self.error = None
+            self.load_seconds = time.perf_counter() - start
+            self._ready.set()
+            print(f"✅ Runtime prêt en {self.load_seconds:.2f}s")
+        return self
+
+    def _build_preprocessor(self, config: dict, tfidf) -> Preprocessor:
+        """Construit le Preprocessor avec le backbone et la résolution du modèle déployé."""
+        print(f"🦴 Backbone image : {feature_tag(config)} ({IMAGE_BACKEND})")
+        weights_path = backbone_weights_path(self.model_dir, config["backbone"])
+        preprocessor = Preprocessor(
+            tfidf=tfidf,
+            input_model=weights_path,
+            batch_size=RESNET_BATCH_SIZE,
+            progress=False,
+            image_backend=IMAGE_BACKEND,
+            backbone=config["backbone"],
+            image_size=config["image_size"],
+            loader_workers=self.loader_workers,
+        )
+        # Après le Preprocessor : les poids (téléchargés s'ils manquaient) versionnent le cache
+        preprocessor.embedding_cache = EmbeddingCache(
+            max_items=EMBEDDING_CACHE_SIZE,
+            disk_dir=embedding_cache_dir(config, weights_path),
+            dim=embedding_dim(config["backbone"]),
+        )
+        return preprocessor
+
+    def warmup(self) -> None:
+        """Exécute une prédiction factice pour initialiser torch et XGBoost."""
+        doc = clean_one_row("warmup", "", Image.new("RGB", IMAGE_SIZE), self.image_format)
+        self.predict_codes([doc])
+
+    def wait_ready(self, timeout: float | None = None) -> bool:
+        return self._ready.wait(timeout)
+
+    def set_threads(self, nthread: int) -> None:
+        self.nthread = nthread
+        self.bst.set_param({"nthread": nthread})
+
+    def refresh(self) -> bool:
+        """
+        Recharge les artefacts si l'un d'eux a été redéployé (voir `model_version`).
+
+        Le vectoriseur TF-IDF est toujours rechargé avec le booster ; le
+        backbone image n'est reconstruit que si feature_config.json a changé.
+        """
+        version = model_version(self.model_dir, self.data_dir)
+        if version == self.model_version:
+            return False
+        with self._lock:
+            if version == self.model_version:
+                return False
+            try:
+                bst = xgb.Booster()
+                bst.load_model(self.model_path)
+                encoder = joblib.load(self.encoder_path)
+                tfidf = joblib.load(self.vectorizer_path)
+                config = load_feature_config(self.model_dir)
+                if config == self.feature_config:
+                    preprocessor = copy.copy(self.preprocessor)
+                    preprocessor.tfidf = tfidf
+                else:
+                    preprocessor = self._build_preprocessor(config, tfidf)
+            except Exception as e:
+                # Fichier en cours d'écriture par l'entraînement : on réessaiera au prochain appel
+                print(f"⚠️ Rechargement du modèle impossible, version précédente conservée : {e}")
+                return False
+            if self.nthread is not None:
+                bst.set_param({"nthread": self.nthread})
+            self.bst, self.encoder, self.preprocessor = bst, encoder, preprocessor
+            self.feature_config = config
+            self.model_version = version
+            print(f"🔄 Nouveau modèle chargé (version {version})")
+            return True
+
+    def predict_proba(self, docs: list[dict]) -> np.ndarray:
+        """Retourne les probabilités (n_docs, n_classes) pour des documents nettoyés."""
+        df_clean = pd.DataFrame(docs)
+        df_clean["text"] = (
+            df_clean["designation"].fillna("") + " " + df_clean["description"].fillna("")
+        )
+        observe_batch("runtime", len(docs))
+        with stage("tfidf"):
+            X_tfidf = self.preprocessor.transform_text(df_clean["text"])
+        with stage("image_embedding"):
+            X_img = self.preprocessor.embed_images(df_clean["image_binary"].tolist())
+        # Inférence sans DMatrix (voir fusion.py), les deux étapes chronométrées séparément
+        with stage("fusion_build"):
+            X = fuse_features(X_tfidf, X_img)
+        with stage("booster_predict"):
+            return self.bst.inplace_predict(X)
+
+    def predict_codes(self, docs: list[dict]) -> list[int]:
+        """Retourne les `prdtypecode` prédits pour des documents nettoyés."""
+        if self.ready:
+            self.refresh()
+        proba = self.predict_proba(docs)
+        pred_ids = np.argmax(proba, axis=1)
+        return [int(code) for code in self.encoder.inverse_transform(pred_ids)]
+
+
+def embedding_cache_dir(config: dict, weights_path: str) -> str | None:
+    """
+    Dossier du cache disque des embeddings, propre à la version des features
+    (voir `embedding_namespace`) et au backend ; partagé avec l'entraînement.
+    """
+    if not EMBEDDING_CACHE_DIR:
+        return None
+    path = os.path.join(EMBEDDING_CACHE_DIR, embedding_namespace(config, weights_path))
+    if IMAGE_BACKEND != "torch":
+        # Les embeddings d'un backend quantifié ne se mélangent pas à ceux du fp32
+        path = f"{path}-{IMAGE_BACKEND}"
+    return path
+
+
+def artifact_paths(model_dir: str = MODEL_DIR, data_dir: str = DATA_DIR) -> list[str]:
+    """Artefacts lus par le runtime, le modèle XGBoost en premier."""
+    return [
+        os.path.join(model_dir, "xgb_fusion.json"),
+        os.path.join(model_dir, "label_encoder.joblib"),
+        os.path.join(model_dir, FEATURE_CONFIG_FILE),
+        os.path.join(data_dir, "tfidf_vectorizer.joblib"),
+    ]
+
+
+def model_version(model_dir: str = MODEL_DIR, data_dir: str = DATA_DIR) -> str:
+    """
+    Version du modèle déployé : empreinte des dates de modification et tailles de tous
+    les artefacts. Un encodeur ou un vectoriseur remplacé seul change aussi la version.
+    """
+    stats = []
+    for path in artifact_paths(model_dir, data_dir):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            if not stats:
+                return "absent"
+            stats.append(f"{path}:absent")
+            continue
+        stats.append(f"{path}:{stat.st_mtime_ns}-{stat.st_size}")
+    return hashlib.sha1("|".join(stats).encode()).hexdigest()[:12]
+
+
+_runtime = None
+_runtime_lock = threading.Lock()
+
+
+def get_runtime() -> ModelRuntime:
+    """Retourne le runtime partagé du processus (non chargé tant que `load()` n'est pas appelé)."""
+    global _runtime
+    with _runtime_lock:
+        if _runtime is None:
+            _runtime = ModelRuntime()
+        return _runtime
@@ -0,0 +1,214 @@
+"""
+==============================================================
+⚙️ Module : workers.py — Pool de processus d'inférence
+==============================================================
+
+Mode d'inférence où les handlers async de l'API délèguent le calcul
+à un pool fixe de processus. Chaque worker charge son propre runtime
+(voir runtime.py) dans l'initialiseur du pool, puis reçoit des
+requêtes compactes : texte déjà nettoyé + octets bruts de l'image.
+
+Les threads intra-op de torch et de XGBoost sont répartis entre les
+workers (cœurs // workers) et les images sont décodées en ligne
+(sans pool EMBED_WORKERS) pour éviter la sur-souscription du CPU.
+Le nombre de requêtes en attente est borné : au-delà, l'appelant
+attend au plus PREDICT_QUEUE_TIMEOUT_S secondes puis reçoit
+`PoolSaturated`. Si un worker meurt (`BrokenProcessPool`), le pool
+repasse « non prêt », est reconstruit en arrière-plan et l'appelant
+reçoit `PoolBroken`.
+
+⚙️ Configuration (variables d'environnement) :
+  • PREDICT_MODE            ("thread" par défaut, "process" pour ce pool)
+  • PREDICT_WORKERS         (défaut : nombre de cœurs)
+  • PREDICT_MAX_PENDING     (défaut : 4 requêtes par worker)
+  • PREDICT_QUEUE_TIMEOUT_S (défaut 5)
+==============================================================
+"""
+
+import asyncio
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import torch
+from PIL import Image
+
+from src.api.metrics import collect_stages, observe_stages, stage
+from src.data.clean_data import normalize_image
+from src.predict.runtime import get_runtime
+
+
+PREDICT_MODE = os.getenv("PREDICT_MODE", "thread")
+N_WORKERS = int(os.getenv("PREDICT_WORKERS", str(os.cpu_count() or 1)))
+MAX_PENDING = int(os.getenv("PREDICT_MAX_PENDING", str(4 * N_WORKERS)))
+QUEUE_TIMEOUT_S = float(os.getenv("PREDICT_QUEUE_TIMEOUT_S", "5"))
+
+
+class PoolSaturated(Exception):
+    """Levée quand la file bornée du pool est pleine au-delà du délai d'attente."""
+
+
+class PoolBroken(Exception):
+    """Levée quand un worker s'est arrêté : le pool est en cours de reconstruction."""
+
+
+# ---------- Côté worker ----------
+def _init_worker(n_threads: int) -> None:
+    torch.set_num_threads(n_threads)
+    runtime = get_runtime()
+    # Décodage en ligne : un pool de threads par worker sur-souscrirait les cœurs
+    runtime.loader_workers = 0
+    runtime.load().set_threads(n_threads)
+
+
+def _model_version() -> str:
+    """Version du modèle du worker, après rechargement des artefacts redéployés."""
+    runtime = get_runtime()
+    runtime.refresh()
+    return runtime.model_version
+
+
+def _predict_payload(
+    designation: str, description: str, image_bytes: bytes
+) -> tuple[int, dict, str]:
+    """Retourne le code prédit, la durée de chaque étape (enregistrée côté API) et la version du modèle."""
+    runtime = get_runtime()
+    with collect_stages() as timings:
+        with stage("image_normalize"):
+            image = Image.open(io.BytesIO(image_bytes))
+            image_binary = normalize_image(image, runtime.image_format)
+        doc = {"designation": designation, "description": description, "image_binary": image_binary}
+        code = runtime.predict_codes([doc])[0]
+    return code, timings, runtime.model_version
+
+
+# ---------- Côté API ----------
+class InferencePool:
+    """
+    Pool fixe de processus détenant chacun les modèles préchargés.
+
+    `predict()` est une coroutine : elle réserve une place dans la file
+    bornée puis attend le résultat du worker sans bloquer la boucle.
+    """
+
+    def __init__(self, n_workers: int = None, max_pending: int = None) -> None:
+        self.n_workers = n_workers or N_WORKERS
+        self.max_pending = max_pending or MAX_PENDING
+        self.n_threads = max(1, (os.cpu_count() or 1) // self.n_workers)
+        self.executor = None
+        self.error = None
+        self.model_version = None
+        self._versions = set()
+        self._ready = threading.Event()
+        self._restart_lock = threading.Lock()
+        self._slots = None
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def start(self) -> "InferencePool":
+        """Démarre les workers et attend que chacun ait chargé son runtime."""
+        try:
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.n_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.n_threads,),
+            )
+            # L'initialiseur (chargement du runtime) s'exécute avant la première tâche de chaque worker
+            pings = [self.executor.submit(_model_version) for _ in range(self.n_workers)]
+            for future in wait(pings).done:
+                self.observe_version(future.result())
+        except Exception as e:
+            self.error = str(e)
+            raise
+        print(
+            f"✅ Pool d'inférence prêt : {self.n_workers} worker(s), "
+            f"{self.n_threads} thread(s) chacun"
+        )
+        self.error = None
+        self._ready.set()
+        return self
+
+    def observe_version(self, version: str) -> bool:
+        """
+        Avance la version servie (clé du cache des prédictions) ; une version déjà
+        remplacée, rapportée par un worker pas encore rechargé, est ignorée.
+        """
+        with self._restart_lock:
+            if version in self._versions:
+                return False
+            self._versions.add(version)
+            self.model_version = version
+            return True
+
+    def refresh(self) -> bool:
+        """Fait recharger un worker ; les autres rechargent à leur prochaine requête."""
+        executor = self.executor
+        if executor is None:
+            return False
+        return self.observe_version(executor.submit(_model_version).result())
+
+    def restart(self, broken: ProcessPoolExecutor) -> None:
+        """Remplace un executor cassé ; les appels concurrents pour le même executor n'en relancent qu'un."""
+        with self._restart_lock:
+            if self.executor is not broken:
+                return
+            self._ready.clear()
+            self.error = "Un worker s'est arrêté, redémarrage du pool"
+            self.executor = None
+        print(f"⚠️ {self.error}")
+        broken.shutdown(wait=False, cancel_futures=True)
+        try:
+            self.start()
+        except Exception as e:
+            print(f"❌ Redémarrage du pool d'inférence impossible : {e}")
+
+    def shutdown(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.executor = None
+        self._ready.clear()
+
+    async def predict(self, designation: str, description: str, image_bytes: bytes) -> int:
+        """Envoie une requête compacte au pool et retourne le code prédit."""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_pending)
+        try:
+            await asyncio.wait_for(self._slots.acquire(), QUEUE_TIMEOUT_S)
+        except TimeoutError:
+            raise PoolSaturated("La file du pool d'inférence est pleine") from None
+        executor = self.executor
+        try:
+            if executor is None:
+                raise PoolBroken("Le pool d'inférence redémarre")
+            future = executor.submit(_predict_payload, designation, description, image_bytes)
+            code, timings, version = await asyncio.wrap_future(future)
+        except BrokenProcessPool:
+            # Reconstruction hors de la boucle : /health répond 503 jusqu'au retour des workers
+            threading.Thread(
+                target=self.restart, args=(executor,), name="pool-restart", daemon=True
+            ).start()
+            raise PoolBroken("Un worker du pool d'inférence s'est arrêté") from None
+        finally:
+            self._slots.release()
+        observe_stages(timings)
+        self.observe_version(version)
+        return code
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> InferencePool:
+    """Retourne le pool partagé de l'API (non démarré tant que `start()` n'est pas appelé)."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = InferencePool()
+        return _pool
@@ -10,7 +10,7 @@ pour prédire le code produit Rakuten (`prdtypecode`) à partir de données
 pré-fusionnées (features texte TF-IDF + features image ResNet).
 
 Il assure :
-  - le chargement des jeux de données déjà pré-traités (.npz, .npy),
+  - le chargement des jeux de données déjà pré-traités (.npy memory-mappés),
   - l’encodage des labels,
   - l’entraînement du modèle XGBoost avec suivi des métriques via MLflow,
   - la sauvegarde des artefacts (modèle, encodeur, métriques).
@@ -18,8 +18,9 @@ Il assure :
 📁 Données attendues :
 ----------------------
 Les fichiers doivent être présents dans :  data/processed/
-  - X_train.npz   : features d’entraînement (texte + image)
-  - X_val.npz     : features de validation
+  - X_train/      : features d’entraînement (CSR texte + bloc image dense,
+                    voir src/features/feature_matrix.py), lues par plages
+  - X_val/        : features de validation
   - y_train.npy   : labels d’entraînement
   - y_val.npy     : labels de validation
 
@@ -29,6 +30,7 @@ Les artefacts du modèle sont sauvegardés dans :  data/models/
   - xgb_fusion.json          → modèle XGBoost entraîné
   - label_encoder.joblib     → encodeur des labels scikit-learn
   - metrics_fusion.json      → métriques (accuracy, F1)
+  - feature_config.json      → backbone image, résolution et format d'image utilisés
 
 📊 Suivi des expériences :
 --------------------------
@@ -60,12 +62,36 @@ Le Dockerfile associé exécute ce script via :
     CMD ["python", "-m", "train.train"]
 avec volumes montés pour `data/` et `mlruns/`.
 
+🦴 Backbone image :
+-------------------
+IMAGE_BACKBONE (défaut resnet50) et IMAGE_INPUT_SIZE (défaut 224)
+choisissent l'extracteur d'images (voir src/features/backbones.py).
+IMAGE_FORMAT (défaut jpeg) choisit la représentation des images
+nettoyées : "raw" garde les pixels uint8 sans ré-encodage JPEG.
+JPEG_DRAFT (défaut 1) décode les JPEG sources directement à taille
+réduite ; "0" revient au décodage en pleine résolution.
+CLEAN_WORKERS (défaut 1) et CLEAN_CHUNK_SIZE (défaut 256) répartissent
+le nettoyage sur un pool de processus (voir src/data/clean_data.py).
+L'ingestion MongoDB est incrémentale : seules les lignes nouvelles ou
+modifiées sont nettoyées. INGEST_FULL_REBUILD=1 (ou `train(full_rebuild=True)`,
+`POST /train?full_rebuild=true`) purge et reconstruit les collections.
+PREPROCESS_STREAMING (défaut 1) calcule les features par blocs de
+STREAM_BATCH_SIZE documents (défaut 512), écrits directement sur disque :
+la mémoire reste constante quel que soit le nombre de lignes.
+TRAIN_DATA_MODE (défaut auto) donne les features à XGBoost par plages
+(`QuantileDMatrix`, ou mémoire externe si elles dépassent la RAM), voir
+src/train/training_data.py ; "dmatrix" revient à la matrice en mémoire.
+TEXT_FEATURIZER (défaut tfidf) choisit le featurizer texte : "hashed"
+remplace le vocabulaire par un hachage des termes, IDF appris en une
+passe (voir src/features/hashed_text.py).
+
 =====================================================================
 """
 
 # --- train.py : Entraînement XGBoost fusion texte+image avec MLflow ---
 import json
 import os
+import shutil
 from datetime import datetime
 
 import joblib
@@ -73,13 +99,16 @@ import mlflow
 import mlflow.xgboost
 import numpy as np
 import xgboost as xgb
-from scipy import sparse
 from sklearn.metrics import accuracy_score, classification_report, f1_score
 from sklearn.preprocessing import LabelEncoder
 from tqdm.auto import tqdm
 
-from src.data.clean_data import calcul_lignes_a_lire, clean_data
+from src.api.metrics import stage
+from src.data.clean_data import INGEST_FULL_REBUILD, calcul_lignes_a_lire, clean_data
 from src.data.preprocess_data import preprocess_data
+from src.features.backbones import backbone_weights_path
+from src.features.build_features import FEATURE_CONFIG_FILE
+from src.train.training_data import TRAIN_MAX_BIN, build_training_matrices
 
 
 # === 0️⃣ Gestion des chemins ===
@@ -90,6 +119,9 @@ IMG_DIR = os.path.join(RAW_DIR, "images", "images")
 DATA_DIR = os.path.join(BASE_DIR, "data", "processed")
 MODEL_DIR = os.path.join(BASE_DIR, "models")
 MLRUNS_DIR = os.path.join(BASE_DIR, "mlruns")
+IMAGE_BACKBONE = os.getenv("IMAGE_BACKBONE", "resnet50")
+IMAGE_INPUT_SIZE = int(os.getenv("IMAGE_INPUT_SIZE", "224"))
+IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", "jpeg")
 
 os.makedirs(MODEL_DIR, exist_ok=True)
 os.makedirs(MLRUNS_DIR, exist_ok=True)
@@ -106,34 +138,42 @@ mlflow.set_tracking_uri(f"file:{MLRUNS_DIR}")
 mlflow.set_experiment("rakuten_xgb_fusion")
 
 
-def train():
+def train(full_rebuild: bool = False):
     print("🧹 Starting data cleaning process...")
     nb_lignes = calcul_lignes_a_lire(datetime.now().strftime("%Y-%m-%d"))
-    clean_data(input_dir=RAW_DIR, images_dir=IMG_DIR, nbre_lignes=nb_lignes)
+    with stage("clean_data"):
+        clean_data(
+            input_dir=RAW_DIR,
+            images_dir=IMG_DIR,
+            nbre_lignes=nb_lignes,
+            image_format=IMAGE_FORMAT,
+            full_rebuild=full_rebuild or INGEST_FULL_REBUILD,
+        )
 
     print("⚙️ Starting data preprocessing...")
-    preprocess_data(
-        output_dir=DATA_DIR, input_model=os.path.join(MODEL_DIR, "resnet50-weights.pth")
-    )
+    with stage("preprocess_data"):
+        preprocess_data(
+            output_dir=DATA_DIR,
+            input_model=backbone_weights_path(MODEL_DIR, IMAGE_BACKBONE),
+            backbone=IMAGE_BACKBONE,
+            image_size=IMAGE_INPUT_SIZE,
+        )
 
     print("🚀 Starting training process...")
 
-    # === 1️⃣ Chargement des données pré-fusionnées ===
-    X_train = sparse.load_npz(os.path.join(DATA_DIR, "X_train.npz"))
-    X_val = sparse.load_npz(os.path.join(DATA_DIR, "X_val.npz"))
+    # === 1️⃣ Chargement des labels ===
     y_train = np.load(os.path.join(DATA_DIR, "y_train.npy"))
     y_val = np.load(os.path.join(DATA_DIR, "y_val.npy"))
-
-    print(f"📦 X_train: {X_train.shape}, X_val: {X_val.shape}")
     print(f"📊 y_train: {y_train.shape}, y_val: {y_val.shape}")
 
-    # === 2️⃣ Encodage des labels ===
+    # === 2️⃣ Encodage des labels et matrices XGBoost ===
     encoder = LabelEncoder()
     y_train_enc = encoder.fit_transform(y_train)
     y_val_enc = encoder.transform(y_val)
 
-    dtrain = xgb.DMatrix(X_train, label=y_train_enc)
-    dval = xgb.DMatrix(X_val, label=y_val_enc)
+    # Features lues par plages depuis data/processed (voir src/train/training_data.py)
+    dtrain, dval, data_mode = build_training_matrices(y_train_enc, y_val_enc, DATA_DIR)
+    print(f"📦 X_train: {dtrain.num_row()} x {dtrain.num_col()}, X_val: {dval.num_row()}")
 
     # === 3️⃣ Paramètres du modèle ===
     device = "cuda" if gpu_available() else "cpu"
@@ -146,6 +186,7 @@ def train():
         "subsample": 0.8,
         "colsample_bytree": 0.8,
         "tree_method": "hist",
+        "max_bin": TRAIN_MAX_BIN,
         "device": device,
     }
 
@@ -171,17 +212,26 @@ def train():
     # === 5️⃣ Entraînement + suivi MLflow ===
     with mlflow.start_run(run_name="train_xgb_fusion"):
         mlflow.log_params(params)
-
-        bst = xgb.train(
-            params=params,
-            dtrain=dtrain,
-            num_boost_round=num_round,
-            evals=[(dtrain, "train"), (dval, "val")],
-            evals_result=evals_result,
-            verbose_eval=False,
-            callbacks=[TQDMProgress(num_round)],
+        mlflow.log_params(
+            {
+                "image_backbone": IMAGE_BACKBONE,
+                "image_input_size": IMAGE_INPUT_SIZE,
+                "image_format": IMAGE_FORMAT,
+                "train_data_mode": data_mode,
+            }
         )
 
+        with stage("xgb_train"):
+            bst = xgb.train(
+                params=params,
+                dtrain=dtrain,
+                num_boost_round=num_round,
+                evals=[(dtrain, "train"), (dval, "val")],
+                evals_result=evals_result,
+                verbose_eval=False,
+                callbacks=[TQDMProgress(num_round)],
+            )
+
         # === 6️⃣ Évaluation sur validation ===
         y_pred = np.argmax(bst.predict(dval), axis=1)
         acc = accuracy_score(y_val_enc, y_pred)
@@ -197,14 +247,22 @@ def train():
         model_path = os.path.join(MODEL_DIR, "xgb_fusion.json")
         encoder_path = os.path.join(MODEL_DIR, "label_encoder.joblib")
         metrics_path = os.path.join(MODEL_DIR, "metrics_fusion.json")
+        feature_config_path = os.path.join(MODEL_DIR, FEATURE_CONFIG_FILE)
 
-        bst.save_model(model_path)
-        joblib.dump(encoder, encoder_path)
+        # Chaque artefact remplacé d'un bloc, le modèle en dernier : l'API qui recharge
+        # ne voit jamais un booster neuf associé à l'ancien encodeur ou à l'ancienne config
+        save_atomic(
+            feature_config_path,
+            lambda path: shutil.copyfile(os.path.join(DATA_DIR, FEATURE_CONFIG_FILE), path),
+        )
+        save_atomic(encoder_path, lambda path: joblib.dump(encoder, path))
+        save_atomic(model_path, bst.save_model)
         json.dump({"accuracy": float(acc), "f1": float(f1)}, open(metrics_path, "w"))
 
         # === 8️⃣ Logging MLflow des artefacts ===
         mlflow.xgboost.log_model(bst, artifact_path="xgb_model")
         mlflow.log_artifact(encoder_path, artifact_path="preprocessing")
+        mlflow.log_artifact(feature_config_path, artifact_path="preprocessing")
         mlflow.log_artifact(metrics_path, artifact_path="metrics")
 
     print("💾 Model saved:", model_path)
@@ -212,6 +270,14 @@ def train():
     return {"status": "done", "accuracy": acc, "f1": f1}
 
 
+def save_atomic(path: str, write) -> None:
+    """Écrit via `write(chemin)` dans un fichier temporaire puis le renomme en `path` (os.replace)."""
+    root, ext = os.path.splitext(path)
+    tmp_path = f"{root}.tmp{ext}"  # extension conservée : save_model en déduit le format
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
 def gpu_available():
     """
     Teste si un GPU compatible CUDA est disponible pour XGBoost.
@@ -0,0 +1,320 @@
+"""
+==============================================================
+📚 Module : training_data.py — Matrices XGBoost hors mémoire
+==============================================================
+
+`train()` fusionnait toutes les features d'un split en une matrice CSR
+puis l'enveloppait dans un `xgb.DMatrix` : XGBoost en gardait sa propre
+copie à côté de la matrice brute.
+
+Ici XGBoost lit les features par plages via un `xgb.DataIter` :
+  • "quantile" : `xgb.QuantileDMatrix`, seule la matrice quantifiée
+                 (un octet par valeur ou presque) reste en mémoire ;
+  • "external" : `xgb.DMatrix` en mémoire externe (itérateur avec
+                 `cache_prefix`) : les pages sont écrites sur disque
+                 (données plus grandes que la RAM), API disponible
+                 dans la version d'XGBoost épinglée (2.x) ;
+  • "dmatrix"  : chemin historique, matrice fusionnée en mémoire ;
+  • "auto"     : "external" si les features dépassent MEMORY_BUDGET de la
+                 mémoire disponible, "quantile" sinon.
+
+Les plages fusionnées `[texte | image]` (voir `fuse_features`) sont mises
+en cache dans `data/processed/xgb_cache/<split>-<clé>/`, la clé suivant
+les fichiers de features et la taille des plages : les passages
+suivants (sketch des quantiles, construction, autres entraînements)
+relisent ces fichiers memory-mappés sans refaire la fusion. Les pages
+quantifiées d'XGBoost ne peuvent pas servir de cache entre deux runs :
+elles portent l'adresse de la matrice en mémoire et sont supprimées
+quand elle est libérée.
+
+⚙️ Configuration (variables d'environnement) :
+  • TRAIN_DATA_MODE (défaut auto) : auto, quantile, external ou dmatrix
+  • TRAIN_CHUNK_ROWS (défaut 16384) : lignes par plage
+  • TRAIN_CACHE_DIR (défaut data/processed/xgb_cache)
+
+🔁 Rapport mémoire / temps jusqu'à la première itération :
+-----------------------------------------------------------
+$ python -m src.train.training_data --rounds 2 --output reports/training_data.json
+==============================================================
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import time
+
+import numpy as np
+import torch
+import xgboost as xgb
+from scipy import sparse
+
+from src.features.feature_matrix import META_FILE, FeatureMatrix, split_dir
+from src.features.image_loader import available_memory
+from src.predict.fusion import fuse_features
+
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../.."))
+DATA_DIR = os.path.join(BASE_DIR, "data", "processed")
+TRAIN_DATA_MODE = os.getenv("TRAIN_DATA_MODE", "auto")
+TRAIN_CHUNK_ROWS = int(os.getenv("TRAIN_CHUNK_ROWS", "16384"))
+TRAIN_CACHE_DIR = os.getenv("TRAIN_CACHE_DIR", os.path.join(DATA_DIR, "xgb_cache"))
+# Valeur par défaut d'XGBoost ; identique pour le train, la validation et le booster
+TRAIN_MAX_BIN = 256
+# Part de la mémoire disponible au-delà de laquelle "auto" passe en mémoire externe
+MEMORY_BUDGET = 0.5
+MODES = ("auto", "quantile", "external", "dmatrix")
+
+
+def chunk_cache_dir(features: FeatureMatrix, chunk_rows: int, cache_dir: str) -> str:
+    """Dossier des plages fusionnées d'un split : clé = métadonnées, date des features, plages."""
+    meta_path = os.path.join(features.directory, META_FILE)
+    with open(meta_path) as f:
+        meta = f.read()
+    key = f"{meta}|{os.stat(meta_path).st_mtime_ns}|{chunk_rows}"
+    suffix = hashlib.blake2b(key.encode("utf-8"), digest_size=6).hexdigest()
+    return os.path.join(cache_dir, f"{os.path.basename(features.directory)}-{suffix}")
+
+
+def cache_fused_chunks(features: FeatureMatrix, chunk_rows: int, cache_dir: str) -> str:
+    """Écrit une fois les plages fusionnées d'un split ; les versions périmées sont supprimées."""
+    directory = chunk_cache_dir(features, chunk_rows, cache_dir)
+    if os.path.exists(os.path.join(directory, META_FILE)):
+        return directory
+    prefix = f"{os.path.basename(features.directory)}-"
+    if os.path.isdir(cache_dir):
+        for name in os.listdir(cache_dir):
+            if name.startswith(prefix):
+                shutil.rmtree(os.path.join(cache_dir, name))
+    os.makedirs(directory)
+    rows = []
+    for k, (start, stop) in enumerate(features.ranges(chunk_rows)):
+        X = fuse_features(*features.rows(start, stop))
+        # indptr en int32 comme indices : scipy n'élargit (ni ne copie) aucun tableau à la relecture
+        parts = {"data": X.data, "indices": X.indices, "indptr": X.indptr.astype(np.int32)}
+        for name, values in parts.items():
+            np.save(os.path.join(directory, f"chunk_{k:05d}_{name}.npy"), values)
+        rows.append(stop - start)
+    # meta.json écrit en dernier : un cache incomplet n'est jamais relu
+    with open(os.path.join(directory, META_FILE), "w") as f:
+        json.dump({"rows": rows, "columns": features.shape[1]}, f)
+    return directory
+
+
+class FusedChunkIter(xgb.DataIter):
+    """Plages fusionnées d'un split, memory-mappées depuis le cache, données à XGBoost une à une."""
+
+    def __init__(self, directory: str, labels: np.ndarray, cache_prefix: str | None = None):
+        with open(os.path.join(directory, META_FILE)) as f:
+            meta = json.load(f)
+        self.directory = directory
+        self.rows = meta["rows"]
+        self.columns = meta["columns"]
+        self.offsets = np.concatenate(([0], np.cumsum(self.rows)))
+        if self.offsets[-1] != len(labels):
+            raise ValueError(f"{len(labels)} labels pour {self.offsets[-1]} lignes de features")
+        self.labels = labels
+        self._chunk = 0
+        super().__init__(cache_prefix=cache_prefix)
+
+    def load(self, k: int) -> sparse.csr_matrix:
+        def part(name):
+            return np.load(os.path.join(self.directory, f"chunk_{k:05d}_{name}.npy"), mmap_mode="r")
+
+        return sparse.csr_matrix(
+            (part("data"), part("indices"), part("indptr")),
+            shape=(self.rows[k], self.columns),
+            copy=False,
+        )
+
+    def next(self, input_data) -> bool:
+        k = self._chunk
+        if k == len(self.rows):
+            return False
+        input_data(data=self.load(k), label=self.labels[self.offsets[k] : self.offsets[k + 1]])
+        self._chunk += 1
+        return True
+
+    def reset(self) -> None:
+        self._chunk = 0
+
+
+def feature_bytes(features: FeatureMatrix) -> int:
+    """Taille estimée de la matrice fusionnée : valeur float32 + indice int32 par élément."""
+    text = features.text_data.nbytes + features.text_indices.nbytes
+    return text + 2 * features.image.nbytes
+
+
+def choose_mode(mode: str, features: list[FeatureMatrix]) -> str:
+    if mode not in MODES:
+        raise ValueError(f"TRAIN_DATA_MODE inconnu : {mode} (attendu : {', '.join(MODES)})")
+    if mode != "auto":
+        return mode
+    needed = sum(feature_bytes(f) for f in features)
+    budget = available_memory(torch.device("cpu")) * MEMORY_BUDGET
+    return "external" if needed > budget else "quantile"
+
+
+def build_training_matrices(
+    y_train: np.ndarray,
+    y_val: np.ndarray,
+    data_dir: str = DATA_DIR,
+    mode: str = TRAIN_DATA_MODE,
+    chunk_rows: int = TRAIN_CHUNK_ROWS,
+    cache_dir: str = TRAIN_CACHE_DIR,
+) -> tuple:
+    """(dtrain, dval, mode retenu) ; dval partage les quantiles de dtrain."""
+    features = {split: FeatureMatrix(split_dir(data_dir, split)) for split in ("train", "val")}
+    labels = {"train": y_train, "val": y_val}
+    mode = choose_mode(mode, list(features.values()))
+    print(f"📚 Matrices XGBoost : mode {mode}")
+
+    if mode == "dmatrix":
+        dtrain, dval = (
+            xgb.DMatrix(features[split].fused(), label=labels[split]) for split in ("train", "val")
+        )
+        return dtrain, dval, mode
+
+    iters = {}
+    for split in ("train", "val"):
+        directory = cache_fused_chunks(features[split], chunk_rows, cache_dir)
+        # Pages quantifiées de la mémoire externe : supprimées par XGBoost à la libération
+        prefix = os.path.join(cache_dir, "pages", split) if mode == "external" else None
+        if prefix:
+            os.makedirs(os.path.dirname(prefix), exist_ok=True)
+        iters[split] = FusedChunkIter(directory, labels[split], cache_prefix=prefix)
+
+    if mode == "external":
+        # Les quantiles sont calculés par le booster (max_bin des paramètres d'entraînement)
+        return xgb.DMatrix(iters["train"]), xgb.DMatrix(iters["val"]), mode
+    dtrain = xgb.QuantileDMatrix(iters["train"], max_bin=TRAIN_MAX_BIN)
+    dval = xgb.QuantileDMatrix(iters["val"], max_bin=TRAIN_MAX_BIN, ref=dtrain)
+    return dtrain, dval, mode
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss est en kilo-octets sous Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def measure(mode: str, data_dir: str, cache_dir: str, chunk_rows: int, rounds: int) -> dict:
+    """Construit les matrices puis entraîne `rounds` itérations dans le processus courant."""
+    from sklearn.preprocessing import LabelEncoder
+
+    import_rss = peak_rss_mb()  # imports (torch, xgboost…) avant toute donnée
+    start = time.perf_counter()
+    encoder = LabelEncoder()
+    y_train = encoder.fit_transform(np.load(os.path.join(data_dir, "y_train.npy")))
+    y_val = encoder.transform(np.load(os.path.join(data_dir, "y_val.npy")))
+    dtrain, dval, mode = build_training_matrices(
+        y_train, y_val, data_dir, mode, chunk_rows, cache_dir
+    )
+    built = time.perf_counter() - start
+    built_rss = peak_rss_mb()
+
+    first_iteration = []
+
+    class FirstIteration(xgb.callback.TrainingCallback):
+        def after_iteration(self, model, epoch, evals_log):
+            if not first_iteration:
+                first_iteration.append(time.perf_counter() - start)
+            return False
+
+    params = {
+        "objective": "multi:softprob",
+        "num_class": len(encoder.classes_),
+        "eta": 0.1,
+        "max_depth": 8,
+        "subsample": 0.8,
+        "colsample_bytree": 0.8,
+        "tree_method": "hist",
+        "max_bin": TRAIN_MAX_BIN,
+    }
+    xgb.train(
+        params,
+        dtrain,
+        rounds,
+        evals=[(dval, "val")],
+        verbose_eval=False,
+        callbacks=[FirstIteration()],
+    )
+    return {
+        "mode": mode,
+        "build_s": round(built, 3),
+        "import_rss_mb": import_rss,
+        "build_peak_rss_mb": built_rss,
+        "first_iteration_s": round(first_iteration[0], 3),
+        "total_s": round(time.perf_counter() - start, 3),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def compare_modes(
+    data_dir: str = DATA_DIR,
+    cache_dir: str = TRAIN_CACHE_DIR,
+    chunk_rows: int = TRAIN_CHUNK_ROWS,
+    rounds: int = 2,
+    output: str | None = None,
+) -> list[dict]:
+    """
+    Pic de RSS et temps jusqu'à la première itération de chaque mode, chacun dans
+    son propre processus. "quantile" est mesuré cache froid puis cache chaud.
+    """
+    runs = [("dmatrix", False), ("quantile", True), ("quantile", False), ("external", False)]
+    report = []
+    for mode, cold in runs:
+        if cold and os.path.isdir(cache_dir):
+            shutil.rmtree(cache_dir)
+        cmd = [
+            sys.executable,
+            "-m",
+            "src.train.training_data",
+            "--measure",
+            mode,
+            "--data-dir",
+            data_dir,
+            "--cache-dir",
+            cache_dir,
+            "--chunk-rows",
+            str(chunk_rows),
+            "--rounds",
+            str(rounds),
+        ]
+        result = subprocess.run(cmd, cwd=BASE_DIR, capture_output=True, text=True, check=True)
+        run = json.loads(result.stdout.strip().splitlines()[-1])
+        run["cache"] = "-" if mode == "dmatrix" else "froid" if cold else "chaud"
+        report.append(run)
+        print(
+            f"📏 {mode:<9} cache {run['cache']:<5} | pic RSS matrices "
+            f"{run['build_peak_rss_mb']:>7.1f} Mo, entraînement {run['peak_rss_mb']:>7.1f} Mo | "
+            f"1re itération {run['first_iteration_s']:>6.2f} s"
+        )
+    if output:
+        os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare les modes de chargement de train().")
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--cache-dir", default=TRAIN_CACHE_DIR)
+    parser.add_argument("--chunk-rows", type=int, default=TRAIN_CHUNK_ROWS)
+    parser.add_argument("--rounds", type=int, default=2)
+    parser.add_argument("--output", default=None, help="Rapport JSON")
+    parser.add_argument("--measure", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.measure:
+        run = measure(args.measure, args.data_dir, args.cache_dir, args.chunk_rows, args.rounds)
+        print(json.dumps(run))
+        return
+    compare_modes(args.data_dir, args.cache_dir, args.chunk_rows, args.rounds, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+import io
+
+import pandas as pd
+import torch
+from PIL import Image
+from sklearn.feature_extraction.text import TfidfVectorizer
+from torchvision import models
+
+from src.data.preprocess_data import Preprocessor
+from src.features.build_features import (
+    DEFAULT_FEATURE_CONFIG,
+    feature_tag,
+    load_feature_config,
+    save_feature_config,
+)
+
+
+def jpeg_bytes(color):
+    buffer = io.BytesIO()
+    Image.new("RGB", (224, 224), color).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def test_feature_config_defaults_to_resnet50(tmp_path):
+    """Un dossier sans feature_config.json correspond au ResNet50 224 historique"""
+    assert load_feature_config(str(tmp_path)) == DEFAULT_FEATURE_CONFIG
+    save_feature_config(str(tmp_path), {"backbone": "resnet18", "image_size": 160})
+    config = load_feature_config(str(tmp_path))
+    assert feature_tag(config) == "resnet18-160"
+
+
+def test_preprocessor_uses_selected_backbone_and_resolution(tmp_path):
+    """Le Preprocessor produit des embeddings à la dimension du backbone choisi"""
+    weights = tmp_path / "resnet18-weights.pth"
+    torch.save(models.resnet18(weights=None).state_dict(), weights)
+    df = pd.DataFrame(
+        {
+            "text": ["chaise bois", "lampe bureau"],
+            "image_binary": [jpeg_bytes("red"), b"pas une image"],
+        }
+    )
+    preprocessor = Preprocessor(
+        tfidf=TfidfVectorizer().fit(df["text"]),
+        input_model=str(weights),
+        progress=False,
+        backbone="resnet18",
+        image_size=112,
+    )
+    X_text, X_img = preprocessor.preprocess_data(df)
+    assert X_text.shape[0] == 2
+    assert X_img.shape == (2, 512)
+    assert preprocessor.load_tensor(jpeg_bytes("blue")).shape == (3, 112, 112)
@@ -0,0 +1,76 @@
+import threading
+import time
+
+import pytest
+
+from src.predict.batcher import MicroBatcher
+
+
+class FakeRuntime:
+    """Runtime factice : renvoie la longueur de la désignation et mémorise la taille des lots"""
+
+    def __init__(self, fail=False):
+        self.batch_sizes = []
+        self.fail = fail
+
+    def predict_codes(self, docs):
+        self.batch_sizes.append(len(docs))
+        if self.fail:
+            raise ValueError("boom")
+        return [len(doc["designation"]) for doc in docs]
+
+
+def test_flush_on_max_batch_size():
+    """Un lot plein est envoyé sans attendre le délai maximal"""
+    runtime = FakeRuntime()
+    batcher = MicroBatcher(runtime=runtime, max_batch_size=4, max_wait_ms=10_000).start()
+    futures = [batcher.submit({"designation": "x" * i}) for i in range(4)]
+
+    assert [f.result(timeout=5) for f in futures] == [0, 1, 2, 3]
+    assert runtime.batch_sizes == [4]
+    batcher.stop(timeout=5)
+
+
+def test_flush_on_max_wait():
+    """Un lot incomplet est envoyé une fois le délai maximal écoulé"""
+    runtime = FakeRuntime()
+    batcher = MicroBatcher(runtime=runtime, max_batch_size=32, max_wait_ms=20).start()
+    start = time.monotonic()
+    future = batcher.submit({"designation": "abc"})
+
+    assert future.result(timeout=5) == 3
+    assert time.monotonic() - start < 2
+    assert runtime.batch_sizes == [1]
+    batcher.stop(timeout=5)
+
+
+def test_concurrent_submissions_are_grouped():
+    """Des requêtes concurrentes partagent le même lot"""
+    runtime = FakeRuntime()
+    batcher = MicroBatcher(runtime=runtime, max_batch_size=8, max_wait_ms=200).start()
+    results = {}
+
+    def call(i):
+        results[i] = batcher.submit({"designation": "y" * i}).result(timeout=5)
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert results == {i: i for i in range(8)}
+    assert sum(runtime.batch_sizes) == 8
+    assert len(runtime.batch_sizes) < 8
+    batcher.stop(timeout=5)
+
+
+def test_errors_are_propagated_to_callers():
+    """Une erreur du runtime est renvoyée à chaque appelant du lot"""
+    batcher = MicroBatcher(runtime=FakeRuntime(fail=True), max_batch_size=2, max_wait_ms=10)
+    futures = [batcher.submit({"designation": "z"}) for _ in range(2)]
+
+    for future in futures:
+        with pytest.raises(ValueError):
+            future.result(timeout=5)
+    batcher.stop(timeout=5)
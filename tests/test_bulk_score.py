@@ -0,0 +1,137 @@
+import numpy as np
+import pandas as pd
+import pytest
+import xgboost as xgb
+from PIL import Image
+from scipy import sparse
+from sklearn.preprocessing import LabelEncoder
+
+from src.data import image_manifest
+from src.predict.bulk_score import BulkScorer, CsvSource, MongoSource, ParquetSink
+from src.predict.catalog import image_filename
+
+
+@pytest.fixture(autouse=True)
+def manifest_dir(tmp_path, monkeypatch):
+    """Manifestes d'images indexés dans le dossier temporaire du test"""
+    monkeypatch.setattr(image_manifest, "MANIFEST_DIR", str(tmp_path / "image_manifest"))
+
+
+class FakePreprocessor:
+    def transform_text(self, texts):
+        return sparse.csr_matrix((len(texts), 4), dtype=np.float32)
+
+    def embed_images(self, images):
+        return np.ones((len(images), 2), dtype=np.float32)
+
+
+class FakeRuntime:
+    def __init__(self):
+        X = np.random.default_rng(0).random((30, 6))
+        y = np.arange(30) % 2
+        params = {"objective": "multi:softprob", "num_class": 2}
+        self.bst = xgb.train(params, xgb.DMatrix(X, label=y), 2)
+        self.encoder = LabelEncoder().fit([10, 2583])
+        self.preprocessor = FakePreprocessor()
+        self.model_version = "v1"
+
+
+def make_source(tmp_path, n_rows=10):
+    images_dir = tmp_path / "image_test"
+    images_dir.mkdir()
+    lines = [",designation,description,productid,imageid"]
+    for i in range(n_rows):
+        lines.append(f"{i},Produit {i},,{2000 + i},{1000 + i}")
+        if i != 3:  # la ligne 3 n'a pas d'image
+            Image.new("RGB", (32, 32)).save(images_dir / image_filename(1000 + i, 2000 + i))
+    csv_path = tmp_path / "X_test_update.csv"
+    csv_path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return CsvSource(str(csv_path), str(images_dir))
+
+
+def test_scores_all_rows_with_an_image(tmp_path):
+    """Chaque bloc est écrit dans son fichier Parquet, les lignes sans image sont ignorées"""
+    sink = ParquetSink(str(tmp_path / "out"))
+    report = BulkScorer(FakeRuntime(), make_source(tmp_path), sink, chunk_size=4).run()
+    df = pd.read_parquet(tmp_path / "out")
+    assert sorted(df["id"]) == [0, 1, 2, 4, 5, 6, 7, 8, 9]
+    assert set(df["predicted_code"]) <= {10, 2583}
+    assert report["rows"] == 9
+    assert report["stages"]["lecture"]["chunks"] == 3
+
+
+def test_resume_skips_written_chunks(tmp_path):
+    """Une reprise ne recalcule que les blocs absents"""
+    source = make_source(tmp_path)
+    sink = ParquetSink(str(tmp_path / "out"))
+    BulkScorer(FakeRuntime(), source, sink, chunk_size=4).run()
+    (tmp_path / "out" / "part-00001.parquet").unlink()
+
+    report = BulkScorer(FakeRuntime(), source, sink, chunk_size=4).run()
+    assert report["skipped_chunks"] == 2
+    assert report["rows"] == 4
+    assert len(pd.read_parquet(tmp_path / "out")) == 9
+
+    with pytest.raises(ValueError):
+        BulkScorer(FakeRuntime(), source, sink, chunk_size=5).run()
+
+
+class FakeCollection:
+    """Sous-ensemble de pymongo utilisé par MongoSource : find sur `id`, projection, tri"""
+
+    OPS = {
+        "$gt": lambda v, b: v > b,
+        "$gte": lambda v, b: v >= b,
+        "$lt": lambda v, b: v < b,
+        "$lte": lambda v, b: v <= b,
+    }
+
+    def __init__(self, ids):
+        self.docs = [{"id": i} for i in ids]
+
+    def find(self, query, projection=None):
+        cond = query.get("id", {})
+        docs = [d for d in self.docs if all(self.OPS[op](d["id"], b) for op, b in cond.items())]
+        return FakeCursor(docs)
+
+
+class FakeCursor(list):
+    def sort(self, field, direction):
+        return FakeCursor(sorted(self, key=lambda d: d[field], reverse=direction < 0))
+
+
+def test_mongo_resume_keeps_snapshotted_boundaries(tmp_path):
+    """Des ids insérés entre deux passages ne décalent pas les blocs d'une reprise"""
+    collection = FakeCollection([10, 20, 30, 40, 50, 60, 70])
+    source = MongoSource({"X_test_cleaned": collection})
+    run = {"source": "mongo", "chunk_size": 3, "since_id": None, "model_version": "v1"}
+    run["boundaries"] = source.boundaries(3)
+    assert run["boundaries"] == [10, 40, 70, 70]
+
+    sink = ParquetSink(str(tmp_path / "out"))
+    sink.start(run)
+    (tmp_path / "out" / "part-00000.parquet").touch()
+
+    # Nouveaux documents avant et entre les bornes figées
+    collection.docs += [{"id": 5}, {"id": 15}, {"id": 45}]
+    current = dict(run, boundaries=source.boundaries(3))
+    done, resumed = sink.start(current)
+    assert done == {0}
+    assert resumed["boundaries"] == [10, 40, 70, 70]
+    chunks = dict(source.chunks(3, boundaries=resumed["boundaries"]))
+    assert chunks == {0: [10, 15, 20, 30], 1: [40, 45, 50, 60], 2: [70]}
+
+
+def test_stage_error_stops_the_pipeline(tmp_path):
+    """Une erreur dans une étape arrête le pipeline et est relevée par run()"""
+
+    class BrokenPreprocessor(FakePreprocessor):
+        def embed_images(self, images):
+            raise RuntimeError("boom")
+
+    runtime = FakeRuntime()
+    runtime.preprocessor = BrokenPreprocessor()
+    sink = ParquetSink(str(tmp_path / "out"))
+    scorer = BulkScorer(runtime, make_source(tmp_path, 40), sink, chunk_size=4, queue_size=1)
+    with pytest.raises(RuntimeError, match="boom"):
+        scorer.run()
@@ -0,0 +1,60 @@
+import time
+
+import pytest
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from src.mongodb.bulk_writer import BulkMongoWriter
+
+
+class SlowCollection:
+    """Collection en mémoire dont chaque écriture prend `delay` secondes."""
+
+    name = "X_train_cleaned"
+
+    def __init__(self, delay=0.0, fail=False):
+        self.delay = delay
+        self.fail = fail
+        self.batches = []
+
+    def insert_many(self, docs, ordered=True):
+        time.sleep(self.delay)
+        if self.fail:
+            raise BulkWriteError({"writeErrors": [{"code": 11000}]})
+        self.batches.append(list(docs))
+
+    def bulk_write(self, operations, ordered=True):
+        self.batches.append(list(operations))
+
+
+def test_batches_by_count_and_bytes():
+    """Un lot part au nombre de documents ou à la taille estimée, le reste au close()"""
+    collection = SlowCollection()
+    with BulkMongoWriter(collection, max_docs=4, max_bytes=10_000) as writer:
+        writer.write_many({"id": i} for i in range(10))
+        writer.write({"id": 10, "image_binary": b"x" * 20_000})
+        writer.write(UpdateOne({"id": 0}, {"$set": {"seen": True}}))
+    assert [len(batch) for batch in collection.batches] == [4, 4, 3, 1]
+    stats = writer.stats()
+    assert stats["docs"] == 12 and stats["batches"] == 4
+    assert stats["bytes"] > 20_000 and stats["docs_per_s"] > 0
+
+
+def test_backpressure_blocks_the_producer():
+    """Quand la base ne suit pas, write() attend qu'une place se libère dans la file"""
+    collection = SlowCollection(delay=0.05)
+    with BulkMongoWriter(collection, max_docs=1, max_pending=1) as writer:
+        writer.write_many({"id": i} for i in range(6))
+    assert len(collection.batches) == 6
+    assert writer.stats()["blocked_s"] > 0.1
+
+
+def test_write_error_is_raised_to_the_producer():
+    """Une erreur d'écriture remonte au producteur"""
+    writer = BulkMongoWriter(SlowCollection(fail=True), max_docs=1).start()
+    with pytest.raises(BulkWriteError):
+        for i in range(100):
+            writer.write({"id": i})
+            time.sleep(0.01)
+    with pytest.raises(BulkWriteError):
+        writer.close()
@@ -0,0 +1,88 @@
+import os
+
+import numpy as np
+
+from src.predict.catalog import ProductCatalog, image_filename
+
+
+def make_catalog(tmp_path):
+    csv_path = tmp_path / "X_test_update.csv"
+    csv_path.write_text(
+        ",designation,description,productid,imageid\n"
+        "0,Chaise <b>bois</b>,Belle chaise,2000,1000\n"
+        "1,Lampe,,2001,1001\n"
+        "7,Été à la plage,Crème solaire,2002,1002\n",
+        encoding="utf-8",
+    )
+    images_dir = tmp_path / "image_test"
+    images_dir.mkdir()
+    for imageid, productid in ((1000, 2000), (1002, 2002)):
+        (images_dir / image_filename(imageid, productid)).write_bytes(b"jpeg")
+    return ProductCatalog(str(csv_path), str(images_dir), str(tmp_path / "catalog"))
+
+
+def test_lookup_by_productid_and_row_id(tmp_path):
+    """Un produit se retrouve par productid ou par identifiant de ligne"""
+    catalog = make_catalog(tmp_path).load()
+    row = catalog.by_product(2002)
+    assert row["row_id"] == 7
+    assert row["designation"] == "Été à la plage"
+    assert row["description"] == "Crème solaire"
+    assert os.path.exists(row["image_path"])
+    assert catalog.by_row(7) == row
+    assert catalog.by_product(9999) is None
+
+
+def test_missing_description_and_image(tmp_path):
+    """Une description absente devient une chaîne vide, une image absente None"""
+    catalog = make_catalog(tmp_path).load()
+    row = catalog.by_row(1)
+    assert row["description"] == ""
+    assert row["image_path"] is None
+
+
+def test_sample_only_returns_products_with_image(tmp_path):
+    """Le tirage aléatoire ne renvoie que des produits qui ont une image"""
+    catalog = make_catalog(tmp_path).load()
+    rng = np.random.RandomState(0)
+    assert {catalog.sample(rng)["productid"] for _ in range(20)} == {2000, 2002}
+
+
+def test_index_is_reused_until_sources_change(tmp_path):
+    """L'index n'est reconstruit que si le CSV ou le dossier d'images change"""
+    make_catalog(tmp_path).load()
+    meta = tmp_path / "catalog" / "meta.json"
+    built_at = meta.stat().st_mtime_ns
+
+    catalog = ProductCatalog(
+        str(tmp_path / "X_test_update.csv"),
+        str(tmp_path / "image_test"),
+        str(tmp_path / "catalog"),
+    ).load()
+    assert meta.stat().st_mtime_ns == built_at
+    assert len(catalog) == 3
+
+    (tmp_path / "image_test" / image_filename(1001, 2001)).write_bytes(b"jpeg")
+    catalog = ProductCatalog(
+        str(tmp_path / "X_test_update.csv"),
+        str(tmp_path / "image_test"),
+        str(tmp_path / "catalog"),
+    ).load()
+    assert catalog.by_row(1)["image_path"] is not None
+
+
+def test_rebuild_does_not_touch_mapped_index(tmp_path):
+    """Une reconstruction publie un nouveau dossier : un catalogue déjà ouvert reste lisible"""
+    old = make_catalog(tmp_path).load()
+    (tmp_path / "X_test_update.csv").write_text(
+        ",designation,description,productid,imageid\n3,Table,,2003,1003\n", encoding="utf-8"
+    )
+    new = ProductCatalog(
+        str(tmp_path / "X_test_update.csv"),
+        str(tmp_path / "image_test"),
+        str(tmp_path / "catalog"),
+    ).load()
+    assert len(new) == 1 and new.by_row(3)["designation"] == "Table"
+    assert len(old) == 3 and old.by_row(7)["designation"] == "Été à la plage"
+    builds = [p.name for p in (tmp_path / "catalog").iterdir() if p.name.startswith("build-")]
+    assert len(builds) == 1
@@ -0,0 +1,122 @@
+import pandas as pd
+import pytest
+from PIL import Image
+
+from src.data import image_manifest
+from src.data.clean_data import (
+    chunk_tasks,
+    clean_chunks,
+    plan_ingestion,
+    prepare_rows,
+    source_hash,
+)
+
+
+@pytest.fixture(autouse=True)
+def manifest_dir(tmp_path, monkeypatch):
+    """Manifestes d'images indexés dans le dossier temporaire du test"""
+    monkeypatch.setattr(image_manifest, "MANIFEST_DIR", str(tmp_path / "image_manifest"))
+
+
+def make_split(images_dir, n_rows, missing=()):
+    images_dir.mkdir()
+    X = pd.DataFrame(
+        {
+            "id": range(n_rows),
+            "designation": [f"<b>Produit</b> {i}" for i in range(n_rows)],
+            "description": [None] * n_rows,
+            "productid": [2000 + i for i in range(n_rows)],
+            "imageid": [1000 + i for i in range(n_rows)],
+        }
+    )
+    for i in range(n_rows):
+        if i not in missing:
+            Image.new("RGB", (64, 48), (i, 0, 0)).save(
+                images_dir / f"image_{1000 + i}_product_{2000 + i}.jpg"
+            )
+    return X
+
+
+class FakeCollection:
+    """Collection MongoDB minimale : documents indexés par `_id`"""
+
+    def __init__(self, name, docs=()):
+        self.name = name
+        self.docs = {doc.get("_id", doc.get("id")): doc for doc in docs}
+
+    def find_one(self, query):
+        return self.docs.get(query["_id"])
+
+    def find(self, query, projection):
+        return list(self.docs.values())
+
+    def delete_many(self, query):
+        self.docs.clear()
+
+    def create_index(self, key, unique):
+        pass
+
+
+def test_prepare_rows_skips_missing_images(tmp_path):
+    """Les lignes sans image sont écartées et signalées, les labels suivent leur ligne"""
+    X = make_split(tmp_path / "image_train", 5, missing={1})
+    y = pd.DataFrame({"id": range(5), "prdtypecode": [10, 40, 50, 60, 10]})
+    rows, missing = prepare_rows(X, str(tmp_path / "image_train"), y)
+    assert [row[0] for row in rows] == [0, 2, 3, 4]
+    assert [row[4] for row in rows] == [10, 50, 60, 10]
+    assert missing == ["image_1001_product_2001.jpg"]
+
+
+def test_prepare_rows_sees_images_added_since_last_ingest(tmp_path):
+    """Une nouvelle ingestion dans le même processus voit les images ajoutées entre-temps"""
+    X = make_split(tmp_path / "image_train", 3, missing={2})
+    _, missing = prepare_rows(X, str(tmp_path / "image_train"))
+    assert missing == ["image_1002_product_2002.jpg"]
+
+    Image.new("RGB", (8, 8), "red").save(tmp_path / "image_train" / missing[0])
+    rows, missing = prepare_rows(X, str(tmp_path / "image_train"))
+    assert [row[0] for row in rows] == [0, 1, 2]
+    assert missing == []
+
+
+def test_parallel_cleaning_is_deterministic(tmp_path):
+    """Le nettoyage sur un pool de processus donne les mêmes documents, dans le même ordre"""
+    train, _ = prepare_rows(make_split(tmp_path / "image_train", 10), str(tmp_path / "image_train"))
+    test, _ = prepare_rows(make_split(tmp_path / "image_test", 4), str(tmp_path / "image_test"))
+    tasks = chunk_tasks({"train": train, "test": test}, chunk_size=3)
+    assert [split for split, _ in tasks] == ["train", "test", "train", "test", "train", "train"]
+
+    serial = list(clean_chunks(tasks, workers=1))
+    parallel = list(clean_chunks(tasks, workers=2))
+    assert parallel == serial
+    docs = [doc for split, chunk in serial if split == "train" for doc in chunk]
+    assert [doc["id"] for doc in docs] == list(range(10))
+    assert docs[0]["designation"] == "produit 0"
+
+
+def test_plan_ingestion_only_processes_new_and_changed_rows(tmp_path):
+    """Seules les lignes nouvelles, modifiées ou au-delà du watermark sont retraitées"""
+    images_dir = str(tmp_path / "image_train")
+    rows, _ = prepare_rows(make_split(tmp_path / "image_train", 5), images_dir)
+    manifest = image_manifest.get_image_manifest(images_dir)
+    config = {"image_format": "jpeg", "jpeg_draft": True}
+    hashes = [source_hash(row, manifest) for row in rows]
+    collection = FakeCollection(
+        "X_train_cleaned",
+        [{"id": 0, "source_hash": hashes[0]}, {"id": 1, "source_hash": "ancienne"}]
+        + [{"id": 3, "source_hash": hashes[3]}, {"id": 9, "source_hash": "supprimée"}],
+    )
+    state = FakeCollection(
+        "ingestion_state", [{"_id": "X_train_cleaned", "watermark": 2, "config": config}]
+    )
+
+    plan = plan_ingestion(collection, state, rows, config, manifest)
+    assert [row[0] for row in plan["rows"]] == [1, 2, 3, 4]
+    assert (plan["new"], plan["changed"], plan["unchanged"]) == (2, 2, 1)
+    assert plan["hashes"][1] == hashes[1]
+    assert plan["stale"] == [9]
+    assert plan["watermark"] == 4
+
+    # Configuration différente : reconstruction complète
+    plan = plan_ingestion(collection, state, rows, {**config, "image_format": "raw"}, manifest)
+    assert (plan["new"], plan["unchanged"], plan["stale"]) == (5, 0, [])
@@ -0,0 +1,71 @@
+import os
+import random
+
+import pandas as pd
+import pytest
+
+from src.data.clean_text import TextCleaner, clean_text, clean_text_reference, strip_markup
+
+
+RAKUTEN_CSV = os.path.join("data", "raw", "X_train_update.csv")
+
+CASES = [
+    None,
+    float("nan"),
+    "",
+    "Lot de 3 Chaises",
+    "Livre <b>numéro</b> 1 &amp; jeu",
+    "<p>Chaise en bois<br />massif, l&#39;été &eacute;t&#xE9; 50%</p>",
+    '<span style="color:red">Rouge</span><img src="a>b.jpg"/>fin',
+    "Tom & Jerry < 3 ans &amp;lt;b&amp;gt;",
+    "&foo; &eacute &hellip;&#1;&#xFFFE;",
+    "<!-- commentaire --><script>var a = 1 < 2;</script>texte",
+    "<o:p></o:p>Word</p class=x>suite<tag",
+    "<![CDATA[donnée]]> fin &",
+    "Œuvre «complète» – tome 2…",
+]
+
+FRAGMENTS = [
+    "Chaise", " ", "été", "<b>", "</b>", "<p>", "</p>", "<br/>", "<p class=\"x\">", "<a href=x&y=1>",
+    "&amp;", "&eacute;", "&nbsp;", "&#39;", "&#150;", "&foo;", "&", "& ", "<", "< ", "a<b", "<!-- c -->",
+    "<script>1<2</script>", "</ p>", "\n", "ÀÉ", "€", "l'", "&#x27;", "<o:p>", "&amp;lt;", "x&y",
+]  # fmt: skip
+
+
+@pytest.mark.parametrize("text", CASES)
+def test_matches_reference_on_tricky_markup(text):
+    """Balisage simple ou non, le résultat est celui du nettoyage BeautifulSoup"""
+    assert clean_text(text) == clean_text_reference(text)
+
+
+def test_matches_reference_on_random_markup():
+    """Combinaisons aléatoires de fragments HTML : aucune différence avec la référence"""
+    rng = random.Random(0)
+    cleaner = TextCleaner()
+    for _ in range(3000):
+        text = "".join(rng.choice(FRAGMENTS) for _ in range(rng.randint(0, 10)))
+        assert cleaner.clean(text) == clean_text_reference(text), text
+    # Le chemin rapide couvre le balisage courant, BeautifulSoup ne sert qu'en repli
+    assert strip_markup("<p>Chaise<br/> l&#39;été &amp; table</p>") is not None
+    assert cleaner.stats()["fallbacks"] < cleaner.stats()["misses"]
+
+
+@pytest.mark.skipif(not os.path.exists(RAKUTEN_CSV), reason="corpus Rakuten absent")
+def test_matches_reference_on_rakuten_corpus():
+    """Équivalence sur toutes les désignations et descriptions du corpus Rakuten"""
+    df = pd.read_csv(RAKUTEN_CSV)
+    texts = pd.concat([df["designation"], df["description"]], ignore_index=True)
+    cleaned = TextCleaner().clean_series(texts)
+    for text, result in zip(texts, cleaned, strict=True):
+        assert result == clean_text_reference(text), text
+
+
+def test_series_cleans_distinct_values_once():
+    """Une Series n'est nettoyée qu'une fois par valeur distincte, le cache est borné"""
+    cleaner = TextCleaner(max_items=2)
+    texts = pd.Series(["<b>A</b>", None, "<b>A</b>", "B", "C"], index=[5, 6, 7, 8, 9])
+    cleaned = cleaner.clean_series(texts)
+    assert cleaned.tolist() == ["a", "", "a", "b", "c"]
+    assert list(cleaned.index) == [5, 6, 7, 8, 9]
+    assert cleaner.stats() == {"items": 2, "hits": 0, "misses": 3, "fallbacks": 0}
+    assert cleaner.clean("C") == "c" and cleaner.stats()["hits"] == 1
@@ -0,0 +1,151 @@
+import io
+
+import numpy as np
+import torch
+from PIL import Image
+from sklearn.feature_extraction.text import TfidfVectorizer
+from torchvision import models
+
+from src.data.preprocess_data import Preprocessor
+from src.features import build_features
+from src.features.build_features import embedding_namespace
+from src.features.embedding_cache import EmbeddingCache, image_key
+
+
+def vec(value, dim=8):
+    return np.full(dim, value, dtype=np.float32)
+
+
+def jpeg_bytes(color):
+    buffer = io.BytesIO()
+    Image.new("RGB", (224, 224), color).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def test_image_key_depends_on_content():
+    """La clé ne dépend que des octets de l'image"""
+    assert image_key(b"abc") == image_key(b"abc")
+    assert image_key(b"abc") != image_key(b"abd")
+
+
+def test_memory_lru_eviction():
+    """Le LRU mémoire évince l'entrée la moins récemment utilisée"""
+    cache = EmbeddingCache(max_items=2, dim=8)
+    cache.put("a", vec(1))
+    cache.put("b", vec(2))
+    assert cache.get("a") is not None  # "a" devient la plus récente
+    cache.put("c", vec(3))
+
+    assert cache.get("b") is None
+    np.testing.assert_array_equal(cache.get("a"), vec(1))
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["hits"] == 2
+    assert stats["misses"] == 1
+
+
+def test_disk_tier_persists_across_instances(tmp_path):
+    """Le niveau disque survit au processus et alimente le LRU"""
+    cache = EmbeddingCache(max_items=10, disk_dir=str(tmp_path), dim=8)
+    for i in range(5):
+        cache.put(f"k{i}", vec(i))
+
+    reopened = EmbeddingCache(max_items=10, disk_dir=str(tmp_path), dim=8)
+    np.testing.assert_array_equal(reopened.get("k3"), vec(3))
+    assert reopened.get("missing") is None
+    stats = reopened.stats()
+    assert stats["disk_hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["disk_items"] == 5
+
+
+def test_disk_tier_spans_several_blocks(tmp_path):
+    """Les slots débordent proprement sur plusieurs blocs memory-mappés"""
+    cache = EmbeddingCache(max_items=1, disk_dir=str(tmp_path), dim=8)
+    cache.disk.block_rows = 3
+    for i in range(7):
+        cache.put(f"k{i}", vec(i))
+
+    assert len(list(tmp_path.glob("block_*.npy"))) == 3
+    for i in range(7):
+        np.testing.assert_array_equal(cache.get(f"k{i}"), vec(i))
+
+
+def test_writers_sharing_a_directory_see_each_other(tmp_path):
+    """Deux caches sur le même dossier (ex. deux workers) partagent leurs entrées"""
+    first = EmbeddingCache(disk_dir=str(tmp_path), dim=8)
+    second = EmbeddingCache(disk_dir=str(tmp_path), dim=8)
+    first.put("a", vec(1))
+    second.put("b", vec(2))
+
+    np.testing.assert_array_equal(second.get("a"), vec(1))
+    np.testing.assert_array_equal(first.get("b"), vec(2))
+
+
+def test_bulk_gather_across_blocks(tmp_path):
+    """put_many/get_many : écriture groupée puis relecture vectorisée, bloc par bloc"""
+    cache = EmbeddingCache(max_items=1, disk_dir=str(tmp_path), dim=8)
+    cache.disk.block_rows = 3
+    cache.put_many([f"k{i}" for i in range(7)], np.stack([vec(i) for i in range(7)]))
+    cache.put_many(["k2", "k7"], np.stack([vec(-1), vec(7)]))  # k2 déjà présente : ignorée
+
+    reopened = EmbeddingCache(max_items=1, disk_dir=str(tmp_path), dim=8)
+    reopened.disk.block_rows = 3
+    out = np.zeros((6, 8), dtype=np.float32)
+    found = reopened.get_many(["k7", "absente", "k0", "k4"], out, rows=[5, 0, 1, 3])
+    assert found.tolist() == [True, False, True, True]
+    np.testing.assert_array_equal(out[[5, 1, 3]], np.stack([vec(7), vec(0), vec(4)]))
+    assert not out[[0, 2, 4]].any()
+    assert reopened.stats()["disk_hits"] == 3 and reopened.stats()["misses"] == 1
+    assert len(reopened.disk) == 8
+
+
+def test_bulk_access_fills_memory_tier(tmp_path):
+    """Les vecteurs lus sur disque ou écrits en lot passent aussi par le LRU mémoire"""
+    EmbeddingCache(disk_dir=str(tmp_path), dim=8).put_many(["a"], np.stack([vec(1)]))
+    cache = EmbeddingCache(disk_dir=str(tmp_path), dim=8)
+    cache.put_many(["b"], np.stack([vec(2)]))
+    out = np.zeros((2, 8), dtype=np.float32)
+    cache.get_many(["a", "b"], out)
+    cache.get_many(["a", "b"], out)
+    stats = cache.stats()
+    assert stats["memory_items"] == 2
+    assert stats["disk_hits"] == 1 and stats["hits"] == 3
+
+
+def test_repeated_embed_images_served_from_memory(tmp_path):
+    """Un second appel à embed_images sur les mêmes images ne relit pas le disque"""
+    weights = tmp_path / "resnet18-weights.pth"
+    torch.save(models.resnet18(weights=None).state_dict(), weights)
+    cache = EmbeddingCache(disk_dir=str(tmp_path / "cache"), dim=512)
+    preprocessor = Preprocessor(
+        tfidf=TfidfVectorizer().fit(["chaise bois"]),
+        input_model=str(weights),
+        progress=False,
+        backbone="resnet18",
+        image_size=112,
+        embedding_cache=cache,
+    )
+    images = [jpeg_bytes("red"), jpeg_bytes("blue")]
+    first = preprocessor.embed_images(images)
+    second = preprocessor.embed_images(images)
+    np.testing.assert_array_equal(first, second)
+    stats = cache.stats()
+    assert stats["memory_items"] == 2
+    assert stats["hits"] == 2 and stats["disk_hits"] == 0 and stats["misses"] == 2
+
+
+def test_namespace_follows_weights_and_preprocessing_version(tmp_path, monkeypatch):
+    """Des poids ou un prétraitement différents donnent un autre dossier d'embeddings"""
+    weights = tmp_path / "resnet50-weights.pth"
+    weights.write_bytes(b"poids v1")
+    config = {"backbone": "resnet50", "image_size": 224, "image_format": "jpeg"}
+    first = embedding_namespace(config, str(weights))
+    assert first.startswith("resnet50-224")
+    assert embedding_namespace(config, str(weights)) == first
+
+    weights.write_bytes(b"poids v2")
+    second = embedding_namespace(config, str(weights))
+    assert second != first
+    monkeypatch.setattr(build_features, "PREPROCESSING_VERSION", 2)
+    assert embedding_namespace(config, str(weights)) not in (first, second)
@@ -0,0 +1,53 @@
+import os
+
+import numpy as np
+from scipy import sparse
+
+from src.features.feature_matrix import FeatureMatrix, FeatureWriter, convert_npz
+
+
+def make_blocks(seed=0):
+    rng = np.random.default_rng(seed)
+    blocks = []
+    for n in (4, 1, 7, 0):
+        X_text = sparse.random(n, 30, density=0.2, format="csr", random_state=rng)
+        X_img = np.maximum(rng.standard_normal((n, 6), dtype=np.float32), 0)
+        blocks.append((X_text, X_img))
+    return blocks
+
+
+def test_writer_blocks_are_read_back_by_row_and_range(tmp_path):
+    """Les blocs écrits se relisent ligne par ligne ou par plage, texte et image séparés"""
+    blocks = make_blocks()
+    writer = FeatureWriter(str(tmp_path / "X_train"), 12, 30, 6)
+    for X_text, X_img in blocks:
+        writer.write(X_text, X_img)
+    writer.close()
+
+    X = FeatureMatrix(str(tmp_path / "X_train"))
+    expected_text = sparse.vstack([b[0] for b in blocks]).astype(np.float32).toarray()
+    expected_img = np.vstack([b[1] for b in blocks])
+    assert X.shape == (12, 36)
+    assert not any(name.endswith(".bin") for name in os.listdir(tmp_path / "X_train"))
+
+    X_text, X_img = X.rows(3, 9)
+    np.testing.assert_array_equal(X_text.toarray(), expected_text[3:9])
+    np.testing.assert_array_equal(X_img, expected_img[3:9])
+    X_text, X_img = X.row(11)
+    np.testing.assert_array_equal(X_text.toarray(), expected_text[11:])
+    np.testing.assert_array_equal(X_img, expected_img[11:])
+
+
+def test_fused_matrix_matches_hstack_and_legacy_npz(tmp_path):
+    """La matrice fusionnée plage par plage est celle de hstack ; un ancien .npz se convertit"""
+    blocks = make_blocks(seed=1)
+    X_text = sparse.vstack([b[0] for b in blocks]).tocsr()
+    X_img = np.vstack([b[1] for b in blocks])
+    expected = sparse.hstack([X_text, X_img]).tocsr()
+    sparse.save_npz(tmp_path / "X_val.npz", sparse.hstack([X_text, X_img]))
+
+    X = convert_npz(str(tmp_path / "X_val.npz"), str(tmp_path / "X_val"), n_text=30)
+    fused = X.fused(chunk_rows=5)
+    assert fused.shape == expected.shape
+    assert fused.nnz == expected.nnz
+    np.testing.assert_allclose(fused.toarray(), expected.toarray(), rtol=1e-6)
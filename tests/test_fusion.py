@@ -0,0 +1,38 @@
+import numpy as np
+import xgboost as xgb
+from scipy import sparse
+
+from src.predict.fusion import fuse_features, predict_fused
+
+
+def make_features(n_rows, seed=0):
+    rng = np.random.default_rng(seed)
+    X_text = sparse.random(n_rows, 30, density=0.1, format="csr", random_state=seed)
+    X_img = np.maximum(rng.standard_normal((n_rows, 8), dtype=np.float32), 0)
+    X_img[0] = 0  # image manquante : aucune composante non nulle
+    return X_text, X_img
+
+
+def test_fuse_features_matches_hstack():
+    """La matrice fusionnée est identique à hstack, zéros du bloc dense exclus"""
+    X_text, X_img = make_features(6)
+    fused = fuse_features(X_text, X_img)
+    expected = sparse.hstack([X_text, X_img]).tocsr()
+    assert fused.shape == expected.shape
+    assert fused.nnz == expected.nnz
+    assert np.allclose(fused.toarray(), expected.toarray())
+
+
+def test_predict_fused_matches_dmatrix_predictions():
+    """Les probabilités sont celles du chemin hstack + DMatrix utilisé à l'entraînement"""
+    X_text, X_img = make_features(200)
+    y = np.arange(200) % 3
+    X = sparse.hstack([X_text, X_img])
+    bst = xgb.train(
+        {"objective": "multi:softprob", "num_class": 3, "max_depth": 3},
+        xgb.DMatrix(X, label=y),
+        num_boost_round=5,
+    )
+    X_text_new, X_img_new = make_features(4, seed=1)
+    expected = bst.predict(xgb.DMatrix(sparse.hstack([X_text_new, X_img_new])))
+    assert np.allclose(predict_fused(bst, X_text_new, X_img_new), expected, atol=1e-6)
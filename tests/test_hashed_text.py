@@ -0,0 +1,56 @@
+import io
+
+import joblib
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from src.data.preprocess_data import make_text_featurizer, text_feature_config
+from src.features.hashed_text import HashedTfidf, text_columns
+
+
+CORPUS = [
+    "console rétro avec deux manettes",
+    "manettes sans fil pour console",
+    "livre de cuisine italienne",
+    "livre de poche policier",
+    "figurine pop licence manga",
+    "figurine manga édition limitée",
+    "console portable et jeux",
+    "cuisine italienne facile",
+] * 3
+
+
+def test_weights_match_tfidf_vectorizer_without_collisions():
+    """Sans collision de hachage, les poids sont ceux du TfidfVectorizer du projet"""
+    hashed = HashedTfidf(n_bits=20).fit(CORPUS)
+    tfidf = TfidfVectorizer(ngram_range=(1, 2), sublinear_tf=True, min_df=2).fit(CORPUS)
+    docs = CORPUS[:8] + ["console manga inconnue"]
+    X_hashed, X_tfidf = hashed.transform(docs), tfidf.transform(docs)
+    for row_hashed, row_tfidf in zip(X_hashed, X_tfidf, strict=True):
+        np.testing.assert_allclose(np.sort(row_hashed.data), np.sort(row_tfidf.data), rtol=1e-5)
+    assert text_columns(hashed) == 2**20
+
+
+def test_chunks_and_workers_merge_to_the_same_idf():
+    """Les DF de blocs (ou de processus) séparés s'additionnent en l'IDF d'une seule passe"""
+    whole = HashedTfidf(n_bits=12).fit(CORPUS)
+    left = HashedTfidf(n_bits=12).partial_fit(CORPUS[:5])
+    right = HashedTfidf(n_bits=12).partial_fit(CORPUS[5:])
+    merged = left.merge(right)
+    parallel = HashedTfidf(n_bits=12, workers=2, chunk_size=4).fit(iter(CORPUS))
+    for other in (merged, parallel):
+        assert other.n_docs_ == len(CORPUS)
+        np.testing.assert_array_equal(other.idf_, whole.idf_)
+
+
+def test_pickled_featurizer_transforms_like_the_original():
+    """L'artefact rechargé transforme sans vocabulaire et s'annonce dans feature_config"""
+    featurizer = make_text_featurizer("hashed").fit(CORPUS)
+    buffer = io.BytesIO()
+    joblib.dump(featurizer, buffer)
+    loaded = joblib.load(io.BytesIO(buffer.getvalue()))
+    assert not hasattr(loaded, "vocabulary_")
+    expected = featurizer.transform(CORPUS[:3]).toarray()
+    np.testing.assert_array_equal(loaded.transform(CORPUS[:3]).toarray(), expected)
+    assert text_feature_config(loaded) == {"text_featurizer": "hashed", "text_hash_bits": 18}
+    assert text_feature_config(make_text_featurizer("tfidf")) == {"text_featurizer": "tfidf"}
@@ -0,0 +1,122 @@
+import io
+import math
+
+import numpy as np
+import pandas as pd
+import torch
+from PIL import Image
+from sklearn.feature_extraction.text import TfidfVectorizer
+from torchvision import models
+
+from src.data import image_manifest
+from src.data.clean_data import (
+    clean_one_row,
+    decode_raw_image,
+    encode_raw_image,
+    is_raw_image,
+    normalize_image,
+)
+from src.data.preprocess_data import Preprocessor
+from src.features import image_formats
+from src.features.build_features import feature_tag
+
+
+def noise_image():
+    pixels = np.random.default_rng(0).integers(0, 256, (300, 400, 3), dtype=np.uint8)
+    return Image.fromarray(pixels)
+
+
+def test_raw_blob_round_trip():
+    """Le blob "raw" restitue exactement les pixels redimensionnés, sans copie"""
+    image = noise_image()
+    doc = clean_one_row("Chaise", "", image, image_format="raw")
+    assert is_raw_image(doc["image_binary"])
+    assert not is_raw_image(clean_one_row("Chaise", "", image)["image_binary"])
+
+    pixels = decode_raw_image(doc["image_binary"])
+    assert pixels.shape == (224, 224, 3) and pixels.dtype == np.uint8
+    assert not pixels.flags.owndata
+    np.testing.assert_array_equal(pixels, normalize_image(image, "raw"))
+    assert feature_tag({"backbone": "resnet50", "image_size": 224, "image_format": "raw"}) == (
+        "resnet50-224-raw"
+    )
+
+
+def test_raw_and_decoded_images_give_the_same_tensor(tmp_path):
+    """Tableau, blob "raw" et image sans perte décodée par PIL donnent le même tenseur"""
+    weights = tmp_path / "resnet18-weights.pth"
+    torch.save(models.resnet18(weights=None).state_dict(), weights)
+    preprocessor = Preprocessor(
+        tfidf=TfidfVectorizer().fit(["chaise"]),
+        input_model=str(weights),
+        progress=False,
+        backbone="resnet18",
+    )
+    image = noise_image()
+    pixels = normalize_image(image, "raw")
+    png = io.BytesIO()
+    Image.fromarray(pixels).save(png, format="PNG")
+
+    expected = preprocessor.load_tensor(png.getvalue())
+    from_blob = preprocessor.load_tensor(clean_one_row("", "", image, "raw")["image_binary"])
+    torch.testing.assert_close(preprocessor.load_tensor(pixels), expected)
+    torch.testing.assert_close(from_blob, expected)
+
+    X_img = preprocessor.embed_images([pixels, clean_one_row("", "", image)["image_binary"]])
+    assert X_img.shape == (2, 512)
+
+
+def test_jpeg_sources_are_decoded_at_reduced_size():
+    """Une source JPEG est décodée à l'échelle réduite ; la taille d'origine est conservée"""
+    buffer = io.BytesIO()
+    Image.new("RGB", (1000, 800), "red").save(buffer, format="JPEG")
+
+    image = Image.open(io.BytesIO(buffer.getvalue()))
+    doc = clean_one_row("Chaise", "", image, image_format="raw")
+    assert image.size == (500, 400)
+    assert (doc["image_width"], doc["image_height"]) == (1000, 800)
+    full = normalize_image(Image.open(io.BytesIO(buffer.getvalue())), "raw", draft=False)
+    assert np.abs(decode_raw_image(doc["image_binary"]).astype(int) - full).max() <= 2
+
+
+def make_raw_dir(raw_dir, n_rows):
+    """CSV d'entraînement et images JPEG sources (800x600) au format du dataset Rakuten"""
+    images_dir = raw_dir / "images" / "images" / "image_train"
+    images_dir.mkdir(parents=True)
+    rng = np.random.default_rng(0)
+    for i in range(n_rows):
+        pixels = rng.integers(0, 256, (600, 800, 3), dtype=np.uint8)
+        Image.fromarray(pixels).save(images_dir / f"image_{1000 + i}_product_{2000 + i}.jpg")
+    pd.DataFrame(
+        {
+            "designation": [f"Produit {i}" for i in range(n_rows)],
+            "description": [""] * n_rows,
+            "productid": [2000 + i for i in range(n_rows)],
+            "imageid": [1000 + i for i in range(n_rows)],
+        }
+    ).to_csv(raw_dir / "X_train_update.csv")
+    pd.DataFrame({"prdtypecode": [10] * n_rows}).to_csv(raw_dir / "Y_train_CVw08PX.csv")
+
+
+def test_psnr_and_lossless_raw_round_trip():
+    """PSNR infini après l'aller-retour par le blob "raw", fini face au JPEG"""
+    image = noise_image()
+    pixels = normalize_image(image, "raw")
+    jpeg = np.asarray(Image.open(io.BytesIO(normalize_image(image))))
+    assert math.isfinite(image_formats.psnr(jpeg, pixels))
+    assert image_formats.psnr(decode_raw_image(encode_raw_image(pixels)), pixels) == math.inf
+
+
+def test_jpeg_draft_benchmark_on_fixture_images(tmp_path, monkeypatch):
+    """Le décodage draft lit moins de pixels que la pleine résolution, à PSNR fini"""
+    make_raw_dir(tmp_path / "raw", 3)
+    monkeypatch.setattr(image_formats, "RAW_DIR", str(tmp_path / "raw"))
+    monkeypatch.setattr(image_formats, "IMG_DIR", str(tmp_path / "raw" / "images" / "images"))
+    monkeypatch.setattr(image_manifest, "MANIFEST_DIR", str(tmp_path / "image_manifest"))
+
+    assert len(image_formats.load_labelled_sample(10)) == 3
+    report = image_formats.benchmark_jpeg_draft(3, output=str(tmp_path / "draft.json"))
+    assert report["draft"]["decoded_mb_max"] <= report["full"]["decoded_mb_max"]
+    assert report["draft"]["decoded_mb_mean"] < report["full"]["decoded_mb_mean"]
+    assert math.isfinite(report["comparison"]["pixel_psnr_db"])
+    assert (tmp_path / "draft.json").exists()
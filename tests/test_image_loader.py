@@ -0,0 +1,48 @@
+import torch
+
+from src.features.image_loader import (
+    AdaptiveBatchSizer,
+    FixedBatchSizer,
+    ImageBatchLoader,
+    make_batch_sizer,
+)
+
+
+def test_adaptive_batch_size_climbs_while_throughput_improves():
+    """La taille double tant que le débit progresse, puis revient à la meilleure taille"""
+    sizer = AdaptiveBatchSizer(initial=8, maximum=128)
+    # Débit (images/s) par taille de lot : meilleur à 32
+    throughput = {8: 100.0, 16: 180.0, 32: 250.0, 64: 240.0}
+    sizer.record(8, 1.0)  # premier lot : chauffe, non mesuré
+    assert sizer.batch_size == 8
+    while not sizer.settled:
+        size = sizer.batch_size
+        sizer.record(size, size / throughput[size])
+    assert sizer.batch_size == 32
+    assert [size for size, _ in sizer.history] == [8, 16, 32, 64]
+
+
+def test_adaptive_batch_size_respects_memory_ceiling():
+    """Le plafond mémoire borne la taille des lots"""
+    assert AdaptiveBatchSizer(initial=32, maximum=4).batch_size == 4
+    assert make_batch_sizer("auto", 224, torch.device("cpu")).batch_size >= 1
+    assert isinstance(make_batch_sizer(16, 224, torch.device("cpu")), FixedBatchSizer)
+
+
+def test_loader_keeps_order_and_follows_batch_size():
+    """Les lots décodés sur le pool arrivent dans l'ordre, à la taille demandée"""
+    items = list(range(23))
+
+    def load_tensor(item):
+        return torch.full((3, 2, 2), float(item))
+
+    for workers in (0, 3):
+        loader = ImageBatchLoader(load_tensor, torch.device("cpu"), workers=workers, prefetch=2)
+        sizer = FixedBatchSizer(5)
+        batches = list(loader.batches(items, sizer))
+        loader.close()
+        assert [len(positions) for positions, _ in batches] == [5, 5, 5, 5, 3]
+        positions = [p for batch, _ in batches for p in batch]
+        assert positions == items
+        values = torch.cat([xb[:, 0, 0, 0] for _, xb in batches])
+        assert values.tolist() == [float(i) for i in items]
@@ -0,0 +1,77 @@
+import os
+import shutil
+
+import numpy as np
+from PIL import Image
+
+from src.data.image_manifest import ImageManifest
+
+
+def make_images(images_dir):
+    images_dir.mkdir()
+    for i in range(4):
+        Image.new("RGB", (40 + i, 30), (i * 50, 0, 0)).save(
+            images_dir / f"image_{i}_product_{i}.jpg"
+        )
+    # Deux copies octet pour octet de l'image 2
+    shutil.copy(images_dir / "image_2_product_2.jpg", images_dir / "image_1_product_9.jpg")
+    shutil.copy(images_dir / "image_2_product_2.jpg", images_dir / "image_7_product_7.jpg")
+    (images_dir / "notes.txt").write_text("pas une image")
+
+
+def test_manifest_records_files_and_duplicates(tmp_path):
+    """Chaque image est indexée avec ses dimensions ; les doublons pointent vers un fichier canonique"""
+    make_images(tmp_path / "images")
+    manifest = ImageManifest(str(tmp_path / "images"), str(tmp_path / "index")).load()
+
+    assert len(manifest) == 6 and "notes.txt" not in manifest
+    info = manifest.info("image_3_product_3.jpg")
+    assert (info["width"], info["height"]) == (43, 30)
+    assert info["size"] == os.path.getsize(tmp_path / "images" / "image_3_product_3.jpg")
+    assert manifest.path("image_5_product_5.jpg") is None
+
+    canonical = str(tmp_path / "images" / "image_1_product_9.jpg")
+    assert manifest.canonical_path("image_7_product_7.jpg") == canonical
+    assert manifest.canonical_path("image_2_product_2.jpg") == canonical
+    assert manifest.duplicates() == {
+        "image_1_product_9.jpg": ["image_2_product_2.jpg", "image_7_product_7.jpg"]
+    }
+    stats = manifest.stats()
+    assert (stats["files"], stats["unique"], stats["duplicates"]) == (6, 4, 2)
+
+
+def test_manifest_only_rereads_changed_files(tmp_path):
+    """Un nouveau passage ne relit que les fichiers ajoutés ou modifiés"""
+    images_dir = tmp_path / "images"
+    make_images(images_dir)
+    first = ImageManifest(str(images_dir), str(tmp_path / "index")).load()
+    digests = np.array(first.columns["digest"])
+
+    again = ImageManifest(str(images_dir), str(tmp_path / "index")).load()
+    assert again.rescanned == 0
+    assert (np.array(again.columns["digest"]) == digests).all()
+
+    Image.new("RGB", (8, 8)).save(images_dir / "image_7_product_7.jpg")
+    Image.new("RGB", (9, 9)).save(images_dir / "image_8_product_8.jpg")
+    (images_dir / "image_0_product_0.jpg").unlink()
+    updated = ImageManifest(str(images_dir), str(tmp_path / "index")).load()
+    assert updated.rescanned == 2
+    assert "image_0_product_0.jpg" not in updated
+    assert updated.canonical_path("image_7_product_7.jpg").endswith("image_7_product_7.jpg")
+    assert updated.info("image_8_product_8.jpg")["width"] == 9
+
+
+def test_update_does_not_touch_mapped_index(tmp_path):
+    """Une mise à jour publie un nouvel index sans modifier celui déjà memory-mappé"""
+    images_dir = tmp_path / "images"
+    make_images(images_dir)
+    mapped = ImageManifest(str(images_dir), str(tmp_path / "index")).load()
+    names = mapped.columns["name"].tolist()
+
+    Image.new("RGB", (9, 9)).save(images_dir / "image_8_product_8.jpg")
+    updated = ImageManifest(str(images_dir), str(tmp_path / "index")).load()
+    assert "image_8_product_8.jpg" in updated
+    assert mapped.columns["name"].tolist() == names
+    assert mapped.columns["name"].filename != updated.columns["name"].filename
+    builds = [entry for entry in os.listdir(tmp_path / "index") if entry.startswith("build-")]
+    assert len(builds) == 1
@@ -0,0 +1,75 @@
+import asyncio
+import json
+
+import httpx
+from fastapi import FastAPI, HTTPException, Request
+
+from src.api.loadtest import LoadTest, compare_reports, load_requests
+
+
+def make_app():
+    app = FastAPI()
+
+    @app.post("/login")
+    def login():
+        return {"token": "abc"}
+
+    @app.post("/predict")
+    def predict(request: Request, productid: int):
+        if request.headers.get("Authorization") != "Bearer abc":
+            raise HTTPException(status_code=401)
+        return {"productid": productid}
+
+    return app
+
+
+def write_requests(tmp_path):
+    path = tmp_path / "requests.jsonl"
+    lines = [
+        {
+            "name": "predict",
+            "method": "POST",
+            "path": "/predict",
+            "params": {"productid": 1},
+            "auth": True,
+        },
+        {"method": "GET", "path": "/absent"},
+    ]
+    path.write_text("\n".join(json.dumps(line) for line in lines) + "\n")
+    return str(path)
+
+
+async def run(requests, **kwargs):
+    transport = httpx.ASGITransport(app=make_app())
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        return await LoadTest(requests, client, **kwargs).run(20)
+
+
+def test_closed_and_open_loop_reports(tmp_path):
+    """Les deux modes rejouent toutes les requêtes et ventilent latences et codes HTTP"""
+    requests = load_requests(write_requests(tmp_path))
+    for kwargs in ({"concurrency": 4}, {"concurrency": 2, "rate": 500, "poisson": True}):
+        report = asyncio.run(run(requests, **kwargs))
+        assert report["requests"] == 20
+        assert report["ok"] == 10
+        assert report["status_codes"] == {"200": 10, "404": 10}
+        assert report["error_rate"] == 0.5
+        assert set(report["by_name"]) == {"predict"}
+        latency = report["latency_ms"]
+        assert latency["p50"] <= latency["p95"] <= latency["p99"] <= latency["max"]
+
+
+def test_compare_flags_regressions():
+    """Une baisse de débit ou une hausse de p95 au-delà du seuil est une régression"""
+    baseline = {
+        "throughput_rps": 100.0,
+        "error_rate": 0.0,
+        "latency_ms": {"p50": 10.0, "p95": 20.0, "p99": 30.0},
+    }
+    same = compare_reports(baseline, baseline)
+    assert same["regressions"] == []
+
+    slower = dict(baseline, throughput_rps=95.0, latency_ms={"p50": 10.0, "p95": 25.0, "p99": 31.0})
+    assert compare_reports(baseline, slower, max_regression=0.10)["regressions"] == [
+        "latency_p95_ms"
+    ]
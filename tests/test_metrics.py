@@ -0,0 +1,51 @@
+from fastapi import APIRouter, FastAPI
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+
+from src.api.metrics import (
+    collect_stages,
+    instrument,
+    metrics_response,
+    observe_stages,
+    stage,
+)
+
+
+def stage_count(name):
+    return REGISTRY.get_sample_value("rakuten_stage_seconds_count", {"stage": name}) or 0
+
+
+def test_stage_records_histogram_and_trace():
+    """Une étape est enregistrée dans l'histogramme et dans la trace du thread"""
+    before = stage_count("test_stage")
+    with collect_stages() as timings, stage("test_stage"):
+        pass
+    after = stage_count("test_stage")
+    assert after == before + 1
+    assert set(timings) == {"test_stage"}
+
+
+def test_observe_stages_from_worker():
+    """Les durées mesurées dans un worker sont enregistrées côté API"""
+    before = stage_count("worker_stage")
+    observe_stages({"worker_stage": 0.01})
+    after = stage_count("worker_stage")
+    assert after == before + 1
+
+
+def test_metrics_endpoint_exposes_requests():
+    """/metrics expose les durées de requêtes par route connue"""
+    app = FastAPI()
+    router = APIRouter()
+    router.add_api_route("/ping", lambda: {"ok": True}, methods=["GET"])
+    router.add_api_route("/metrics", metrics_response, methods=["GET"])
+    app.include_router(router)
+    instrument(app, router)
+
+    with TestClient(app) as client:
+        client.get("/ping")
+        client.get("/inconnu")
+        body = client.get("/metrics").text
+    assert 'rakuten_request_seconds_count{endpoint="/ping",status="200"}' in body
+    assert 'endpoint="other",status="404"' in body
+    assert 'endpoint="/metrics"' not in body
@@ -0,0 +1,184 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from src.predict.result_cache import PredictionCache, prediction_key
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_prediction_key_uses_image_content_and_model_version():
+    """La clé dépend du texte, du contenu de l'image et de la version du modèle"""
+    key = prediction_key("a", "b", b"img", "v1")
+    assert key == prediction_key("a", "b", b"img", "v1")
+    assert key != prediction_key("a", "b", b"img2", "v1")
+    assert key != prediction_key("a", "b", b"img", "v2")
+
+
+def test_hit_until_ttl_expires():
+    """Une entrée est servie depuis le cache jusqu'à l'expiration de son TTL"""
+    clock = FakeClock()
+    cache = PredictionCache(max_items=10, ttl_s=60, clock=clock)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return 42
+
+    key = ("a", "b", "h", "v1")
+    assert cache.get_or_compute(key, compute) == 42
+    assert cache.get_or_compute(key, compute) == 42
+    assert len(calls) == 1
+
+    clock.now = 61
+    assert cache.get_or_compute(key, compute) == 42
+    assert len(calls) == 2
+    assert cache.stats()["hits"] == 1
+
+
+def test_size_is_bounded():
+    """Le cache ne dépasse jamais max_items entrées"""
+    cache = PredictionCache(max_items=2, ttl_s=60)
+    for i in range(5):
+        cache.get_or_compute((str(i), "", "h", "v1"), lambda i=i: i)
+    assert cache.stats()["items"] == 2
+
+
+def test_new_model_version_invalidates_entries():
+    """Une nouvelle version de xgb_fusion.json vide le cache"""
+    cache = PredictionCache(max_items=10, ttl_s=60)
+    cache.get_or_compute(("a", "b", "h", "v1"), lambda: 1)
+    assert cache.get_or_compute(("a", "b", "h", "v2"), lambda: 2) == 2
+    stats = cache.stats()
+    assert stats["invalidations"] == 1
+    assert stats["items"] == 1
+    assert stats["model_version"] == "v2"
+
+
+def test_model_version_only_moves_forward():
+    """Une requête encore sur l'ancienne version ne vide pas le cache et n'y écrit pas"""
+    cache = PredictionCache(max_items=10, ttl_s=60)
+    cache.get_or_compute(("a", "b", "h", "v1"), lambda: 1)
+    cache.get_or_compute(("a", "b", "h", "v2"), lambda: 2)
+    assert cache.get_or_compute(("c", "d", "h", "v1"), lambda: 3) == 3
+    assert cache.get_or_compute(("a", "b", "h", "v2"), lambda: 0) == 2
+    stats = cache.stats()
+    assert stats["invalidations"] == 1
+    assert stats["items"] == 1
+    assert stats["model_version"] == "v2"
+
+
+def test_errors_are_not_cached():
+    """Une erreur de calcul est propagée et n'est pas mise en cache"""
+    cache = PredictionCache(max_items=10, ttl_s=60)
+    key = ("a", "b", "h", "v1")
+
+    def fail():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        cache.get_or_compute(key, fail)
+    assert cache.get_or_compute(key, lambda: 7) == 7
+
+
+def test_concurrent_identical_requests_are_coalesced():
+    """Des requêtes identiques simultanées ne calculent qu'une seule fois"""
+    cache = PredictionCache(max_items=10, ttl_s=60)
+    key = ("a", "b", "h", "v1")
+    calls = []
+    results = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.2)
+        return 5
+
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.get_or_compute(key, compute)))
+        for _ in range(6)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert results == [5] * 6
+    assert len(calls) == 1
+    assert cache.stats()["coalesced"] == 5
+
+
+def test_async_requests_are_coalesced():
+    """La variante async fusionne aussi les calculs en cours"""
+    cache = PredictionCache(max_items=10, ttl_s=60)
+    key = ("a", "b", "h", "v1")
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return 9
+
+    async def main():
+        return await asyncio.gather(*[cache.aget_or_compute(key, compute) for _ in range(4)])
+
+    assert asyncio.run(main()) == [9, 9, 9, 9]
+    assert len(calls) == 1
+
+
+def test_cancelled_owner_releases_the_key():
+    """Une requête annulée en plein calcul ne bloque pas les suivantes"""
+    cache = PredictionCache(max_items=10, ttl_s=60)
+    key = ("a", "b", "h", "v1")
+
+    async def slow():
+        await asyncio.sleep(10)
+        return 1
+
+    async def fast():
+        return 2
+
+    async def main():
+        owner = asyncio.create_task(cache.aget_or_compute(key, slow))
+        await asyncio.sleep(0.01)
+        owner.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await owner
+        return await asyncio.wait_for(cache.aget_or_compute(key, fast), timeout=1)
+
+    assert asyncio.run(main()) == 2
+    assert cache.stats()["misses"] == 2
+
+
+def test_waiters_recompute_once_when_the_owner_is_cancelled():
+    """L'annulation du calcul en cours n'est pas propagée : un seul appelant en attente le reprend"""
+    cache = PredictionCache(max_items=10, ttl_s=60)
+    key = ("a", "b", "h", "v1")
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return 7
+
+    async def main():
+        owner = asyncio.create_task(cache.aget_or_compute(key, compute))
+        await asyncio.sleep(0.01)
+        waiters = [asyncio.create_task(cache.aget_or_compute(key, compute)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        owner.cancel()
+        results = await asyncio.wait_for(asyncio.gather(*waiters), timeout=1)
+        with pytest.raises(asyncio.CancelledError):
+            await owner
+        return results
+
+    assert asyncio.run(main()) == [7, 7, 7]
+    assert len(calls) == 2
+    assert cache.get_or_compute(key, lambda: 0) == 7
@@ -0,0 +1,16 @@
+import os
+
+from src.predict.runtime import artifact_paths, model_version
+
+
+def test_model_version_follows_every_artifact(tmp_path):
+    """Remplacer l'encodeur seul change la version ; sans modèle, la version vaut absent"""
+    assert model_version(str(tmp_path), str(tmp_path)) == "absent"
+    for path in artifact_paths(str(tmp_path), str(tmp_path)):
+        with open(path, "w") as f:
+            f.write("v1")
+    before = model_version(str(tmp_path), str(tmp_path))
+    encoder_path = os.path.join(tmp_path, "label_encoder.joblib")
+    with open(encoder_path, "w") as f:
+        f.write("v2 plus long")
+    assert model_version(str(tmp_path), str(tmp_path)) != before
@@ -0,0 +1,75 @@
+import io
+
+import joblib
+import numpy as np
+import torch
+from PIL import Image
+from torchvision import models
+
+from src.data.preprocess_data import preprocess_data_streaming, stream_documents
+from src.features.feature_matrix import FeatureMatrix
+
+
+class FakeCollection:
+    """Collection MongoDB minimale : projection et lecture par lots"""
+
+    def __init__(self, docs):
+        self.docs = docs
+
+    def find(self, query, projection, batch_size=None):
+        for doc in self.docs:
+            yield {key: doc[key] for key in projection if projection[key] and key in doc}
+
+    def find_one(self, query, projection):
+        return next(self.find(query, projection), None)
+
+
+def jpeg_bytes(color):
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 64), color).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def test_stream_documents_yields_fixed_size_batches():
+    """Le curseur est découpé en blocs de taille fixe, le dernier bloc étant partiel"""
+    collection = FakeCollection([{"id": i} for i in range(7)])
+    batches = list(stream_documents(collection, {"id": 1}, batch_size=3))
+    assert [len(batch) for batch in batches] == [3, 3, 1]
+
+
+def test_streaming_preprocessing_writes_aligned_features(tmp_path):
+    """Features et labels écrits par blocs restent alignés ligne à ligne"""
+    weights = tmp_path / "resnet18-weights.pth"
+    torch.save(models.resnet18(weights=None).state_dict(), weights)
+    docs = [
+        {
+            "id": i,
+            "designation": f"produit categorie{code}",
+            "description": "" if i % 3 else None,
+            "prdtypecode": code,
+            "image_binary": jpeg_bytes((code % 255, 0, 0)),
+        }
+        for i, code in enumerate([10, 40, 50, 60] * 5)
+    ]
+    config = preprocess_data_streaming(
+        FakeCollection(docs), str(tmp_path), str(weights), "resnet18", 64, batch_size=3
+    )
+    assert config == {
+        "backbone": "resnet18",
+        "image_size": 64,
+        "image_format": "jpeg",
+        "text_featurizer": "tfidf",
+    }
+
+    tfidf = joblib.load(tmp_path / "tfidf_vectorizer.joblib")
+    y = {split: np.load(tmp_path / f"y_{split}.npy") for split in ("train", "val")}
+    assert sorted(np.concatenate(list(y.values())).tolist()) == sorted(
+        d["prdtypecode"] for d in docs
+    )
+    for split in ("train", "val"):
+        X = FeatureMatrix(str(tmp_path / f"X_{split}"))
+        assert X.shape == (len(y[split]), len(tfidf.vocabulary_) + 512)
+        X_text, X_img = X.rows(0, len(X))
+        assert X_img.shape == (len(y[split]), 512)
+        for row, code in zip(X_text, y[split], strict=True):
+            assert row[0, tfidf.vocabulary_[f"categorie{code}"]] > 0
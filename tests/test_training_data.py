@@ -0,0 +1,59 @@
+import os
+
+import numpy as np
+import xgboost as xgb
+from scipy import sparse
+
+from src.features.feature_matrix import FeatureMatrix, write_features
+from src.train.training_data import build_training_matrices, cache_fused_chunks
+
+
+def make_split(data_dir, split, n_rows, seed):
+    """Features dont la classe se lit dans une colonne texte et une composante d'image"""
+    rng = np.random.default_rng(seed)
+    y = rng.integers(0, 3, n_rows)
+    X_text = sparse.random(n_rows, 40, density=0.1, format="lil", random_state=seed)
+    X_text[:, 0] = (y == 1).astype(float)[:, None]
+    X_img = np.maximum(rng.standard_normal((n_rows, 8), dtype=np.float32), 0)
+    X_img[:, 0] = y * 2.0
+    write_features(os.path.join(data_dir, f"X_{split}"), X_text, X_img)
+    return y
+
+
+def test_iterator_modes_train_the_same_model_as_dmatrix(tmp_path):
+    """QuantileDMatrix et mémoire externe, nourris par plages, donnent les prédictions du DMatrix"""
+    y_train = make_split(tmp_path, "train", 300, seed=0)
+    y_val = make_split(tmp_path, "val", 80, seed=1)
+    params = {"objective": "multi:softprob", "num_class": 3, "tree_method": "hist", "max_depth": 3}
+
+    predictions = {}
+    for mode in ("dmatrix", "quantile", "external"):
+        dtrain, dval, chosen = build_training_matrices(
+            y_train, y_val, str(tmp_path), mode, chunk_rows=64, cache_dir=str(tmp_path / "cache")
+        )
+        assert chosen == mode
+        assert (dtrain.num_row(), dtrain.num_col()) == (300, 48)
+        bst = xgb.train(params, dtrain, 5, evals=[(dval, "val")], verbose_eval=False)
+        predictions[mode] = bst.predict(dval)
+        assert (predictions[mode].argmax(axis=1) == y_val).mean() > 0.9
+
+    np.testing.assert_allclose(predictions["quantile"], predictions["dmatrix"], atol=1e-5)
+    np.testing.assert_allclose(predictions["external"], predictions["dmatrix"], atol=1e-5)
+
+
+def test_fused_chunk_cache_is_reused_until_features_change(tmp_path):
+    """Le cache des plages fusionnées est relu tel quel, puis remplacé si les features changent"""
+    make_split(tmp_path, "train", 100, seed=0)
+    features = FeatureMatrix(str(tmp_path / "X_train"))
+    first = cache_fused_chunks(features, 32, str(tmp_path / "cache"))
+    assert len([n for n in os.listdir(first) if n.endswith("_data.npy")]) == 4
+    meta_mtime = os.stat(os.path.join(first, "meta.json")).st_mtime_ns
+    assert cache_fused_chunks(features, 32, str(tmp_path / "cache")) == first
+    assert os.stat(os.path.join(first, "meta.json")).st_mtime_ns == meta_mtime
+
+    make_split(tmp_path, "train", 90, seed=2)
+    second = cache_fused_chunks(
+        FeatureMatrix(str(tmp_path / "X_train")), 32, str(tmp_path / "cache")
+    )
+    assert second != first
+    assert os.listdir(tmp_path / "cache") == [os.path.basename(second)]
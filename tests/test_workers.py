@@ -0,0 +1,61 @@
+import asyncio
+import time
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from src.predict.workers import InferencePool, PoolBroken
+
+
+class BrokenExecutor:
+    """Executor dont un worker est mort : toute soumission échoue"""
+
+    def __init__(self):
+        self.shut_down = False
+
+    def submit(self, *args):
+        raise BrokenProcessPool("worker mort")
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.shut_down = True
+
+
+def test_broken_pool_is_rebuilt(monkeypatch):
+    """Un worker mort donne PoolBroken, le pool repasse non prêt puis est reconstruit"""
+    pool = InferencePool(n_workers=1, max_pending=2)
+    broken = BrokenExecutor()
+    pool.executor = broken
+    pool._ready.set()
+    restarted = []
+
+    def fake_start():
+        assert not pool.ready
+        pool.executor = "nouveau"
+        pool._ready.set()
+        restarted.append(1)
+        return pool
+
+    monkeypatch.setattr(pool, "start", fake_start)
+
+    async def main():
+        with pytest.raises(PoolBroken):
+            await pool.predict("chaise", "", b"")
+
+    asyncio.run(main())
+    for _ in range(200):
+        if restarted:
+            break
+        time.sleep(0.01)
+    assert pool.ready and pool.executor == "nouveau"
+    assert broken.shut_down and restarted == [1]
+    pool.restart(broken)  # second signalement du même executor : ignoré
+    assert restarted == [1]
+
+
+def test_pool_version_ignores_workers_not_yet_reloaded():
+    """Un worker encore sur l'ancien modèle ne fait pas reculer la version servie"""
+    pool = InferencePool(n_workers=2, max_pending=2)
+    assert pool.observe_version("v1")
+    assert pool.observe_version("v2")
+    assert not pool.observe_version("v1")
+    assert pool.model_version == "v2"